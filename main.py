@@ -1,11 +1,15 @@
 import os.path  # 导入os.path模块，用于处理文件路径
 import shutil  # 导入shutil模块，用于高级文件操作，如复制和删除文件夹
+from typing import Optional  # 导入类型提示工具
 
 import click  # 导入click库，这是一个用于创建命令行界面的库
 
 from metrics import EvaContext, ClangParser, FunctionMetric, ClazzMetric, ModuleMetric, RepoV2Metric, \
-    PyParser  # 导入自定义的度量分析模块
+    PyParser, FunctionTemplate, FunctionDedup, IncrementalUpdate, StagePipeline  # 导入自定义的度量分析模块
+from utils import ResponseCache, AdaptiveLimiter, RetryPolicy, HedgePolicy, EndpointPool, TokenUsage, ContextPacker, \
+    llm_stage  # 导入LLM调用的统计工具
 from utils.common import LangEnum  # 导入语言枚举类，用于支持不同的编程语言
+from utils.settings import ProjectSettings  # 导入项目设置
 
 
 def response_with_gitbook(doc_path: str):
@@ -37,7 +41,7 @@ def response_with_gitbook(doc_path: str):
         root = root[len(doc_path) + 1:]  # 获取相对路径
         if len(root) > 0:  # 如果有子目录
             summary += f'{(len(root.split(os.sep)) - 1) * "  "}* [{root}]\n'  # 添加目录条目，根据层级缩进
-        for f in sorted(files, key=summary_sort):  # 对文件排序并遍历
+        for f in sorted(filter(lambda x: x.endswith('.md'), files), key=summary_sort):  # 对markdown文件排序并遍历，跳过章节索引等文件
             if len(root) > 0:  # 如果在子目录中
                 summary += f'{len(root.split(os.sep)) * "  "}* [{f[:-3]}]({os.path.join(root, f)}\n'  # 添加文件条目，带缩进
             else:  # 如果在根目录中
@@ -55,13 +59,17 @@ def response_with_gitbook(doc_path: str):
 @click.option('--lang', default=LangEnum.cpp.cli,
               type=click.Choice([LangEnum.python.cli, LangEnum.cpp.cli], case_sensitive=False),
               help='编程语言')  # 添加语言选项，支持Python和C++
-def main(path, lang):
+@click.option('--since', default=None, help='增量更新：上次生成文档时的git版本，只重新生成受变更影响的文档')
+@click.option('--until', default=None, help='增量更新：本次生成文档的git版本，默认为工作区')
+def main(path, lang, since, until):
     """
     主函数，分析指定路径下的代码并生成文档
     
     Args:
         path: 代码仓库路径
         lang: 编程语言
+        since: 增量更新的基准版本，为None时不做增量更新
+        until: 增量更新的目标版本，为None时与工作区比较
     """
     path = click.format_filename(path).strip(os.sep)  # 格式化路径，去除末尾的分隔符
     basename = os.path.basename(path)  # 获取路径的基本名称（最后一部分）
@@ -70,8 +78,8 @@ def main(path, lang):
     # 初始化评估上下文，设置文档路径、资源路径和输出路径
     ctx = EvaContext(doc_path=os.path.join('docs', basename), resource_path=os.path.join('resource', basename),
                      output_path=os.path.join('output', basename), lang=lang)
-    # 开始运行评估
-    eva(ctx, LangEnum.from_cli(lang))
+    # 开始运行评估，指定基准版本时先使受变更影响的文档失效
+    eva(ctx, LangEnum.from_cli(lang), IncrementalUpdate(path, since, until) if since else None)
     # 生成gitbook输出格式
     response_with_gitbook(os.path.join('docs', basename))
     # 清理工作路径，删除临时文件
@@ -79,13 +87,14 @@ def main(path, lang):
     shutil.rmtree(os.path.join('output', basename))
 
 
-def eva(ctx: EvaContext, lang: LangEnum):
+def eva(ctx: EvaContext, lang: LangEnum, update: Optional[IncrementalUpdate] = None):
     """
     执行代码评估流程，根据不同的语言选择不同的解析器，并应用各种度量分析
     
     Args:
         ctx: 评估上下文对象
         lang: 语言枚举值
+        update: 增量更新，在解析之后删除受变更影响的文档，为None时沿用已有文档
     """
     # 生成函数列表、类列表、函数调用图、类调用图，根据语言选择不同的解析器
     if lang == LangEnum.cpp:  # 如果是C++语言
@@ -94,16 +103,35 @@ def eva(ctx: EvaContext, lang: LangEnum):
         PyParser().eva(ctx)  # 使用Python解析器
     else:
         raise NotImplementedError(f'{lang} not supported')  # 不支持的语言抛出异常
+    # 增量更新，删除受变更影响的文档，之后的阶段只重新生成这些文档
+    if update is not None:
+        update.eva(ctx)
     # 生成软件目录结构，TODO：暂时不用了
     # StructureMetric().eva(ctx)
-    # 生成函数文档
-    FunctionMetric().eva(ctx)
-    # 生成类文档
-    ClazzMetric().eva(ctx)
-    # 生成模块文档
-    ModuleMetric().eva(ctx)
-    # 生成仓库文档
-    RepoV2Metric().eva(ctx)
+    # 生成函数、类、模块、仓库文档，LLM调用按阶段统计重试次数。流水执行时类文档在其成员函数的文档生成后即开始，
+    # 模块与仓库文档在全部函数文档生成后即开始；否则依次执行各阶段，每个阶段结束时等待文档落盘
+    if ProjectSettings().stage_pipeline:
+        StagePipeline(FunctionMetric(), ClazzMetric(), [ModuleMetric(), RepoV2Metric()]).eva(ctx)
+        ctx.flush_docs()
+    else:
+        for metric in (FunctionMetric(), ClazzMetric(), ModuleMetric(), RepoV2Metric()):
+            with llm_stage(type(metric).__name__):
+                metric.eva(ctx)
+            ctx.flush_docs()
+    # 导出markdown文档
+    ctx.export_docs()
+    ctx.close()
+    # 输出token用量（含服务端提示缓存命中数）、模板文档与去重避免的LLM调用次数、上下文打包节省的token数、LLM响应缓存的命中统计、各阶段的重试次数、对冲请求统计、各端点的吞吐与耗时以及收敛后的并发上限
+    TokenUsage.report()
+    FunctionTemplate.report()
+    FunctionDedup.report()
+    ContextPacker.report()
+    ResponseCache.report_all()
+    RetryPolicy.report()
+    HedgePolicy.report_all()
+    EndpointPool.report_all()
+    if AdaptiveLimiter.get_instance() is not None:
+        AdaptiveLimiter.get_instance().report()
 
 
 if __name__ == '__main__':
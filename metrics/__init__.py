@@ -1,16 +1,25 @@
 from .clazz import ClazzMetric
 from .doc import Doc, ApiDoc, ClazzDoc, ModuleDoc, RepoDoc
 from .function import FunctionMetric
+from .function_dedup import FunctionDedup
+from .function_template import FunctionTemplate
 from .function_v2 import FunctionV2Metric
-from .metric import Metric, FuncDef, FieldDef, EvaContext, ClazzDef
+from .manifest import DocManifest
+from .metric import Metric, FuncDef, FieldDef, EvaContext, ClazzDef, StagePlan
 from .module import ModuleMetric
+from .module_reduce import ModuleReducer
 from .module_v2 import ModuleV2Metric
 from .parser import ClangParser
 from .py_parser import PyParser
 from .repo import RepoMetric
 from .repo_v2 import RepoV2Metric
+from .store import DocStore, MarkdownDocStore, SqliteDocStore
 from .structure import StructureMetric
+from .incremental import IncrementalUpdate  # 依赖各度量的文档文件名，放在最后导入
+from .pipeline import StagePipeline
 
 __all__ = ['Metric', 'FuncDef', 'FieldDef', 'EvaContext', 'ClazzDef', 'ClangParser', 'PyParser',
            'Doc', 'ApiDoc', 'ClazzDoc', 'ModuleDoc', 'StructureMetric', 'FunctionMetric', 'FunctionV2Metric',
-           'ClazzMetric', 'ModuleMetric', 'ModuleV2Metric', 'RepoMetric', 'RepoV2Metric', 'RepoDoc']
+           'FunctionTemplate', 'FunctionDedup', 'IncrementalUpdate',
+           'ClazzMetric', 'ModuleMetric', 'ModuleReducer', 'ModuleV2Metric', 'RepoMetric', 'RepoV2Metric', 'RepoDoc', 'DocStore',
+           'MarkdownDocStore', 'SqliteDocStore', 'DocManifest', 'StagePlan', 'StagePipeline']
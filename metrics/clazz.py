@@ -1,11 +1,12 @@
-from typing import List  # 导入List类型提示
+from typing import Dict, List, Optional, Tuple  # 导入Dict、List、Optional、Tuple类型提示
 
 from loguru import logger  # 导入日志记录工具
 
-from utils import SimpleLLM, ChatCompletionSettings, prefix_with, TaskDispatcher, llm_thread_pool  # 导入LLM、设置、前缀工具和任务分发相关工具
+from utils import SimpleLLM, ChatCompletionSettings, prefix_with  # 导入LLM、设置和前缀工具
 from .doc import ApiDoc, ClazzDoc  # 导入API文档和类文档
 from .function import documentation_guideline  # 导入文档生成指南
-from .metric import Metric, FieldDef, ClazzDef  # 导入度量基类和字段、类定义类
+from .manifest import DocManifest  # 导入文档运行清单
+from .metric import Metric, FieldDef, ClazzDef, StagePlan  # 导入度量基类、字段与类定义类和任务图
 
 
 # 为类生成文档
@@ -22,20 +23,42 @@ class ClazzMetric(Metric):
         Args:
             ctx: 评估上下文对象，包含类调用图等信息
         """
+        self.plan(ctx).run()
+
+    def plan(self, ctx) -> StagePlan:
+        """
+        构建为所有类生成文档的任务图，节点为类符号名
+        
+        Args:
+            ctx: 评估上下文对象，包含类调用图等信息
+            
+        Returns:
+            任务图
+        """
         callgraph = ctx.clazz_callgraph  # 获取类调用图
         logger.info(f'[ClazzMetric] gen doc for class, class count: {len(callgraph)}')  # 记录类数量
+        # 删除运行清单中输入已变化的文档，成员函数的文档重新生成后内容变化的类在执行到时再删除并重新生成
+        setting = ChatCompletionSettings()
+        fingerprints = {s: self._fingerprint(ctx, s, setting) for s in callgraph.nodes}
+        ctx.remove_clazz_docs(ctx.manifest.stale(ClazzDoc.doc_type(), fingerprints, ctx.load_clazz_doc))
+        neighbours: Dict[str, List[Tuple[str, str]]] = {}  # 类到其依赖的成员函数的映射
 
-        # 生成文档
-        def gen(symbol: str):
+        # 构建提示，文档已存在时返回None
+        def prepare(symbol: str) -> Optional[SimpleLLM]:
             """
-            为单个类生成文档的内部函数
+            为单个类构建LLM对话的内部函数
             
             Args:
                 symbol: 类符号名
+                
+            Returns:
+                已填入提示的LLM客户端，如果文档已存在则返回None
             """
             if ctx.load_clazz_doc(symbol):  # 如果文档已存在
-                logger.info(f'[ClazzMetric] load {symbol}')  # 记录加载信息
-                return  # 跳过生成
+                if not ctx.manifest.outdated(ClazzDoc.doc_type(), symbol):  # 成员函数的文档未变化
+                    logger.info(f'[ClazzMetric] load {symbol}')  # 记录加载信息
+                    return None  # 跳过生成
+                ctx.remove_clazz_docs([symbol])
             c: ClazzDef = ctx.clazz(symbol)  # 获取类定义
             referenced = list(
                 filter(lambda s: s is not None,
@@ -45,21 +68,85 @@ class ClazzMetric(Metric):
                 filter(lambda s: s is not None,
                        map(lambda s: ctx.load_function_doc(s.symbol), c.functions))
             )  # 获取此类中的函数文档
-            prompt = ClazzPromptBuilder().attributes(c.fields).code(c.code).functions(
-                functions).referenced(referenced).lang(ctx.lang.markdown).name(symbol).build()  # 构建提示
-            llm = SimpleLLM(ChatCompletionSettings())  # 创建LLM客户端
-            res = llm.add_system_msg(prompt).add_user_msg(documentation_guideline).ask()  # 调用LLM生成文档
+            # 成员函数先于类生成，其文档变化时类需要重新生成；引用此类的类在其后生成，其文档只作为参考，不记录为依赖
+            neighbours[symbol] = [(ApiDoc.doc_type(), d.name) for d in functions]
+            builder = ClazzPromptBuilder().attributes(c.fields).code(c.code).functions(
+                functions).referenced(referenced).lang(ctx.lang.markdown).name(symbol)  # 构建提示
+            setting = ChatCompletionSettings()
+            llm = SimpleLLM(setting)  # 创建LLM客户端
+            if setting.prefix_cache:  # 静态的指令与文档指导在前，类的代码与引用关系在后，便于服务端复用提示前缀的缓存
+                static, variable = builder.build_messages()
+                return llm.add_system_msg(static + documentation_guideline).add_user_msg(variable)
+            return llm.add_system_msg(builder.build()).add_user_msg(documentation_guideline)
+
+        # 解析并保存文档
+        def save(symbol: str, res: str):
+            """
+            解析LLM的响应并保存类文档的内部函数
+            
+            Args:
+                symbol: 类符号名
+                res: LLM的响应
+            """
             res = f'### {symbol}\n' + res  # 添加标题
             doc = ClazzDoc.from_chapter(res)  # 从Markdown文本解析生成ClazzDoc对象
             ctx.save_clazz_doc(symbol, doc)  # 保存类文档
+            ctx.manifest.record(ClazzDoc.doc_type(), symbol, fingerprints[symbol], doc, neighbours.pop(symbol, []))
             logger.info(f'[ClazzMetric] parse {symbol}')  # 记录解析信息
 
-        TaskDispatcher(llm_thread_pool).map(callgraph, gen).run()  # 使用任务分发器并行处理所有类
+        # 生成文档
+        def gen(symbol: str):
+            """
+            为单个类生成文档的内部函数
+            
+            Args:
+                symbol: 类符号名
+            """
+            llm = prepare(symbol)  # 构建提示
+            if llm:
+                save(symbol, llm.ask())  # 调用LLM生成文档
 
+        # 以协程方式生成文档
+        async def agen(symbol: str):
+            """
+            gen的协程版本
+            
+            Args:
+                symbol: 类符号名
+            """
+            llm = prepare(symbol)  # 构建提示
+            if llm:
+                save(symbol, await llm.aask())  # 调用LLM生成文档
+
+        # 以类的代码长度估计耗时
+        return StagePlan(callgraph, gen, agen, lambda s: len(ctx.clazz(s).code))
 
-doc_generation_instruction = (
+    @classmethod
+    def _fingerprint(cls, ctx, symbol: str, setting: ChatCompletionSettings) -> str:
+        """
+        计算类文档的输入指纹，包括提示模板版本、模型、文档语言、类的代码、属性、方法与引用此类的类
+        
+        Args:
+            ctx: 评估上下文对象
+            symbol: 类符号名
+            setting: 聊天完成设置对象
+            
+        Returns:
+            输入指纹
+        """
+        c: ClazzDef = ctx.clazz(symbol)
+        return DocManifest.fingerprint(doc_prompt_version, setting.model, setting.language, c.code,
+                                       ','.join(f'{f.symbol} {f.name}' for f in c.fields),
+                                       ','.join(f.symbol for f in c.functions),
+                                       ','.join(sorted(ctx.clazz_callgraph.predecessors(symbol))))
+
+
+doc_generation_role = (
     "You are an AI documentation assistant, and your task is to generate documentation based on the given code of an object. "
     "The purpose of the documentation is to help developers and beginners understand the function and specific usage of the code.\n\n"
+)  # 类文档生成指令模板：角色与任务说明
+
+doc_generation_target = (
     'Now you need to generate a document for a Class, whose name is `{code_name}`.\n\n'
     "The code of the Class is as follows:\n\n"
     "```{lang}\n"
@@ -67,6 +154,9 @@ doc_generation_instruction = (
     "```\n\n"
     "{functions}\n"
     "{referenced}\n\n"
+)  # 类文档生成指令模板：目标类的名称、代码、方法与引用关系
+
+doc_generation_format = (
     "Please generate a detailed explanation document for this Class based on the code of the target Class itself and combine it with its calling situation in the project.\n\n"
     "Please write out the function of this Class briefly followed by a detailed analysis (including all details) to serve as the documentation for this part of the code.\n\n"
     "The standard format is in the Markdown reference paragraph below, and you do not need to write the reference symbols `>` when you output:\n\n"
@@ -77,7 +167,13 @@ doc_generation_instruction = (
     "> Detailed and CERTAIN code analysis of the Class. {has_relationship}\n\n"
     "Please note:\n"
     "- The Level 4 headings in the format like `#### xxx` are fixed, don't change or translate them.\n"
-    "- Don't add new Level 3 or Level 4 headings. Do not write anything outside the format\n")  # 类文档生成指令模板，定义了类文档的格式和内容要求
+    "- Don't add new Level 3 or Level 4 headings. Do not write anything outside the format\n"
+)  # 类文档生成指令模板：文档格式要求
+
+doc_generation_instruction = doc_generation_role + doc_generation_target + doc_generation_format  # 类文档生成指令模板，定义了类文档的格式和内容要求
+
+# 提示模板的版本，模板变化时运行清单中的类文档过期
+doc_prompt_version = DocManifest.fingerprint(doc_generation_instruction, documentation_guideline)
 
 
 class ClazzPromptBuilder:
@@ -86,11 +182,22 @@ class ClazzPromptBuilder:
     
     使用链式调用模式，每个方法都返回self以便连续调用
     """
-    _prompt: str = doc_generation_instruction  # 初始化提示为文档生成指令模板
+    # 提示模板的三个部分：角色与任务说明、目标类、格式要求，各部分的占位符分别替换
+    _parts: Tuple[str, str, str] = (doc_generation_role, doc_generation_target, doc_generation_format)
 
     _tag_referenced = False  # 是否有被引用类的标记
     _tag_functions = False  # 是否有函数的标记
 
+    def _fill(self, key: str, value: str):
+        """
+        替换提示模板各部分中的占位符
+        
+        Args:
+            key: 占位符
+            value: 替换的内容
+        """
+        self._parts = tuple(part.replace(key, value) for part in self._parts)
+
     def name(self, name: str):
         """
         设置类名称
@@ -101,15 +208,15 @@ class ClazzPromptBuilder:
         Returns:
             self，用于链式调用
         """
-        self._prompt = self._prompt.replace('{code_name}', name)  # 替换模板中的类名占位符
+        self._fill('{code_name}', name)  # 替换模板中的类名占位符
         return self  # 返回self用于链式调用
 
     # def structure(self, structure: str):
-    #     self._prompt = self._prompt.replace('{project_structure}', structure)
+    #     self._fill('{project_structure}', structure)
     #     return self
     #
     # def file_path(self, file_path: str):
-    #     self._prompt = self._prompt.replace('{file_path}', file_path)
+    #     self._fill('{file_path}', file_path)
     #     return self
 
     def lang(self, lang: str):
@@ -122,7 +229,7 @@ class ClazzPromptBuilder:
         Returns:
             self，用于链式调用
         """
-        self._prompt = self._prompt.replace('{lang}', lang)  # 替换模板中的语言占位符
+        self._fill('{lang}', lang)  # 替换模板中的语言占位符
         return self  # 返回self用于链式调用
 
     def referenced(self, referenced: List[ClazzDoc]):
@@ -136,13 +243,13 @@ class ClazzPromptBuilder:
             self，用于链式调用
         """
         if len(referenced) == 0:  # 如果没有引用当前类的类
-            self._prompt = self._prompt.replace('{referenced}', '')  # 清空相关占位符
+            self._fill('{referenced}', '')  # 清空相关占位符
             return self  # 返回self用于链式调用
         prompt = 'As you can see, the class holds the following class as attributes, their docs and code are as following:\n\n'  # 创建引用类的提示起始文本
         for reference_item in referenced:  # 遍历每个引用类
             prompt += f'**Class**: `{reference_item.name}`\n\n' + '**Document**:\n\n' + '\n'.join(
                 list(map(lambda t: '> ' + t, reference_item.markdown()))) + '\n---\n'  # 添加每个引用类的信息
-        self._prompt = self._prompt.replace('{referenced}', prompt)  # 替换模板中的引用类占位符
+        self._fill('{referenced}', prompt)  # 替换模板中的引用类占位符
         self._tag_referenced = True  # 设置引用标记为真
         return self  # 返回self用于链式调用
 
@@ -157,12 +264,12 @@ class ClazzPromptBuilder:
             self，用于链式调用
         """
         if len(functions) == 0:  # 如果没有函数
-            self._prompt = self._prompt.replace('{functions}', '')  # 清空相关占位符
+            self._fill('{functions}', '')  # 清空相关占位符
             return self  # 返回self用于链式调用
         prompt = 'The class have some relative methods, their descriptions are as following:\n'  # 创建函数列表的提示起始文本
         for f in functions:  # 遍历每个函数
             prompt += f'**Method**: `{f.name}`\n\n**Description**:{f.description}\n' + '\n---\n'  # 添加每个函数的信息
-        self._prompt = self._prompt.replace('{functions}', prompt)  # 替换模板中的函数列表占位符
+        self._fill('{functions}', prompt)  # 替换模板中的函数列表占位符
         self._tag_functions = True  # 设置函数标记为真
         return self  # 返回self用于链式调用
 
@@ -176,11 +283,22 @@ class ClazzPromptBuilder:
             完整的提示字符串
         """
         if self._tag_referenced or self._tag_functions:  # 如果有引用关系或函数
-            self._prompt = self._prompt.replace('{has_relationship}',
+            self._fill('{has_relationship}',
                                                 'And please include the reference relationship with its methods or callees in the project from a functional perspective')  # 添加引用关系说明
         else:  # 如果没有引用关系或函数
-            self._prompt = self._prompt.replace('{has_relationship}', '')  # 清空相关占位符
-        return self._prompt  # 返回完整的提示字符串
+            self._fill('{has_relationship}', '')  # 清空相关占位符
+        return ''.join(self._parts)  # 返回完整的提示字符串
+
+    def build_messages(self) -> Tuple[str, str]:
+        """
+        构建前缀缓存友好的提示，静态的角色说明与格式要求在前，目标类的代码、方法与引用关系在后
+        
+        Returns:
+            (静态部分, 可变部分)
+        """
+        self.build()  # 完成剩余占位符的替换
+        role, target, fmt = self._parts
+        return role + fmt, target
 
     def attributes(self, params: List[FieldDef]):
         """
@@ -193,13 +311,13 @@ class ClazzPromptBuilder:
             self，用于链式调用
         """
         if len(params):  # 如果有属性
-            self._prompt = self._prompt.replace('{attributes}', prefix_with((
+            self._fill('{attributes}', prefix_with((
                 "#### Attributes\n"
                 "- Attribute1: XXX\n"
                 "- Attribute2: XXX\n"
                 "- ...\n"), '> '))  # 添加属性部分的格式
         else:  # 如果没有属性
-            self._prompt = self._prompt.replace('{attributes}', '')  # 清空属性占位符
+            self._fill('{attributes}', '')  # 清空属性占位符
         return self  # 返回self用于链式调用
 
     def code(self, code: str):
@@ -212,5 +330,5 @@ class ClazzPromptBuilder:
         Returns:
             self，用于链式调用
         """
-        self._prompt = self._prompt.replace('{code}', code)  # 替换模板中的代码占位符
+        self._fill('{code}', code)  # 替换模板中的代码占位符
         return self  # 返回self用于链式调用
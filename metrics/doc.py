@@ -1,6 +1,5 @@
 from __future__ import annotations  # 启用未来版本的注解特性，允许在类型注解中使用尚未定义的类
 
-import re  # 导入正则表达式模块，用于文本解析
 from abc import abstractmethod, ABC  # 导入抽象基类和抽象方法，用于定义接口
 from typing import List, Optional, override, TypeVar  # 导入类型提示工具
 
@@ -24,7 +23,7 @@ class Doc(ABC, BaseModel):
         """
         从Markdown字符串中解析出所有文档对象
         
-        使用正则表达式匹配以"###"开头的章节，每个章节对应一个文档对象
+        单遍扫描字符串，以"\n### "为分隔切分章节，每个章节对应一个文档对象
         
         Args:
             s: Markdown格式的字符串
@@ -32,10 +31,15 @@ class Doc(ABC, BaseModel):
         Returns:
             文档对象列表
         """
-        function_pattern = re.compile(r'(###.*?)(?=\n### |\Z)', re.DOTALL)  # 匹配章节的正则表达式
         res: List[Doc] = []  # 初始化结果列表
-        for match in function_pattern.finditer(s):  # 遍历所有匹配的章节
-            res.append(cls.from_chapter(match.group(1)))  # 解析章节并添加到结果列表
+        start = s.find('###')  # 第一个章节的起点
+        while start >= 0:  # 逐个切分章节
+            end = s.find('\n### ', start + 3)  # 当前章节在下一个三级标题前结束
+            if end < 0:  # 如果是最后一个章节
+                res.append(cls.from_chapter(s[start:]))  # 解析章节并添加到结果列表
+                break
+            res.append(cls.from_chapter(s[start:end]))  # 解析章节并添加到结果列表
+            start = end + 1  # 下一个章节从三级标题开始
         return res  # 返回所有文档对象
 
     # 读取字符串，返回其中的一个文档对象
@@ -49,10 +53,17 @@ class Doc(ABC, BaseModel):
             
         Returns:
             解析出的文档对象
-        """
-        module_pattern = re.search(r'### (.*?)\n(.*?)(?=\n### |\Z)', s, re.DOTALL)  # 匹配章节标题和内容
-        name = module_pattern.group(1).strip()  # 提取名称
-        block = module_pattern.group(2)  # 提取内容块
+            
+        Raises:
+            ValueError: 章节中没有"### 名称"形式的标题行
+        """
+        title = s.find('### ')  # 定位章节标题
+        newline = s.find('\n', title + 4) if title >= 0 else -1  # 标题行的结尾
+        if newline < 0:  # 如果没有完整的标题行
+            raise ValueError(f'Invalid chapter: {s[:50]}')
+        name = s[title + 4:newline].strip()  # 提取名称
+        end = s.find('\n### ', newline + 1)  # 内容块在下一个三级标题前结束
+        block = s[newline + 1:end] if end >= 0 else s[newline + 1:]  # 提取内容块
         return cls.from_chapter_hook(cls(name=name, description=cls.from_block(block, 'Description')), block)  # 创建并返回文档对象
 
     # 读取字符串，为文档对象附加属性
@@ -77,7 +88,7 @@ class Doc(ABC, BaseModel):
     @classmethod
     def from_block(cls, block: str, header: str) -> Optional[str]:
         """
-        从内容块中提取指定标题下的内容
+        从内容块中提取指定标题下的内容，内容截止到下一个"####"
         
         Args:
             block: 内容块字符串
@@ -86,9 +97,12 @@ class Doc(ABC, BaseModel):
         Returns:
             标题下的内容，如果未找到则返回None
         """
-        match = re.search(f'#### {header}' + r'(.*?)(?=####|\Z)', block, re.DOTALL)  # 匹配标题和内容
-        content = match.group(1).strip() if match else None  # 提取内容并去除首尾空白
-        return content  # 返回内容
+        start = block.find(f'#### {header}')  # 定位标题
+        if start < 0:  # 如果未找到
+            return None
+        start += len(header) + 5  # 内容从标题之后开始
+        end = block.find('####', start)  # 内容在下一个标题前结束
+        return (block[start:end] if end >= 0 else block[start:]).strip()  # 提取内容并去除首尾空白
 
     # 将文档对象转化为markdown格式的字符串
     def markdown(self) -> str:
@@ -386,3 +400,52 @@ class RepoDoc(Doc):
             "repo"字符串
         """
         return 'repo'  # 返回类型标识符
+
+
+if __name__ == '__main__':
+    import random  # 导入random模块，用于生成测试文档
+    import re  # 导入正则表达式模块，用于对比原有的解析方式
+    import time  # 导入time模块，用于计时
+
+
+    # 原有的基于正则表达式的解析方式，作为对照
+    def regex_from_block(block: str, header: str) -> Optional[str]:
+        match = re.search(f'#### {header}' + r'(.*?)(?=####|\Z)', block, re.DOTALL)
+        return match.group(1).strip() if match else None
+
+
+    def regex_from_chapter(s: str) -> ApiDoc:
+        module_pattern = re.search(r'### (.*?)\n(.*?)(?=\n### |\Z)', s, re.DOTALL)
+        name = module_pattern.group(1).strip()
+        block = module_pattern.group(2)
+        doc = ApiDoc(name=name, description=regex_from_block(block, 'Description'))
+        doc.detail = regex_from_block(block, 'Code Details')
+        doc.example = regex_from_block(block, 'Example')
+        doc.parameters = regex_from_block(block, 'Parameters')
+        doc.code = regex_from_block(block, 'Source Code')
+        return doc
+
+
+    def regex_from_doc(s: str) -> List[ApiDoc]:
+        return [regex_from_chapter(m.group(1)) for m in re.finditer(r'(###.*?)(?=\n### |\Z)', s, re.DOTALL)]
+
+
+    # 生成多MB的函数文档文件，比较两种解析方式的结果与耗时
+    random.seed(0)
+    words = ['buffer', 'length', 'returns', 'the', 'pointer', 'to', 'a', 'context', 'update', 'digest', '#', '##']
+    for count in [2000, 8000]:
+        md = ''
+        for i in range(count):
+            text = lambda n: ' '.join(random.choices(words, k=n))
+            md += ApiDoc(name=f'void func_{i}(int a, char *b)', description=text(20),
+                         parameters=f'- a: {text(10)}\n- b: {text(10)}', detail='\n\n'.join(text(60) for _ in range(5)),
+                         example=f'```c++\n{text(30)}\n```', code=f'```c++\n{text(80)}\n```').markdown() + '\n'
+        ctime = time.time()
+        expected = regex_from_doc(md)
+        regex_cost = time.time() - ctime
+        ctime = time.time()
+        actual = ApiDoc.from_doc(md)
+        cost = time.time() - ctime
+        assert expected == actual, 'parse result mismatch'
+        print(f'{len(md) / 1024 / 1024:.1f}MB, {count} docs: regex {regex_cost:.3f}s, single pass {cost:.3f}s, '
+              f'speedup {regex_cost / cost:.1f}x')
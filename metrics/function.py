@@ -1,11 +1,14 @@
-from typing import List  # 导入List类型提示
+from typing import Callable, Container, Dict, List, Optional, Tuple  # 导入类型提示工具
 
 from loguru import logger  # 导入日志记录工具
 
-from utils import SimpleLLM, ChatCompletionSettings, prefix_with, TaskDispatcher  # 导入LLM、聊天设置、前缀工具和任务分发器
-from utils.settings import llm_thread_pool  # 导入LLM线程池设置
+from utils import SimpleLLM, ChatCompletionSettings, prefix_with, ContextPacker  # 导入LLM、聊天设置、前缀工具和上下文打包器
+from utils.settings import ProjectSettings  # 导入项目设置
 from .doc import ApiDoc  # 导入API文档类
-from .metric import Metric, FieldDef, FuncDef  # 导入度量基类和字段、函数定义类
+from .function_dedup import FunctionDedup  # 导入相同函数体的去重
+from .function_template import FunctionTemplate  # 导入平凡函数的模板文档
+from .manifest import DocManifest  # 导入文档运行清单
+from .metric import Metric, FieldDef, FuncDef, StagePlan  # 导入度量基类、字段与函数定义类和任务图
 
 documentation_guideline = (
     "Keep in mind that your audience is document readers, so use a deterministic tone to generate precise content and don't let them know "
@@ -14,6 +17,41 @@ documentation_guideline = (
 )  # 文档生成指导，告诉LLM以专业的方式生成精确的文档
 
 
+def pack_function_docs(ctx, docs: List[ApiDoc], render: Callable[[ApiDoc], str]) -> List[ApiDoc]:
+    """
+    在MODEL_CONTEXT_BUDGET的token预算内选择提示中的调用者、被调用者文档
+
+    按函数在调用图中的PageRank值（没有时按调用关系数）排序，重要的函数保留完整文档，
+    其余的只保留描述，仍超出预算的被丢弃
+
+    Args:
+        ctx: 评估上下文对象
+        docs: 调用者、被调用者的文档列表
+        render: 文档在提示中的文本
+
+    Returns:
+        预算内的文档列表
+    """
+    callgraph = ctx.callgraph
+
+    def rank(doc: ApiDoc) -> float:
+        """
+        函数的相关度
+
+        Args:
+            doc: 函数文档
+
+        Returns:
+            PageRank值或调用关系数
+        """
+        if doc.name not in callgraph:
+            return 0
+        return callgraph.nodes[doc.name].get('rank', callgraph.degree(doc.name))
+
+    return ContextPacker.get_instance(ChatCompletionSettings()).pack(
+        docs, render, lambda d: ApiDoc(name=d.name, description=d.description), rank)
+
+
 # 为函数生成文档
 class FunctionMetric(Metric):
     """
@@ -29,20 +67,66 @@ class FunctionMetric(Metric):
         Args:
             ctx: 评估上下文对象，包含函数调用图等信息
         """
+        self.plan(ctx).run()
+
+    def plan(self, ctx) -> StagePlan:
+        """
+        构建为所有函数生成文档的任务图，节点为函数符号名或一批叶子函数的符号名元组
+        
+        Args:
+            ctx: 评估上下文对象，包含函数调用图等信息
+            
+        Returns:
+            任务图
+        """
         callgraph = ctx.callgraph  # 获取函数调用图
         logger.info(f'[FunctionMetric] gen doc for functions, functions count: {len(callgraph)}')  # 记录函数数量
+        # 删除运行清单中输入已变化的文档，之后按已有文档跳过的逻辑只重新生成这些文档，
+        # 被调用者重新生成后文档内容变化的函数在执行到时再删除并重新生成
+        setting = ChatCompletionSettings()
+        fingerprints = {s: self._fingerprint(ctx, s, setting) for s in callgraph.nodes}
+        ctx.remove_function_docs(ctx.manifest.stale(ApiDoc.doc_type(), fingerprints, ctx.load_function_doc))
+        neighbours: Dict[str, List[str]] = {}  # 函数到其依赖的被调用者的映射
 
-        # 生成文档
-        def gen(symbol: str):
+        # 保存文档并记录到运行清单
+        def save_doc(symbol: str, doc: ApiDoc, deps: List[str] = ()):
+            """
+            保存函数文档并在运行清单中记录其输入指纹
+            
+            Args:
+                symbol: 函数符号名
+                doc: 函数文档
+                deps: 嵌入提示且先于该函数生成的函数
             """
-            为单个函数生成文档的内部函数
+            ctx.save_function_doc(symbol, doc)
+            ctx.manifest.record(ApiDoc.doc_type(), symbol, fingerprints[symbol], doc,
+                                [(ApiDoc.doc_type(), s) for s in deps])
+
+        FunctionTemplate.eva(ctx, save_doc)  # 平凡函数按模板生成文档
+        duplicates = FunctionDedup.duplicates(ctx)  # 重复函数到同组中生成文档的函数的映射
+
+        # 构建提示，文档已存在时返回None
+        def prepare(symbol: str) -> Optional[SimpleLLM]:
+            """
+            为单个函数构建LLM对话的内部函数
             
             Args:
                 symbol: 函数符号名
+                
+            Returns:
+                已填入提示的LLM客户端，如果文档已存在则返回None
             """
             if ctx.load_function_doc(symbol):  # 如果文档已存在
-                logger.info(f'[FunctionMetric] load {symbol}')  # 记录加载信息
-                return  # 跳过生成
+                if not ctx.manifest.outdated(ApiDoc.doc_type(), symbol):  # 被调用者的文档未变化
+                    logger.info(f'[FunctionMetric] load {symbol}')  # 记录加载信息
+                    return None  # 跳过生成
+                ctx.remove_function_docs([symbol])
+            if symbol in duplicates:  # 复制相同代码的函数的文档
+                doc = FunctionDedup.clone(ctx, duplicates[symbol], symbol)
+                if doc is not None:
+                    ctx.manifest.record(ApiDoc.doc_type(), symbol, fingerprints[symbol], doc,
+                                        [(ApiDoc.doc_type(), duplicates[symbol])])
+                    return None
             f: FuncDef = ctx.func(symbol)  # 获取函数定义
             referencer = list(
                 filter(lambda s: s is not None,
@@ -52,21 +136,188 @@ class FunctionMetric(Metric):
                 filter(lambda s: s is not None,
                        map(lambda s: ctx.load_function_doc(s), callgraph.predecessors(symbol)))
             )  # 获取调用此函数的其他函数的文档（引用此函数的函数）
-            prompt = _FunctionPromptBuilder().parameters(f.params).code(f.code).referencer(
-                referencer).referenced(referenced).lang(ctx.lang.markdown).name(symbol).build()  # 构建提示
-            res = SimpleLLM(ChatCompletionSettings()).add_system_msg(prompt).add_user_msg(documentation_guideline).ask()  # 调用LLM生成文档
+            # 两组文档共享token预算，调用图无环，同一函数不会同时出现在两组中
+            packed = {d.name: d for d in
+                      pack_function_docs(ctx, referencer + referenced, _FunctionPromptBuilder.reference)}
+            referencer = [packed[d.name] for d in referencer if d.name in packed]
+            referenced = [packed[d.name] for d in referenced if d.name in packed]
+            # 被调用者先于该函数生成，其文档变化时该函数需要重新生成；调用者的文档来自之前的运行，只作为参考，不记录为依赖
+            neighbours[symbol] = [d.name for d in referencer]
+            builder = _FunctionPromptBuilder().parameters(f.params).code(f.code).referencer(
+                referencer).referenced(referenced).lang(ctx.lang.markdown).name(symbol)  # 构建提示
+            setting = ChatCompletionSettings()
+            llm = SimpleLLM(setting)  # 创建LLM客户端
+            if setting.prefix_cache:  # 静态的指令与文档指导在前，函数的代码与调用关系在后，便于服务端复用提示前缀的缓存
+                static, variable = builder.build_messages()
+                return llm.add_system_msg(static + documentation_guideline).add_user_msg(variable)
+            return llm.add_system_msg(builder.build()).add_user_msg(documentation_guideline)
+
+        # 解析并保存文档
+        def save(symbol: str, res: str):
+            """
+            解析LLM的响应并保存函数文档的内部函数
+            
+            Args:
+                symbol: 函数符号名
+                res: LLM的响应
+            """
             res = f'### {symbol}\n' + res  # 添加标题
             doc = ApiDoc.from_chapter(res)  # 从Markdown文本解析生成ApiDoc对象
-            ctx.save_function_doc(symbol, doc)  # 保存函数文档
+            save_doc(symbol, doc, neighbours.pop(symbol, []))  # 保存函数文档
             logger.info(f'[FunctionMetric] parse {symbol}')  # 记录解析信息
 
-        TaskDispatcher(llm_thread_pool).map(callgraph, gen).run()  # 使用任务分发器并行处理所有函数
+        # 为一批叶子函数构建提示
+        def prepare_batch(batch: Tuple[str, ...]) -> SimpleLLM:
+            """
+            为同一文件中的一批小型叶子函数构建一次LLM对话的内部函数
+            
+            Args:
+                batch: 函数符号名元组
+                
+            Returns:
+                已填入提示的LLM客户端
+            """
+            functions = ''.join(map(
+                lambda s: f'**Function**: `{s}`\n\n```{ctx.lang.markdown}\n{ctx.func(s).code}\n```\n\n', batch))
+            target = doc_batch_generation_target.format(count=len(batch), functions=functions)
+            instruction = doc_batch_generation_format.replace('{lang}', ctx.lang.markdown)
+            setting = ChatCompletionSettings()
+            llm = SimpleLLM(setting)  # 创建LLM客户端
+            if setting.prefix_cache:  # 静态的指令与文档指导在前，函数的代码在后
+                return llm.add_system_msg(doc_generation_role + instruction + documentation_guideline).add_user_msg(target)
+            return llm.add_system_msg(doc_generation_role + target + instruction).add_user_msg(documentation_guideline)
+
+        # 解析并保存一批文档
+        def save_batch(batch: Tuple[str, ...], res: str):
+            """
+            将LLM的响应按三级标题切分为各函数的文档并保存，响应中缺失的函数稍后单独生成
+            
+            Args:
+                batch: 函数符号名元组
+                res: LLM的响应
+            """
+            try:
+                docs = {doc.name.strip('`'): doc for doc in ApiDoc.from_doc(res)}  # 按函数名索引文档
+            except ValueError as e:  # 响应格式错误时整批单独生成
+                logger.warning(f'[FunctionMetric] invalid batch response for {batch}: {e}')
+                return
+            for symbol in batch:
+                if symbol in docs:
+                    docs[symbol].name = symbol
+                    save_doc(symbol, docs[symbol])  # 保存函数文档
+                    logger.info(f'[FunctionMetric] parse {symbol} in batch')  # 记录解析信息
+                else:
+                    logger.warning(f'[FunctionMetric] {symbol} missing in batch response, retry individually')
+
+        # 生成文档
+        def gen(symbol):
+            """
+            为单个函数或一批叶子函数生成文档的内部函数
+            
+            Args:
+                symbol: 函数符号名，或一批叶子函数的符号名元组
+            """
+            if isinstance(symbol, tuple):  # 一批叶子函数
+                save_batch(symbol, prepare_batch(symbol).ask())
+                return
+            llm = prepare(symbol)  # 构建提示
+            if llm:
+                save(symbol, llm.ask())  # 调用LLM生成文档
+
+        # 以协程方式生成文档
+        async def agen(symbol):
+            """
+            gen的协程版本
+            
+            Args:
+                symbol: 函数符号名，或一批叶子函数的符号名元组
+            """
+            if isinstance(symbol, tuple):  # 一批叶子函数
+                save_batch(symbol, await prepare_batch(symbol).aask())
+                return
+            llm = prepare(symbol)  # 构建提示
+            if llm:
+                save(symbol, await llm.aask())  # 调用LLM生成文档
+
+        # 代码相同的函数依赖同组中生成文档的函数，完成后复制其文档；
+        # 小型叶子函数按文件合并为批次，批次作为调用图中的额外节点，批次内的函数依赖所在批次，
+        # 批次完成后这些函数直接加载文档，响应中缺失的函数再单独生成
+        batches = self._leaf_batches(ctx, exclude=duplicates)
+        graph = callgraph.copy() if duplicates or batches else callgraph
+        for symbol, origin in duplicates.items():
+            graph.add_edge(symbol, origin)
+        if batches:
+            for batch in batches:
+                for symbol in batch:
+                    graph.add_edge(symbol, batch)
+            logger.info(f'[FunctionMetric] {sum(map(len, batches))} leaf functions in {len(batches)} batches')
+
+        # 以源代码长度估计耗时，调用链长的函数优先生成
+        cost = lambda s: sum(len(ctx.func(x).code) for x in s) if isinstance(s, tuple) else len(ctx.func(s).code)
+        return StagePlan(graph, gen, agen, cost)
+
+    @classmethod
+    def _fingerprint(cls, ctx, symbol: str, setting: ChatCompletionSettings) -> str:
+        """
+        计算函数文档的输入指纹，包括提示模板版本、模型、文档语言、函数代码、参数与被调用的函数
+        
+        Args:
+            ctx: 评估上下文对象
+            symbol: 函数符号名
+            setting: 聊天完成设置对象
+            
+        Returns:
+            输入指纹
+        """
+        f: FuncDef = ctx.func(symbol)
+        return DocManifest.fingerprint(doc_prompt_version, setting.model, setting.language, f.code,
+                                       ','.join(p.symbol for p in f.params),
+                                       ','.join(sorted(ctx.callgraph.successors(symbol))))
+
+    @classmethod
+    def _leaf_batches(cls, ctx, exclude: Container[str] = ()) -> List[Tuple[str, ...]]:
+        """
+        将尚无文档的小型叶子函数（不调用其他函数）按所在文件分批，每批的函数数与代码token数不超过设置的上限
+        
+        Args:
+            ctx: 评估上下文对象
+            exclude: 不参与合并的函数，如复制文档的重复函数
+            
+        Returns:
+            批次列表，每个批次为函数符号名元组，只有一个函数的批次不返回
+        """
+        settings = ProjectSettings()
+        if settings.function_batch_size <= 1:  # 未开启合并生成
+            return []
+        packer = ContextPacker.get_instance(ChatCompletionSettings())  # 复用上下文打包器的token计数
+        files: Dict[str, List[Tuple[str, int]]] = {}  # 文件名到叶子函数及其代码token数的映射
+        for symbol in sorted(ctx.callgraph.nodes):
+            if symbol in exclude or ctx.callgraph.out_degree(symbol) or ctx.load_function_doc(symbol):
+                continue  # 跳过不参与合并的函数、非叶子函数与已有文档的函数
+            f: FuncDef = ctx.func(symbol)
+            tokens = packer.count(f.code)
+            if tokens <= settings.function_batch_small:
+                files.setdefault(f.filename, []).append((symbol, tokens))
+        batches = []
+        for functions in files.values():
+            batch, used = [], 0
+            for symbol, tokens in functions:
+                if batch and (len(batch) >= settings.function_batch_size
+                              or used + tokens > settings.function_batch_tokens):
+                    batches.append(tuple(batch))
+                    batch, used = [], 0
+                batch.append(symbol)
+                used += tokens
+            batches.append(tuple(batch))
+        return [batch for batch in batches if len(batch) > 1]
 
 
-doc_generation_instruction = '''
+doc_generation_role = '''
 You are an AI documentation assistant, and your task is to generate documentation based on the given code of an object.
 The purpose of the documentation is to help developers and beginners understand the function and specific usage of the code.
-Now you need to generate a document for a Function, whose name is `{code_name}`.
+'''  # 文档生成指令模板：角色与任务说明
+
+doc_generation_target = '''Now you need to generate a document for a Function, whose name is `{code_name}`.
 
 The code of the Function is as follows:
 ```{lang}
@@ -76,7 +327,9 @@ The code of the Function is as follows:
 {referenced}
 {referencer}
 
-Please generate a detailed explanation document for this Function based on the code of the target Function itself and combine it with its calling situation in the project.
+'''  # 文档生成指令模板：目标函数的名称、代码与调用关系
+
+doc_generation_format = '''Please generate a detailed explanation document for this Function based on the code of the target Function itself and combine it with its calling situation in the project.
 Please write out the function of this Function briefly followed by a detailed analysis (including all details) to serve as the documentation for this part of the code.
 The standard format is in the Markdown reference paragraph below, and you do not need to write the reference symbols `>` when you output:
 > #### Description
@@ -91,7 +344,38 @@ The standard format is in the Markdown reference paragraph below, and you do not
 Please note:
 - The Level 4 headings in the format like `#### xxx` are fixed, don't change or translate them.
 - Don't add new Level 3 or Level 4 headings. Do not write anything outside the format.
-'''  # 文档生成指令模板，定义了函数文档的格式和内容要求
+'''  # 文档生成指令模板：文档格式要求
+
+doc_batch_generation_target = '''Now you need to generate documents for the following {count} Functions.
+
+{functions}'''  # 批量文档生成指令模板：目标函数的名称与代码
+
+doc_batch_generation_format = '''Please generate a detailed explanation document for each of these Functions based on its code.
+For each Function, write out its function briefly followed by a detailed analysis (including all details).
+Each document starts with a Level 3 heading of the Function name exactly as given, and the standard format is in the Markdown reference paragraph below, you do not need to write the reference symbols `>` when you output:
+> ### Function name
+> #### Description
+> Briefly describe the Function in one sentence.
+> #### Parameters
+> - Parameter1: XXX
+> - ...
+> #### Code Details
+> Detailed and CERTAIN code analysis of the Function.
+> #### Example
+> ```{lang}
+> Mock possible usage examples of the Function with codes.
+> ```
+Please note:
+- Write the documents of all the Functions, and omit the `#### Parameters` heading for Functions without parameters.
+- The Level 3 headings like `### xxx` and the Level 4 headings like `#### xxx` are fixed, don't change or translate them.
+- Don't add other Level 3 or Level 4 headings. Do not write anything outside the format.
+'''  # 批量文档生成指令模板：文档格式要求
+
+doc_generation_instruction = doc_generation_role + doc_generation_target + doc_generation_format  # 文档生成指令模板，定义了函数文档的格式和内容要求
+
+# 提示模板的版本，模板变化时运行清单中的函数文档过期
+doc_prompt_version = DocManifest.fingerprint(doc_generation_instruction, doc_batch_generation_target,
+                                             doc_batch_generation_format, documentation_guideline)
 
 
 class _FunctionPromptBuilder:
@@ -100,11 +384,22 @@ class _FunctionPromptBuilder:
     
     使用链式调用模式，每个方法都返回self以便连续调用
     """
-    _prompt: str = doc_generation_instruction  # 初始化提示为文档生成指令模板
+    # 提示模板的三个部分：角色与任务说明、目标函数、格式要求，各部分的占位符分别替换
+    _parts: Tuple[str, str, str] = (doc_generation_role, doc_generation_target, doc_generation_format)
 
     _tag_referenced = False  # 是否有被引用函数的标记
     _tag_referencer = False  # 是否有引用函数的标记
 
+    def _fill(self, key: str, value: str):
+        """
+        替换提示模板各部分中的占位符
+        
+        Args:
+            key: 占位符
+            value: 替换的内容
+        """
+        self._parts = tuple(part.replace(key, value) for part in self._parts)
+
     def name(self, name: str):
         """
         设置函数名称
@@ -115,15 +410,15 @@ class _FunctionPromptBuilder:
         Returns:
             self，用于链式调用
         """
-        self._prompt = self._prompt.replace('{code_name}', name)  # 替换模板中的函数名占位符
+        self._fill('{code_name}', name)  # 替换模板中的函数名占位符
         return self  # 返回self用于链式调用
 
     # def structure(self, structure: str):
-    #     self._prompt = self._prompt.replace('{project_structure}', structure)
+    #     self._fill('{project_structure}', structure)
     #     return self
     #
     # def file_path(self, file_path: str):
-    #     self._prompt = self._prompt.replace('{file_path}', file_path)
+    #     self._fill('{file_path}', file_path)
     #     return self
 
     def lang(self, lang: str):
@@ -136,9 +431,23 @@ class _FunctionPromptBuilder:
         Returns:
             self，用于链式调用
         """
-        self._prompt = self._prompt.replace('{lang}', lang)  # 替换模板中的语言占位符
+        self._fill('{lang}', lang)  # 替换模板中的语言占位符
         return self  # 返回self用于链式调用
 
+    @staticmethod
+    def reference(doc: ApiDoc) -> str:
+        """
+        生成一个调用者或被调用者在提示中的文本
+
+        Args:
+            doc: 函数文档
+
+        Returns:
+            函数名称与以引用格式展示的文档
+        """
+        return f'**Method**: `{doc.name}`\n\n' + '**Document**:\n\n' + '\n'.join(
+            list(map(lambda t: '> ' + t, doc.markdown().split('\n')))) + '\n---\n'
+
     def referenced(self, referenced: List[ApiDoc]):
         """
         设置被当前函数引用的其他函数文档
@@ -150,13 +459,12 @@ class _FunctionPromptBuilder:
             self，用于链式调用
         """
         if len(referenced) == 0:  # 如果没有被引用的函数
-            self._prompt = self._prompt.replace('{referenced}', '')  # 清空相关占位符
+            self._fill('{referenced}', '')  # 清空相关占位符
             return self  # 返回self用于链式调用
         prompt = 'As you can see, the code calls the following methods, their docs and code are as following:\n\n'  # 创建被引用函数的提示起始文本
         for reference_item in referenced:  # 遍历每个被引用函数
-            prompt += f'**Method**: `{reference_item.name}`\n\n' + '**Document**:\n\n' + '\n'.join(
-                list(map(lambda t: '> ' + t, reference_item.markdown()))) + '\n---\n'  # 添加每个被引用函数的信息
-        self._prompt = self._prompt.replace('{referenced}', prompt)  # 替换模板中的被引用函数占位符
+            prompt += self.reference(reference_item)  # 添加每个被引用函数的信息
+        self._fill('{referenced}', prompt)  # 替换模板中的被引用函数占位符
         self._tag_referenced = True  # 设置被引用标记为真
         return self  # 返回self用于链式调用
 
@@ -171,13 +479,12 @@ class _FunctionPromptBuilder:
             self，用于链式调用
         """
         if len(referencer) == 0:  # 如果没有引用当前函数的函数
-            self._prompt = self._prompt.replace('{referencer}', '')  # 清空相关占位符
+            self._fill('{referencer}', '')  # 清空相关占位符
             return self  # 返回self用于链式调用
         prompt = 'Also, the code has been called by the following methods, their code and docs are as following:\n'  # 创建引用函数的提示起始文本
         for referencer_item in referencer:  # 遍历每个引用函数
-            prompt += f'**Method**: `{referencer_item.name}`\n\n' + '**Document**:\n\n' + '\n'.join(
-                list(map(lambda t: '> ' + t, referencer_item.markdown().split('\n')))) + '\n---\n'  # 添加每个引用函数的信息
-        self._prompt = self._prompt.replace('{referencer}', prompt)  # 替换模板中的引用函数占位符
+            prompt += self.reference(referencer_item)  # 添加每个引用函数的信息
+        self._fill('{referencer}', prompt)  # 替换模板中的引用函数占位符
         self._tag_referencer = True  # 设置引用标记为真
         return self  # 返回self用于链式调用
 
@@ -191,14 +498,25 @@ class _FunctionPromptBuilder:
             完整的提示字符串
         """
         if self._tag_referenced or self._tag_referencer:  # 如果有引用关系
-            self._prompt = self._prompt.replace('{has_relationship}',
+            self._fill('{has_relationship}',
                                                 'And please include the reference relationship with its callers or callees in the project from a functional perspective')  # 添加引用关系说明
         else:  # 如果没有引用关系
-            self._prompt = self._prompt.replace('{has_relationship}', '')  # 清空相关占位符
-            self._prompt = self._prompt.replace('{example}', '')  # 清空示例占位符
+            self._fill('{has_relationship}', '')  # 清空相关占位符
+            self._fill('{example}', '')  # 清空示例占位符
         if self._tag_referencer:  # 如果有引用当前函数的函数
-            self._prompt = self._prompt.replace('{example}', 'You can refer to the use of this Function in the caller.')  # 添加示例参考说明
-        return self._prompt  # 返回完整的提示字符串
+            self._fill('{example}', 'You can refer to the use of this Function in the caller.')  # 添加示例参考说明
+        return ''.join(self._parts)  # 返回完整的提示字符串
+
+    def build_messages(self) -> Tuple[str, str]:
+        """
+        构建前缀缓存友好的提示，静态的角色说明与格式要求在前，目标函数的代码与调用关系在后
+        
+        Returns:
+            (静态部分, 可变部分)
+        """
+        self.build()  # 完成剩余占位符的替换
+        role, target, fmt = self._parts
+        return role + fmt, target
 
     def parameters(self, params: List[FieldDef]):
         """
@@ -211,13 +529,13 @@ class _FunctionPromptBuilder:
             self，用于链式调用
         """
         if len(params):  # 如果有参数
-            self._prompt = self._prompt.replace('{parameters}', prefix_with(
+            self._fill('{parameters}', prefix_with(
                 '#### Parameters\n'
                 '- Parameter1: XXX\n'
                 '- Parameter2: XXX\n'
                 '- ...\n', '> '))  # 添加参数部分的格式
         else:  # 如果没有参数
-            self._prompt = self._prompt.replace('{parameters}', '')  # 清空参数占位符
+            self._fill('{parameters}', '')  # 清空参数占位符
         return self  # 返回self用于链式调用
 
     def code(self, code: str):
@@ -230,5 +548,5 @@ class _FunctionPromptBuilder:
         Returns:
             self，用于链式调用
         """
-        self._prompt = self._prompt.replace('{code}', code)  # 替换模板中的代码占位符
+        self._fill('{code}', code)  # 替换模板中的代码占位符
         return self  # 返回self用于链式调用
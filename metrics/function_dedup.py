@@ -0,0 +1,167 @@
+import ast  # 导入ast模块，用于规范化Python函数
+import hashlib  # 导入hashlib模块，用于计算代码哈希
+import re  # 导入正则表达式模块，用于去除注释与替换函数名
+import textwrap  # 导入textwrap模块，用于去除Python方法的缩进
+import threading  # 导入threading模块，用于保护统计计数
+from collections import defaultdict  # 导入默认字典，用于按阶段计数与分组
+from typing import Dict, Iterable, List, Optional  # 导入类型提示工具
+
+import networkx as nx  # 导入networkx库，用于检查依赖关系
+from loguru import logger  # 导入日志记录工具
+
+from utils.common import LangEnum  # 导入语言枚举
+from utils.retry import current_stage  # 导入当前的LLM调用阶段
+from utils.settings import ProjectSettings  # 导入项目设置
+from .doc import ApiDoc  # 导入API文档类
+from .metric import FuncDef  # 导入函数定义类
+
+_C_COMMENT = re.compile(r'//[^\n]*|/\*.*?\*/', re.S)  # C/C++注释
+_MD_CODE = re.compile(r'```.*?```|`[^`\n]+`', re.S)  # Markdown中的代码块与行内代码
+
+
+# 相同函数体的去重
+class FunctionDedup:
+    """
+    相同函数体的去重
+
+    第三方代码、宏生成的函数与重载函数常有完全相同的代码。去除注释与空白差异并将函数名替换为占位符后，
+    按代码、参数类型与所调用的函数的哈希分组，每组只为一个函数生成文档，其他函数复制该文档并替换函数名
+    """
+    _groups: Dict[str, int] = defaultdict(int)  # 各阶段的重复组数
+    _cloned: Dict[str, int] = defaultdict(int)  # 各阶段复制文档的函数数
+    _lock = threading.Lock()
+
+    @classmethod
+    def _short_name(cls, symbol: str) -> str:
+        """
+        函数符号名中不含命名空间与类名的部分
+
+        Args:
+            symbol: 函数符号名，如ns::A::f或pkg.mod.f
+
+        Returns:
+            函数名，如f
+        """
+        return re.split(r'::|\.', symbol)[-1]
+
+    @classmethod
+    def fingerprint(cls, symbol: str, f: FuncDef, lang: LangEnum, callees: Iterable[str] = ()) -> str:
+        """
+        计算函数的内容哈希，注释、空白与函数名的差异不影响结果
+
+        Args:
+            symbol: 函数符号名
+            f: 函数定义
+            lang: 编程语言
+            callees: 调用图中该函数调用的函数，代码相同但调用不同函数（如不同命名空间中的同名函数）时不能共用文档
+
+        Returns:
+            十六进制哈希值
+        """
+        name = cls._short_name(symbol)
+        code = None
+        if lang == LangEnum.python:
+            try:
+                tree = ast.parse(textwrap.dedent(f.code))
+                for node in ast.walk(tree):
+                    if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)) and node.name == name:
+                        node.name = '_'
+                code = ast.dump(tree)  # AST不含注释与格式
+            except SyntaxError:
+                pass
+        if code is None:
+            code = ' '.join(_C_COMMENT.sub('', f.code).split())
+            code = re.sub(r'(?<=\W) | (?=\W)', '', code)  # 只保留两个单词之间的空白
+        code = re.sub(rf'(?<!\w){re.escape(name)}(?!\w)', '\0', code)  # 函数名（含递归调用）替换为占位符
+        signature = ','.join(p.symbol for p in f.params)
+        callees = ','.join(sorted('\0' if c == symbol else c for c in callees))  # 递归调用替换为占位符
+        return hashlib.sha256(f'{signature}\n{callees}\n{code}'.encode()).hexdigest()
+
+    @classmethod
+    def duplicates(cls, ctx) -> Dict[str, str]:
+        """
+        找出与其他函数代码相同的函数
+
+        Args:
+            ctx: 评估上下文对象
+
+        Returns:
+            尚无文档的重复函数到同组中生成文档的函数的映射，重复函数依赖后者不会形成环，未开启去重时为空
+        """
+        if not ProjectSettings().function_dedup:
+            return {}
+        groups: Dict[str, List[str]] = defaultdict(list)  # 哈希到函数列表的映射
+        for symbol in sorted(ctx.callgraph.nodes):
+            groups[cls.fingerprint(symbol, ctx.func(symbol), ctx.lang, ctx.callgraph.successors(symbol))].append(symbol)
+        res = {}
+        count = 0
+        graph = None  # 调用图加上重复函数对生成文档的函数的依赖
+        for symbols in groups.values():
+            if len(symbols) < 2:
+                continue
+            documented = [s for s in symbols if ctx.load_function_doc(s)]
+            origin = documented[0] if documented else symbols[0]  # 优先复制已有的文档
+            members = [s for s in symbols if s != origin and s not in documented]
+            graph = graph or ctx.callgraph.copy()
+            for s in members:
+                if nx.has_path(graph, origin, s):  # 生成文档的函数依赖该函数时无法等待，单独生成
+                    continue
+                graph.add_edge(s, origin)
+                res[s] = origin
+            if any(res.get(s) == origin for s in members):
+                count += 1
+        with cls._lock:
+            cls._groups[current_stage()] += count
+        if res:
+            logger.info(f'[FunctionDedup] {len(res)} functions share code with others in {count} groups')
+        return res
+
+    @classmethod
+    def clone(cls, ctx, origin: str, symbol: str) -> Optional[ApiDoc]:
+        """
+        复制同组函数的文档并替换函数名，保存为当前函数的文档
+
+        Args:
+            ctx: 评估上下文对象
+            origin: 已生成文档的函数符号名
+            symbol: 当前函数符号名
+
+        Returns:
+            复制的文档，同组函数没有文档时返回None
+        """
+        doc: ApiDoc = ctx.load_function_doc(origin)
+        if doc is None:
+            return None
+        md = doc.markdown().split('\n', 1)[1]  # 去除标题
+        full = re.compile(rf'(?<![\w:.]){re.escape(origin)}(?!\w)')
+        short = re.compile(rf'(?<!\w){re.escape(cls._short_name(origin))}(?!\w)')
+
+        def rename(m: re.Match) -> str:
+            # 代码中的函数名一定是标识符，可以替换不含命名空间的函数名
+            return short.sub(cls._short_name(symbol), full.sub(symbol, m.group(0)))
+
+        parts, last = [], 0
+        for m in _MD_CODE.finditer(md):
+            prose = md[last:m.start()]
+            # 正文中不含命名空间的函数名可能是普通单词（如get、run），只替换完整的符号名
+            parts.append(full.sub(symbol, prose) if origin != cls._short_name(origin) else prose)
+            parts.append(rename(m))
+            last = m.end()
+        prose = md[last:]
+        parts.append(full.sub(symbol, prose) if origin != cls._short_name(origin) else prose)
+        res = ApiDoc.from_chapter(f'### {symbol}\n{"".join(parts)}')
+        ctx.save_function_doc(symbol, res)
+        with cls._lock:
+            cls._cloned[current_stage()] += 1
+        logger.info(f'[FunctionDedup] clone {origin} to {symbol}')
+        return res
+
+    @classmethod
+    def report(cls):
+        """
+        输出各阶段的去重统计
+        """
+        with cls._lock:
+            for stage, groups in cls._groups.items():
+                logger.info(f'[FunctionDedup] {stage}: {groups} duplicate groups, '
+                            f'{cls._cloned[stage]} docs cloned without LLM calls')
@@ -0,0 +1,255 @@
+import ast  # 导入ast模块，用于解析Python函数
+import re  # 导入正则表达式模块，用于识别C/C++语句
+import textwrap  # 导入textwrap模块，用于去除Python方法的缩进
+import threading  # 导入threading模块，用于保护统计计数
+from collections import defaultdict  # 导入默认字典，用于按阶段计数
+from typing import Any, Callable, Dict, Optional  # 导入类型提示工具
+
+from loguru import logger  # 导入日志记录工具
+
+from utils import ChatCompletionSettings  # 导入聊天设置，用于确定文档语言
+from utils.common import LangEnum  # 导入语言枚举
+from utils.retry import current_stage  # 导入当前的LLM调用阶段
+from utils.settings import ProjectSettings  # 导入项目设置
+from .doc import ApiDoc  # 导入API文档类
+from .metric import FuncDef  # 导入函数定义类
+
+# 成员访问路径，如x、this->x、obj.x.y
+_C_PATH = r'(?:\(\s*\*\s*this\s*\)\s*\.\s*|this\s*->\s*)?[A-Za-z_]\w*(?:\s*(?:\.|->)\s*[A-Za-z_]\w*)*'
+# 字面量常量
+_C_LITERAL = r'-?\d[\w.]*|true|false|nullptr|NULL|"(?:[^"\\]|\\.)*"|\'(?:[^\'\\]|\\.)*\''
+_C_COMMENT = re.compile(r'//[^\n]*|/\*.*?\*/', re.S)  # C/C++注释
+_C_GETTER = re.compile(rf'return\s+\(?\s*({_C_PATH})\s*\)?')  # 返回成员或变量
+_C_CONSTANT = re.compile(rf'return\s+({_C_LITERAL})')  # 返回常量
+_C_SETTER = re.compile(rf'({_C_PATH})\s*=\s*([A-Za-z_]\w*)')  # 将参数赋给成员或变量
+_C_FORWARD = re.compile(r'(return\s+)?([A-Za-z_][\w:]*(?:\s*(?:\.|->)\s*[A-Za-z_]\w*)*)\s*\(([^()]*)\)')  # 原样转发参数的调用
+# 形如函数调用的关键字与运算符，不是转发的目标
+_C_KEYWORDS = {'return', 'if', 'while', 'for', 'switch', 'do', 'case', 'throw', 'delete', 'new', 'sizeof', 'alignof',
+               '_Alignof', 'alignas', '_Alignas', 'decltype', 'typeof', '__typeof__', 'typeid', 'noexcept',
+               'static_assert', '_Static_assert', 'static_cast', 'dynamic_cast', 'const_cast', 'reinterpret_cast',
+               'co_return', 'co_await', 'co_yield', 'defined', 'offsetof', '__builtin_offsetof'}
+
+# 模板文档，按MODEL_LANGUAGE选择，各类别为描述与代码细节的模板：empty空实现、constant返回常量、getter返回成员、
+# setter设置成员、forward转发调用，returns为转发调用返回结果时的补充，param为参数说明
+_TEMPLATES: Dict[str, Dict[str, Any]] = {
+    'chinese': {
+        'empty': ('`{name}`为空实现，不执行任何操作。', '函数体为空，调用后直接返回，没有副作用。'),
+        'constant': ('返回常量`{target}`。', '函数体只有一条返回语句，总是返回`{target}`，不读取或修改任何状态。'),
+        'getter': ('返回`{target}`的值。', '函数体只有一条返回语句，直接返回`{target}`，不修改任何状态。'),
+        'setter': ('将`{target}`设置为参数`{value}`的值。', '函数体只有一条赋值语句，将参数`{value}`赋给`{target}`。'),
+        'forward': ('调用`{target}`{returns}。', '函数体只有一次对`{target}`的调用，参数原样传递{returns}。'),
+        'returns': '并返回其结果',
+        'param': '`{symbol}`类型的参数',
+    },
+    'english': {
+        'empty': ('`{name}` is an empty implementation that does nothing.',
+                  'The function body is empty, so it returns immediately without side effects.'),
+        'constant': ('Returns the constant `{target}`.',
+                     'The function body is a single return statement that always returns `{target}` '
+                     'without reading or modifying any state.'),
+        'getter': ('Returns the value of `{target}`.',
+                   'The function body is a single return statement that returns `{target}` '
+                   'without modifying any state.'),
+        'setter': ('Sets `{target}` to the value of the parameter `{value}`.',
+                   'The function body is a single assignment of the parameter `{value}` to `{target}`.'),
+        'forward': ('Calls `{target}`{returns}.',
+                    'The function body is a single call to `{target}` that passes the arguments through{returns}.'),
+        'returns': ' and returns its result',
+        'param': 'Parameter of type `{symbol}`',
+    },
+}
+
+
+# 平凡函数的模板文档
+class FunctionTemplate:
+    """
+    平凡函数的模板文档
+
+    识别空实现、返回常量、getter、setter与原样转发参数的包装函数，直接按模板生成文档，不调用LLM。
+    Python函数按AST识别，C/C++函数按函数体的语句启发式识别
+    """
+    _avoided: Dict[str, int] = defaultdict(int)  # 各阶段避免的LLM调用次数
+    _documented: Dict[str, int] = defaultdict(int)  # 各阶段按模板生成文档的函数数
+    _lock = threading.Lock()
+
+    @classmethod
+    def classify(cls, f: FuncDef, lang: LangEnum) -> Optional[Dict[str, Any]]:
+        """
+        判断函数是否可以按模板描述
+
+        Args:
+            f: 函数定义
+            lang: 编程语言
+
+        Returns:
+            函数的类别kind与模板参数，不是平凡函数时返回None
+        """
+        params = {p.name for p in f.params}
+        if lang == LangEnum.python:
+            return cls._classify_python(f.code, params)
+        return cls._classify_c(f.code, params)
+
+    @classmethod
+    def _classify_python(cls, code: str, params: set) -> Optional[Dict[str, Any]]:
+        """
+        按AST识别Python平凡函数
+
+        Args:
+            code: 函数源代码
+            params: 参数名集合，与函数签名中的参数合并
+
+        Returns:
+            函数的类别与模板参数
+        """
+        try:
+            tree = ast.parse(textwrap.dedent(code))
+        except SyntaxError:
+            return None
+        if len(tree.body) != 1 or not isinstance(tree.body[0], (ast.FunctionDef, ast.AsyncFunctionDef)):
+            return None
+        node = tree.body[0]
+        a = node.args
+        params = params | {p.arg for p in a.posonlyargs + a.args + a.kwonlyargs}
+        params |= {p.arg for p in (a.vararg, a.kwarg) if p is not None}
+        body = node.body
+        if body and isinstance(body[0], ast.Expr) and isinstance(body[0].value, ast.Constant) \
+                and isinstance(body[0].value.value, str):  # 去除文档字符串
+            body = body[1:]
+        body = [s for s in body if not isinstance(s, ast.Pass)
+                and not (isinstance(s, ast.Expr) and isinstance(s.value, ast.Constant) and s.value.value is ...)]
+        if not body:
+            return {'kind': 'empty'}
+        if len(body) != 1:
+            return None
+        s = body[0]
+        if isinstance(s, ast.Return) and s.value is not None:
+            if isinstance(s.value, ast.Constant):
+                return {'kind': 'constant', 'target': ast.unparse(s.value)}
+            if cls._is_path(s.value):
+                return {'kind': 'getter', 'target': ast.unparse(s.value)}
+        if isinstance(s, ast.Assign) and len(s.targets) == 1 and cls._is_path(s.targets[0]) \
+                and isinstance(s.value, ast.Name) and s.value.id in params:
+            return {'kind': 'setter', 'target': ast.unparse(s.targets[0]), 'value': s.value.id}
+        if isinstance(s, (ast.Return, ast.Expr)) and isinstance(s.value, ast.Call) and cls._is_path(s.value.func):
+            call = s.value
+            args = [a.value if isinstance(a, ast.Starred) else a for a in call.args] + [k.value for k in call.keywords]
+            if all(isinstance(a, ast.Name) and a.id in params for a in args):
+                return {'kind': 'forward', 'target': ast.unparse(call.func), 'returns': isinstance(s, ast.Return)}
+        return None
+
+    @classmethod
+    def _is_path(cls, node: ast.AST) -> bool:
+        """
+        判断表达式是否为变量或属性访问，如x、self.x.y
+
+        Args:
+            node: 表达式节点
+
+        Returns:
+            是否为变量或属性访问
+        """
+        while isinstance(node, ast.Attribute):
+            node = node.value
+        return isinstance(node, ast.Name)
+
+    @classmethod
+    def _classify_c(cls, code: str, params: set) -> Optional[Dict[str, Any]]:
+        """
+        按函数体的语句启发式识别C/C++平凡函数
+
+        Args:
+            code: 函数源代码
+            params: 参数名集合
+
+        Returns:
+            函数的类别与模板参数
+        """
+        code = _C_COMMENT.sub('', code)
+        start, end = code.find('{'), code.rfind('}')
+        if start < 0 or end < start:  # 只有声明
+            return None
+        if re.search(r'\)\s*[^;{}]*:', code[:start].replace('::', '')):  # 构造函数的初始化列表
+            return None
+        body = code[start + 1:end]
+        if '{' in body or '}' in body:  # 包含代码块
+            return None
+        statements = [s.strip() for s in body.split(';') if s.strip()]
+        if not statements:
+            return {'kind': 'empty'}
+        if len(statements) != 1:
+            return None
+        s = ' '.join(statements[0].split())
+        if m := _C_CONSTANT.fullmatch(s):
+            return {'kind': 'constant', 'target': m.group(1)}
+        if m := _C_GETTER.fullmatch(s):
+            return {'kind': 'getter', 'target': m.group(1)}
+        if (m := _C_SETTER.fullmatch(s)) and m.group(2) in params:
+            return {'kind': 'setter', 'target': m.group(1), 'value': m.group(2)}
+        if m := _C_FORWARD.fullmatch(s):
+            args = [a.strip() for a in m.group(3).split(',') if a.strip()]
+            if m.group(2) not in _C_KEYWORDS and all(a in params for a in args):
+                return {'kind': 'forward', 'target': m.group(2), 'returns': m.group(1) is not None}
+        return None
+
+    @classmethod
+    def doc(cls, symbol: str, f: FuncDef, lang: LangEnum) -> Optional[ApiDoc]:
+        """
+        为平凡函数按模板生成文档
+
+        Args:
+            symbol: 函数符号名
+            f: 函数定义
+            lang: 编程语言
+
+        Returns:
+            函数文档，不是平凡函数或文档语言没有模板时返回None
+        """
+        templates = _TEMPLATES.get(ChatCompletionSettings().language.lower())
+        if templates is None:
+            return None
+        kind = cls.classify(f, lang)
+        if kind is None:
+            return None
+        args = dict(kind, name=symbol, returns=templates['returns'] if kind.get('returns') else '')
+        description, detail = (t.format(**args) for t in templates[kind['kind']])
+        parameters = '\n'.join(f'- {p.name}: ' + templates['param'].format(symbol=p.symbol) for p in f.params)
+        return ApiDoc(name=symbol, description=description, detail=detail, parameters=parameters or None)
+
+    @classmethod
+    def eva(cls, ctx, save: Callable[[str, ApiDoc], None], calls: int = 1):
+        """
+        为尚无文档的平凡函数按模板生成文档，在调用LLM生成其他函数的文档前执行，调用者可以引用这些文档
+
+        Args:
+            ctx: 评估上下文对象
+            save: 保存文档的函数，参数为函数符号名与文档
+            calls: 每个函数避免的LLM调用次数
+        """
+        if not ProjectSettings().function_template:
+            return
+        if ChatCompletionSettings().language.lower() not in _TEMPLATES:
+            logger.warning(f'[FunctionTemplate] no templates for {ChatCompletionSettings().language}, skipped')
+            return
+        count = 0
+        for symbol in ctx.callgraph.nodes:
+            if ctx.load_function_doc(symbol):
+                continue
+            doc = cls.doc(symbol, ctx.func(symbol), ctx.lang)
+            if doc is not None:
+                save(symbol, doc)
+                count += 1
+        stage = current_stage()
+        with cls._lock:
+            cls._documented[stage] += count
+            cls._avoided[stage] += count * calls
+        logger.info(f'[FunctionTemplate] {count} trivial functions documented from templates')
+
+    @classmethod
+    def report(cls):
+        """
+        输出各阶段避免的LLM调用次数
+        """
+        with cls._lock:
+            for stage, avoided in cls._avoided.items():
+                logger.info(f'[FunctionTemplate] {stage}: {cls._documented[stage]} trivial functions, '
+                            f'{avoided} LLM calls avoided')
@@ -1,12 +1,13 @@
 import os.path  # 导入os.path模块，用于文件路径操作
-from functools import reduce  # 导入reduce函数，用于对序列进行累积操作
-from typing import List  # 导入List类型，用于类型注解
+from typing import List, Tuple  # 导入List、Tuple类型，用于类型注解
 
 import networkx as nx  # 导入networkx库，用于处理图结构
 from loguru import logger  # 导入loguru的logger，用于日志记录
 
 from utils import SimpleLLM, ChatCompletionSettings, prefix_with, TaskDispatcher, llm_thread_pool  # 导入工具函数和类
 from .doc import ApiDoc  # 导入API文档类
+from .function import pack_function_docs  # 导入调用者文档的token预算选择
+from .function_template import FunctionTemplate  # 导入平凡函数的模板文档
 from .metric import Metric, FieldDef, FuncDef  # 导入度量相关类和数据结构
 
 documentation_guideline = (
@@ -39,117 +40,137 @@ class FunctionV2Metric(Metric):
     def eva(self, ctx):
         """执行函数文档生成流程
         
-        先生成草稿文档，然后进行修订优化
+        先生成草稿文档，然后进行修订优化，两个阶段在同一个任务图中流水执行
         
         Args:
             ctx: 评估上下文对象
         """
-        self._draft(ctx)  # 生成草稿文档
-        self._revise(ctx)  # 修订优化文档
+        # 平凡函数按模板生成文档，同时跳过草稿与修订
+        FunctionTemplate.eva(ctx, lambda s, doc: self._save_template(ctx, s, doc), calls=2)
+        callgraph = ctx.callgraph  # 获取调用图
+        logger.info(f'[FunctionV2Metric] gen doc for functions, functions count: {len(callgraph)}')
+        # 草稿与修订合并为一个任务图，节点为(阶段, 函数)：函数的修订依赖自身的草稿与调用者的修订。
+        # 草稿读取的被调用者最终文档要等当前函数修订之后才会生成，草稿之间无需互相等待，
+        # 因此根函数的草稿完成后即可开始修订，不必等待所有草稿完成
+        graph = nx.DiGraph()
+        for symbol in callgraph.nodes:
+            graph.add_edge(('revise', symbol), ('draft', symbol))
+        for caller, callee in callgraph.edges:
+            graph.add_edge(('revise', callee), ('revise', caller))
+
+        def gen(node: Tuple[str, str]):
+            """执行单个函数的草稿或修订
+            
+            Args:
+                node: (阶段, 函数符号名)
+            """
+            phase, symbol = node
+            if phase == 'draft':
+                self._draft(ctx, symbol)  # 生成草稿文档
+            else:
+                self._revise(ctx, symbol)  # 修订优化文档
+
+        # 使用任务分发器并行处理所有任务，以源代码长度估计耗时，关键路径上的任务优先执行
+        TaskDispatcher(llm_thread_pool).map(graph, gen, cost=lambda n: len(ctx.func(n[1]).code)).run()
+
+    @classmethod
+    def _save_template(cls, ctx, symbol: str, doc: ApiDoc):
+        """保存按模板生成的文档，同时作为草稿与最终文档
+        
+        Args:
+            ctx: 评估上下文对象
+            symbol: 函数符号名称
+            doc: 模板文档
+        """
+        f: FuncDef = ctx.func(symbol)  # 获取函数定义
+        doc.code = f'```{ctx.lang.markdown}\n{f.code}\n```'  # 添加代码部分
+        ctx.save_doc(cls.get_v2_draft_filename(ctx, f.filename), doc)  # 保存文档草稿
+        ctx.save_function_doc(symbol, doc)  # 保存最终文档
 
     @classmethod
-    def _draft(cls, ctx):
+    def _draft(cls, ctx, symbol: str):
         """生成函数文档草稿
         
         根据函数代码和被调用的函数信息生成初步文档
         
         Args:
             ctx: 评估上下文对象
+            symbol: 函数符号名称
         """
         callgraph = ctx.callgraph  # 获取调用图
-        # 逆拓扑排序callgraph
-        logger.info(f'[FunctionV2Metric] gen doc for functions, functions count: {len(callgraph)}')
-
-        # 生成文档
-        def gen(symbol: str):
-            """为单个函数生成文档草稿
-            
-            Args:
-                symbol: 函数符号名称
-            """
-            f: FuncDef = ctx.func(symbol)  # 获取函数定义
-            if ctx.load_doc(symbol, cls.get_v2_draft_filename(ctx, f.filename), ApiDoc):
-                # 如果文档已存在，则跳过生成
-                logger.info(f'[FunctionV2Metric] load {symbol}')
-                return
-            # 获取当前函数调用的所有函数的文档
-            referenced = list(
-                filter(lambda s: s is not None,
-                       map(lambda s: ctx.load_function_doc(s), callgraph.successors(symbol)))
-            )
-            # 构建提示模板
-            prompt = _FunctionPromptBuilder().parameters(f.params).code(f.code).referenced(
-                referenced).lang(ctx.lang.markdown).name(symbol).build()
-            # 使用大模型生成文档
-            res = SimpleLLM(ChatCompletionSettings()).add_system_msg(prompt).add_user_msg(documentation_guideline).ask()
-            res = f'### {symbol}\n' + res  # 添加函数标题
-            doc = ApiDoc.from_chapter(res)  # 将文本转换为ApiDoc对象
-            doc.code = f'```{ctx.lang.markdown}\n{f.code}\n```'  # 添加代码部分
-            ctx.save_doc(cls.get_v2_draft_filename(ctx, f.filename), doc)  # 保存文档草稿
-            logger.info(f'[FunctionV2Metric] parse {symbol}')
-
-        # 使用任务分发器并行处理所有函数
-        TaskDispatcher(llm_thread_pool).map(callgraph, gen).run()
+        f: FuncDef = ctx.func(symbol)  # 获取函数定义
+        if ctx.load_doc(symbol, cls.get_v2_draft_filename(ctx, f.filename), ApiDoc):
+            # 如果文档已存在，则跳过生成
+            logger.info(f'[FunctionV2Metric] load {symbol}')
+            return
+        # 获取当前函数调用的所有函数的文档
+        referenced = list(
+            filter(lambda s: s is not None,
+                   map(lambda s: ctx.load_function_doc(s), callgraph.successors(symbol)))
+        )
+        # 构建提示模板
+        prompt = _FunctionPromptBuilder().parameters(f.params).code(f.code).referenced(
+            referenced).lang(ctx.lang.markdown).name(symbol).build()
+        # 使用大模型生成文档
+        res = SimpleLLM(ChatCompletionSettings()).add_system_msg(prompt).add_user_msg(documentation_guideline).ask()
+        res = f'### {symbol}\n' + res  # 添加函数标题
+        doc = ApiDoc.from_chapter(res)  # 将文本转换为ApiDoc对象
+        doc.code = f'```{ctx.lang.markdown}\n{f.code}\n```'  # 添加代码部分
+        ctx.save_doc(cls.get_v2_draft_filename(ctx, f.filename), doc)  # 保存文档草稿
+        logger.info(f'[FunctionV2Metric] parse {symbol}')
 
     @classmethod
-    def _revise(cls, ctx):
+    def _revise(cls, ctx, symbol: str):
         """修订函数文档
         
-        根据调用当前函数的其他函数的信息来优化文档质量
+        根据调用当前函数的其他函数的信息来优化文档质量，需在自身草稿与调用者的修订完成后执行
         
         Args:
             ctx: 评估上下文对象
+            symbol: 函数符号名称
         """
         callgraph = ctx.callgraph  # 获取调用图
-        logger.info(f'[FunctionV2Metric] revise doc for functions, functions count: {len(callgraph)}')
-
-        # 生成文档
-        def gen(symbol: str):
-            """为单个函数修订文档
-            
-            Args:
-                symbol: 函数符号名称
-            """
-            if ctx.load_function_doc(symbol):
-                # 如果最终文档已存在，则跳过修订
-                logger.info(f'[FunctionV2Metric] load revised {symbol}')
-                return
-            f: FuncDef = ctx.func(symbol)  # 获取函数定义
-            # 获取调用当前函数的所有函数的文档
-            referencer: List[ApiDoc] = list(
-                filter(lambda s: s is not None,
-                       map(lambda s: ctx.load_function_doc(s), callgraph.predecessors(symbol)))
-            )
-            # 加载文档草稿
-            draft_doc = ctx.load_doc(symbol, cls.get_v2_draft_filename(ctx, f.filename), ApiDoc)
-            if len(referencer) == 0:
-                # 如果没有调用当前函数的其他函数，直接使用草稿文档
-                ctx.save_function_doc(symbol, draft_doc)
-                return
-            # 构建修订提示模板
-            prompt = doc_revised_prompt.format(referencer=reduce(
-                lambda x, y: x + y,
-                map(lambda r: f'**Function**: `{r.name}`\n\n**Document**:\n\n{prefix_with(r.markdown(), "> ")}\n---\n',
-                    referencer)),
-                lang = ctx.lang.markdown,
-                parameters = prefix_with(
-                    '#### Parameters\n'
-                    '- Parameter1: XXX\n'
-                    '- Parameter2: XXX\n'
-                    '- ...', '> ' if len(f.params) else '\n').strip(),
-                function_doc=prefix_with(draft_doc.markdown(), '> '))
-            # 使用大模型修订文档
-            res = SimpleLLM(ChatCompletionSettings()).add_system_msg(prompt).add_user_msg(documentation_guideline).ask(
-                lambda x: x[x.find('#### Description'):] # 去除标题
-            )
-            res = f'### {symbol}\n' + res  # 添加函数标题
-            doc: ApiDoc = ApiDoc.from_chapter(res)  # 将文本转换为ApiDoc对象
-            doc.code = f'```{ctx.lang.markdown}\n{f.code}\n```'  # 添加代码部分
-            ctx.save_function_doc(symbol, doc)  # 保存最终文档
-            logger.info(f'[FunctionV2Metric] revise {symbol}')
-
-        # 使用任务分发器并行处理所有函数，注意这里使用反向调用图
-        TaskDispatcher(llm_thread_pool).map(nx.reverse(callgraph), gen).run()
+        if ctx.load_function_doc(symbol):
+            # 如果最终文档已存在，则跳过修订
+            logger.info(f'[FunctionV2Metric] load revised {symbol}')
+            return
+        f: FuncDef = ctx.func(symbol)  # 获取函数定义
+        # 获取调用当前函数的所有函数的文档
+        referencer: List[ApiDoc] = list(
+            filter(lambda s: s is not None,
+                   map(lambda s: ctx.load_function_doc(s), callgraph.predecessors(symbol)))
+        )
+        # 加载文档草稿
+        draft_doc = ctx.load_doc(symbol, cls.get_v2_draft_filename(ctx, f.filename), ApiDoc)
+        if len(referencer) == 0:
+            # 如果没有调用当前函数的其他函数，直接使用草稿文档
+            ctx.save_function_doc(symbol, draft_doc)
+            return
+        # 在token预算内选择调用者的文档
+        render = lambda r: f'**Function**: `{r.name}`\n\n**Document**:\n\n{prefix_with(r.markdown(), "> ")}\n---\n'
+        referencer = pack_function_docs(ctx, referencer, render)
+        if len(referencer) == 0:
+            # 预算内放不下任何调用者的文档时，同样直接使用草稿文档
+            ctx.save_function_doc(symbol, draft_doc)
+            return
+        # 构建修订提示模板
+        prompt = doc_revised_prompt.format(referencer=''.join(map(render, referencer)),
+            lang = ctx.lang.markdown,
+            parameters = prefix_with(
+                '#### Parameters\n'
+                '- Parameter1: XXX\n'
+                '- Parameter2: XXX\n'
+                '- ...', '> ' if len(f.params) else '\n').strip(),
+            function_doc=prefix_with(draft_doc.markdown(), '> '))
+        # 使用大模型修订文档
+        res = SimpleLLM(ChatCompletionSettings()).add_system_msg(prompt).add_user_msg(documentation_guideline).ask(
+            lambda x: x[x.find('#### Description'):] # 去除标题
+        )
+        res = f'### {symbol}\n' + res  # 添加函数标题
+        doc: ApiDoc = ApiDoc.from_chapter(res)  # 将文本转换为ApiDoc对象
+        doc.code = f'```{ctx.lang.markdown}\n{f.code}\n```'  # 添加代码部分
+        ctx.save_function_doc(symbol, doc)  # 保存最终文档
+        logger.info(f'[FunctionV2Metric] revise {symbol}')
 
 # Currently, you are in a project and the related hierarchical structure of this project is as follows:
 # {project_structure}
@@ -0,0 +1,258 @@
+import os  # 导入os模块，用于处理文件路径
+import re  # 导入正则表达式模块，用于解析diff的hunk头
+import subprocess  # 导入subprocess模块，用于调用git
+from collections import defaultdict  # 导入默认字典，用于按文档文件分组
+from typing import Dict, Iterable, List, Optional, Set, Tuple  # 导入类型提示工具
+
+import networkx as nx  # 导入networkx库，用于沿调用图传播失效
+from loguru import logger  # 导入日志记录工具
+
+from utils.settings import ProjectSettings  # 导入项目设置
+from .doc import ApiDoc, ClazzDoc, ModuleDoc, RepoDoc  # 导入文档类
+from .function_v2 import FunctionV2Metric  # 导入函数文档V2，用于定位函数文档草稿
+from .metric import Metric, EvaContext  # 导入度量基类与评估上下文
+from .module import ModuleMetric  # 导入模块度量，用于定位模块文档草稿
+from .module_v2 import ModuleV2Metric  # 导入模块度量V2，用于定位模块文档草稿
+from .repo import RepoMetric  # 导入仓库度量，用于定位仓库文档草稿与问答
+
+_HUNK = re.compile(r'@@ -\d+(?:,\d+)? \+(\d+)(?:,(\d+))? @@')  # diff的hunk头，取新文件中的起始行与行数
+
+
+# 基于git diff的增量更新，在解析之后、生成文档之前使受影响的文档失效
+class IncrementalUpdate(Metric):
+    """
+    增量更新
+
+    比较两个版本的代码，将变更的行映射到函数与类，删除它们的文档以及提示中嵌入了这些文档的文档：
+    FunctionMetric的提示包含被调用者的文档，因此失效沿调用图传播到调用者；FunctionV2Metric的修订包含调用者的文档，
+    因此失效也传播到被调用者，传播层数由INCREMENTAL_DEPTH控制。类文档包含成员函数与所引用类的文档，随之失效。
+    模块与仓库文档只在模块的成员（对外可见的函数）增删时重新生成。之后的度量阶段按已有文档跳过的逻辑只重新生成被删除的文档
+    """
+
+    def __init__(self, repo_path: str, since: str, until: Optional[str] = None):
+        """
+        初始化增量更新
+
+        Args:
+            repo_path: 原始代码仓库路径，需位于git仓库中
+            since: 上次生成文档时的版本
+            until: 本次生成文档的版本，为None时与工作区比较，指定时应与当前检出的代码一致
+        """
+        self._repo_path = repo_path
+        self._since = since
+        self._until = until
+
+    def _git(self, *args: str) -> str:
+        """
+        在原始代码仓库中执行git命令
+
+        Args:
+            args: git命令参数
+
+        Returns:
+            命令的标准输出
+        """
+        return subprocess.run(['git', '-C', self._repo_path, '-c', 'core.quotepath=off', *args],
+                              capture_output=True, text=True, check=True).stdout
+
+    def _diff(self) -> Dict[str, Optional[List[Tuple[int, int]]]]:
+        """
+        比较两个版本，获取每个变更文件在新版本中变更的行范围
+
+        Returns:
+            文件路径（相对于代码仓库路径）到变更行范围（首尾行号，含两端）列表的映射，被删除的文件映射为None
+        """
+        revisions = [self._since] + ([self._until] if self._until else [])
+        out = self._git('diff', '--unified=0', '--no-renames', '--relative', *revisions)
+        changes: Dict[str, Optional[List[Tuple[int, int]]]] = {}
+        old, path = None, None
+        for line in out.splitlines():
+            if line.startswith('--- '):
+                old = line[4:]
+            elif line.startswith('+++ '):
+                if line[4:] == '/dev/null':  # 文件被删除
+                    path = old[2:]
+                    changes[path] = None
+                else:
+                    path = line[6:]  # 去除b/前缀
+                    changes.setdefault(path, [])
+            elif line.startswith('@@') and path is not None and changes.get(path) is not None:
+                m = _HUNK.match(line)
+                if m is None:
+                    continue
+                start, count = int(m.group(1)), int(m.group(2) or 1)
+                # 只删除行时，count为0，start为删除位置的前一行，标记前后两行使包含删除位置的函数失效
+                changes[path].append((start, start + count - 1) if count else (start, start + 1))
+        return changes
+
+    def _read(self, ctx: EvaContext, path: str) -> str:
+        """
+        读取变更文件在新版本中的内容
+
+        Args:
+            ctx: 评估上下文对象
+            path: 文件路径
+
+        Returns:
+            文件内容，读取失败时为空
+        """
+        try:
+            if self._until:
+                return self._git('show', f'{self._until}:./{path}')
+            with open(os.path.join(ctx.resource_path, path), 'r') as t:
+                return t.read()
+        except (OSError, UnicodeDecodeError, subprocess.CalledProcessError):
+            return ''
+
+    @classmethod
+    def _match(cls, filename: str, paths: Iterable[str]) -> Optional[str]:
+        """
+        查找符号所在的变更文件
+
+        Args:
+            filename: 函数或类定义中的源代码文件名
+            paths: 变更文件路径
+
+        Returns:
+            匹配的变更文件路径，不在变更文件中时返回None
+        """
+        filename = os.path.normpath(filename)
+        for path in paths:
+            path = os.path.normpath(path)
+            if filename == path or filename.endswith(os.sep + path):
+                return path
+        return None
+
+    @classmethod
+    def _changed(cls, code: str, text: str, ranges: List[Tuple[int, int]]) -> bool:
+        """
+        判断代码是否与变更的行重叠
+
+        Args:
+            code: 函数或类的源代码
+            text: 新版本的文件内容
+            ranges: 变更的行范围
+
+        Returns:
+            是否变更，代码在文件中找不到时视为已变更
+        """
+        located = False
+        i = text.find(code) if code else -1
+        while i >= 0:
+            located = True
+            start = text.count('\n', 0, i) + 1
+            end = start + code.count('\n')
+            if any(a <= end and start <= b for a, b in ranges):
+                return True
+            i = text.find(code, i + 1)
+        return not located
+
+    @classmethod
+    def _expand(cls, graph: nx.DiGraph, symbols: Set[str], depth: int, upstream: bool) -> Set[str]:
+        """
+        沿图的边传播失效
+
+        Args:
+            graph: 调用图或类调用图
+            symbols: 失效的符号
+            depth: 传播层数
+            upstream: 为True时传播到前驱（调用者），否则传播到后继（被调用者）
+
+        Returns:
+            传播到的符号，不含symbols本身
+        """
+        res, frontier = set(), set(symbols)
+        for _ in range(depth):
+            frontier = {n for s in frontier for n in (graph.predecessors(s) if upstream else graph.successors(s))}
+            frontier -= symbols | res
+            if not frontier:
+                break
+            res |= frontier
+        return res
+
+    def eva(self, ctx: EvaContext):
+        """
+        使变更影响到的文档失效
+
+        Args:
+            ctx: 评估上下文对象
+        """
+        changes = self._diff()
+        if not changes:
+            logger.info(f'[IncrementalUpdate] no changes since {self._since}')
+            return
+        texts = {path: self._read(ctx, path) for path, ranges in changes.items() if ranges is not None}
+        depth = ProjectSettings().incremental_depth
+
+        # 变更的函数，以及变更文件中新增的对外可见函数
+        changed, added = set(), set()
+        function_files: Dict[str, Set[str]] = defaultdict(set)  # 变更文件对应的函数文档文件
+        for symbol in ctx.callgraph.nodes:
+            f = ctx.func(symbol)
+            path = self._match(f.filename, changes)
+            if path is None:
+                continue
+            function_files[path].add(f.filename)
+            if changes[path] is None or self._changed(f.code, texts[path], changes[path]):
+                changed.add(symbol)
+                if f.visible and not ctx.load_function_doc(symbol):
+                    added.add(symbol)
+        callers = self._expand(ctx.callgraph, changed, depth, upstream=True)
+        callees = self._expand(ctx.callgraph, changed, depth, upstream=False) - callers
+        functions = changed | callers | callees
+
+        # 变更的类，以及成员函数或所引用的类失效的类
+        clazzes = set()
+        clazz_files: Dict[str, Set[str]] = defaultdict(set)  # 变更文件对应的类文档文件
+        for symbol in ctx.clazz_callgraph.nodes:
+            c = ctx.clazz(symbol)
+            path = self._match(c.filename, changes)
+            if path is not None:
+                clazz_files[path].add(c.filename)
+            if any(m.symbol in functions for m in c.functions) or path is not None and (
+                    changes[path] is None or self._changed(c.code, texts[path], changes[path])):
+                clazzes.add(symbol)
+        clazzes |= self._expand(ctx.clazz_callgraph, clazzes, depth, upstream=False)  # 类的提示包含其前驱的文档
+
+        # 删除失效的函数与类文档，包括函数文档V2的草稿
+        drafts: Dict[str, Set[str]] = defaultdict(set)
+        for symbol in functions:
+            drafts[FunctionV2Metric.get_v2_draft_filename(ctx, ctx.func(symbol).filename)].add(symbol)
+        removed = ctx.remove_function_docs(functions)
+        for filename, symbols in drafts.items():
+            ctx.remove_docs(filename, ApiDoc, symbols)
+        removed_clazzes = ctx.remove_clazz_docs(clazzes)
+
+        # 删除变更文件中已不存在的函数与类的文档
+        vanished = set()
+        for path in changes:
+            for filename in function_files[path] | {path}:
+                for doc_file in (os.path.join(ctx.doc_path, f'{filename}.{ApiDoc.doc_type()}.md'),
+                                 FunctionV2Metric.get_v2_draft_filename(ctx, filename)):
+                    names = {d.name for d in ctx.load_docs(doc_file, ApiDoc)} - set(ctx.callgraph.nodes)
+                    if names:
+                        ctx.remove_docs(doc_file, ApiDoc, names)
+                        vanished |= names
+            for filename in clazz_files[path] | {path}:
+                doc_file = os.path.join(ctx.doc_path, f'{filename}.{ClazzDoc.doc_type()}.md')
+                names = {d.name for d in ctx.load_docs(doc_file, ClazzDoc)} - set(ctx.clazz_callgraph.nodes)
+                if names:
+                    ctx.remove_docs(doc_file, ClazzDoc, names)
+
+        # 模块的成员增删时，重新生成模块与仓库文档
+        members = {f for m in ctx.load_module_docs() for f in m.functions}
+        regenerate = bool(added) or bool(vanished & members)
+        if regenerate:
+            for filename in (ModuleMetric.get_draft_filename(ctx), ModuleV2Metric.get_v2_draft_filename(ctx),
+                             os.path.join(ctx.doc_path, 'modules.md')):
+                ctx.remove_docs(filename, ModuleDoc)
+            for filename in (RepoMetric.get_draft_filename(ctx), os.path.join(ctx.doc_path, 'repo.md')):
+                ctx.remove_docs(filename, RepoDoc)
+            for filename in (RepoMetric.get_qa_filename(ctx), RepoMetric.get_qa_answer_filename(ctx)):
+                if os.path.exists(filename):
+                    os.remove(filename)
+        logger.info(f'[IncrementalUpdate] {len(changes)} files changed since {self._since}, '
+                    f'{len(changed)} functions changed, {len(callers)} callers and {len(callees)} callees affected, '
+                    f'{removed} function docs and {removed_clazzes} class docs invalidated, '
+                    f'{len(vanished)} removed functions, {len(added)} added apis, '
+                    f'modules and repo docs {"regenerated" if regenerate else "kept"}')
@@ -0,0 +1,217 @@
+import hashlib  # 导入hashlib模块，用于计算指纹
+import json  # 导入json模块，用于读写清单
+import os  # 导入os模块，用于文件和路径操作
+import threading  # 导入threading模块，用于保护清单的读写
+from typing import Callable, Dict, Iterable, Optional, Set, Tuple  # 导入类型提示工具
+
+from loguru import logger  # 导入日志记录工具
+
+from .doc import Doc  # 导入文档基类
+
+
+# 文档的运行清单，记录每个文档由哪个版本的代码、相邻文档、提示模板与模型生成
+class DocManifest:
+    """
+    文档运行清单
+
+    每个文档以(文档类型, 符号名)为键记录一个条目：输入指纹（代码、提示模板版本、模型等）、文档内容的哈希，
+    以及生成时嵌入提示、且在任务图中先于它生成的文档（如被调用者、成员函数）及其当时的内容哈希。
+    清单以JSON Lines格式追加写入文档目录旁的.manifest.jsonl文件，启动时读入内存，判断文档是否过期只需比较内存中的哈希，无需解析文档。
+    开始时只使输入指纹变化的文档过期；依赖的文档重新生成后内容是否变化，在任务图中执行到该文档时再检查
+    """
+
+    def __init__(self, path: Optional[str]):
+        """
+        初始化清单并读入已有条目
+
+        Args:
+            path: 清单文件路径，为None时不记录清单，文档只要存在即视为最新
+        """
+        self._path = path
+        self._lock = threading.Lock()
+        self._entries: Dict[Tuple[str, str], dict] = {}  # (文档类型, 符号名)到条目的映射
+        self._existed = path is not None and os.path.exists(path)  # 清单是否已存在，不存在时沿用已有文档
+        self._file = None
+        if path is None:
+            return
+        lines = 0
+        if self._existed:
+            with open(path, 'r') as t:
+                for line in t:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:  # 中断时写了一半的行
+                        continue
+                    lines += 1
+                    key = (entry['type'], entry['symbol'])
+                    if entry.get('fingerprint') is None:  # 失效标记
+                        self._entries.pop(key, None)
+                    else:
+                        self._entries[key] = entry
+        _dir = os.path.dirname(path)
+        if _dir:
+            os.makedirs(_dir, exist_ok=True)
+        if lines > 2 * len(self._entries):  # 被覆盖的条目过多时压缩
+            tmp = f'{path}.tmp'
+            with open(tmp, 'w') as t:
+                t.writelines(json.dumps(e, ensure_ascii=False) + '\n' for e in self._entries.values())
+            os.replace(tmp, path)
+        self._file = open(path, 'a')
+        logger.info(f'[DocManifest] open {path}, entries count: {len(self._entries)}')
+
+    @classmethod
+    def create(cls, enabled: bool, doc_path: str) -> 'DocManifest':
+        """
+        按配置创建清单
+
+        Args:
+            enabled: 是否记录清单
+            doc_path: 文档存储路径
+
+        Returns:
+            清单对象
+        """
+        # 清单放在文档目录之外，避免被当作文档导出
+        return cls(doc_path.rstrip(os.sep) + '.manifest.jsonl' if enabled else None)
+
+    @classmethod
+    def fingerprint(cls, *parts: str) -> str:
+        """
+        计算输入的指纹
+
+        Args:
+            parts: 影响文档内容的输入，如代码、提示模板、模型名
+
+        Returns:
+            十六进制哈希值
+        """
+        return hashlib.sha256('\0'.join(parts).encode()).hexdigest()
+
+    def _write(self, entry: dict):
+        """
+        追加一个条目，调用方需持有锁
+
+        Args:
+            entry: 条目，fingerprint为None表示失效标记
+        """
+        self._file.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        self._file.flush()
+
+    def record(self, doc_type: str, symbol: str, fingerprint: str, doc: Doc,
+               deps: Iterable[Tuple[str, str]] = ()):
+        """
+        在文档保存后记录其条目
+
+        Args:
+            doc_type: 文档类型
+            symbol: 符号名
+            fingerprint: 输入指纹
+            doc: 保存的文档
+            deps: 嵌入提示的相邻文档的(文档类型, 符号名)，清单中没有条目的文档不记录
+        """
+        if self._path is None:
+            return
+        digest = self.fingerprint(doc.markdown())
+        with self._lock:
+            deps = [[t, s, self._entries[(t, s)]['doc']] for t, s in deps if (t, s) in self._entries]
+            entry = {'type': doc_type, 'symbol': symbol, 'fingerprint': fingerprint, 'doc': digest, 'deps': deps}
+            self._entries[(doc_type, symbol)] = entry
+            self._write(entry)
+
+    def close(self):
+        """
+        关闭清单文件，之后不再记录条目
+        """
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            self._path = None
+
+    def _changed(self, entry: dict) -> bool:
+        """
+        判断条目记录的依赖文档是否已变化，调用方需持有锁
+
+        Args:
+            entry: 条目
+
+        Returns:
+            是否有依赖文档的条目缺失或内容哈希与记录时不同
+        """
+        return any(self._entries.get((t, s), {}).get('doc') != digest for t, s, digest in entry['deps'])
+
+    def _expire(self, doc_type: str, symbol: str) -> bool:
+        """
+        将条目标记为失效，调用方需持有锁
+
+        Args:
+            doc_type: 文档类型
+            symbol: 符号名
+
+        Returns:
+            是否存在该条目
+        """
+        if self._entries.pop((doc_type, symbol), None) is None:
+            return False
+        self._write({'type': doc_type, 'symbol': symbol, 'fingerprint': None})
+        return True
+
+    def outdated(self, doc_type: str, symbol: str) -> bool:
+        """
+        在任务图中执行到已有文档时检查其依赖的文档：依赖已重新生成且内容变化时，将条目标记为失效。
+        依赖重新生成后内容哈希不变时，文档仍是最新的
+
+        Args:
+            doc_type: 文档类型
+            symbol: 符号名
+
+        Returns:
+            文档是否需要重新生成
+        """
+        if self._path is None:
+            return False
+        with self._lock:
+            entry = self._entries.get((doc_type, symbol))
+            if entry is None or not self._changed(entry):
+                return False
+            self._expire(doc_type, symbol)
+        logger.info(f'[DocManifest] {doc_type} {symbol}: dependencies changed')
+        return True
+
+    def stale(self, doc_type: str, fingerprints: Dict[str, str], load: Callable[[str], Optional[Doc]]) -> Set[str]:
+        """
+        找出需要重新生成的文档：没有条目、输入指纹不同，或依赖的文档已与记录时不同（如上次运行在依赖重新生成后中断）。
+        依赖的文档将被重新生成时不在此处传播，由outdated在执行到该文档时检查。
+        清单尚不存在时（旧的文档目录），已有文档视为最新并补记条目
+
+        Args:
+            doc_type: 文档类型
+            fingerprints: 符号名到当前输入指纹的映射
+            load: 读取已有文档的函数，只在补记条目时调用
+
+        Returns:
+            需要重新生成的符号名，其条目已被标记为失效
+        """
+        if self._path is None:
+            return set()
+        res = set()
+        adopted = 0
+        with self._lock:
+            for symbol, fingerprint in fingerprints.items():
+                entry = self._entries.get((doc_type, symbol))
+                if entry is None:
+                    doc = load(symbol) if not self._existed else None
+                    if doc is None:
+                        res.add(symbol)
+                        continue
+                    entry = {'type': doc_type, 'symbol': symbol, 'fingerprint': fingerprint,
+                             'doc': self.fingerprint(doc.markdown()), 'deps': []}
+                    self._entries[(doc_type, symbol)] = entry
+                    self._write(entry)
+                    adopted += 1
+                elif entry['fingerprint'] != fingerprint or self._changed(entry):
+                    res.add(symbol)
+            expired = sum(self._expire(doc_type, symbol) for symbol in res)
+        logger.info(f'[DocManifest] {doc_type}: {len(fingerprints) - len(res)} up to date, {expired} expired, '
+                    f'{len(res) - expired} not recorded' + (f', {adopted} adopted' if adopted else ''))
+        return res
@@ -1,12 +1,15 @@
 import os  # 导入操作系统模块，用于文件和路径操作
 from abc import ABCMeta, abstractmethod  # 导入抽象基类和抽象方法，用于定义接口
 from dataclasses import dataclass, field  # 导入数据类装饰器和field工具，用于定义数据类
-from typing import List, TypeVar, Optional, Type, Iterator  # 导入类型提示工具
+from typing import Any, Awaitable, Callable, Iterable, List, TypeVar, Optional, Set, Type, Iterator  # 导入类型提示工具
 
 import networkx as nx  # 导入networkx库，用于处理和分析图结构
 
-from utils import LangEnum  # 导入自定义的语言枚举
+from utils import LangEnum, TaskDispatcher, AsyncTaskDispatcher  # 导入自定义的语言枚举与任务分发器
+from utils.settings import ProjectSettings, llm_thread_pool  # 导入项目设置与LLM线程池
 from .doc import ApiDoc, ClazzDoc, ModuleDoc, Doc, RepoDoc  # 导入文档相关的类
+from .manifest import DocManifest  # 导入文档运行清单
+from .store import DocStore  # 导入文档存储
 
 
 # 变量定义
@@ -134,6 +137,40 @@ class EvaContext:
     # TODO: 改为类
     structure: str = None  # 文件结构的字符串表示
 
+    # 文档存储，按文件名与符号名索引已生成的文档，默认按.env中的DOC_STORE创建
+    doc_store: DocStore = field(default=None, repr=False)
+
+    # 文档运行清单，记录每个文档的输入指纹，用于判断已有文档是否过期，默认按.env中的DOC_MANIFEST创建
+    manifest: DocManifest = field(default=None, repr=False)
+
+    def __post_init__(self):
+        """
+        初始化文档存储与运行清单
+        """
+        if self.doc_store is None:  # 如果未指定文档存储
+            self.doc_store = DocStore.create(ProjectSettings().doc_store, self.doc_path)  # 按配置创建
+        if self.manifest is None:  # 如果未指定运行清单
+            self.manifest = DocManifest.create(ProjectSettings().doc_manifest, self.doc_path)  # 按配置创建
+
+    def flush_docs(self):
+        """
+        刷新屏障，等待文档存储中已保存的文档全部落盘，在每个度量阶段结束时调用
+        """
+        self.doc_store.flush()
+
+    def export_docs(self):
+        """
+        将文档存储中的文档导出为markdown文件
+        """
+        self.doc_store.export()
+
+    def close(self):
+        """
+        结束评估，等待文档落盘，停止文档存储的后台写入线程并关闭运行清单；之后仍可读取文档，可重复调用
+        """
+        self.doc_store.close()
+        self.manifest.close()
+
     def func(self, symbol: str) -> FuncDef:
         """
         通过函数名获取函数定义
@@ -176,23 +213,17 @@ class EvaContext:
         """
         return iter(self.clazz_callgraph.nodes[symbol]['attr'] for symbol in self.clazz_callgraph.nodes())
 
-    @staticmethod
-    def save_doc(filename: str, doc: Doc):
+    def save_doc(self, filename: str, doc: Doc):
         """
-        通用的文档写入方法
+        通用的文档写入方法，写入文档存储并追加到markdown文件
         
         Args:
             filename: 完整的文件路径名
             doc: 文档对象
         """
-        _dir = os.path.dirname(filename)  # 获取目录路径
-        if _dir:  # 如果目录不为空
-            os.makedirs(_dir, exist_ok=True)  # 创建目录，如果已存在则不报错
-        with open(filename, 'a') as t:  # 以追加模式打开文件
-            t.write(doc.markdown() + '\n')  # 写入文档的Markdown表示
+        self.doc_store.save(filename, doc)  # 写入文档存储
 
-    @staticmethod
-    def load_docs(filename: str, doc_type: Type[Doc]) -> List[T]:
+    def load_docs(self, filename: str, doc_type: Type[Doc]) -> List[T]:
         """
         通用的文档读取方法，加载指定类型的所有文档
         
@@ -203,14 +234,9 @@ class EvaContext:
         Returns:
             文档对象列表
         """
-        if not os.path.exists(filename):  # 如果文件不存在
-            return []  # 返回空列表
-        with open(filename, 'r') as t:  # 以读模式打开文件
-            docs = doc_type.from_doc(t.read())  # 从文件内容解析文档
-            return docs  # 返回文档列表
+        return self.doc_store.load_all(filename, doc_type)  # 从文档存储读取
 
-    @staticmethod
-    def load_doc(symbol: str, filename: str, doc: Type[Doc]) -> Optional[Doc]:
+    def load_doc(self, symbol: str, filename: str, doc: Type[Doc]) -> Optional[Doc]:
         """
         通用的文档读取方法，加载指定符号的文档
         
@@ -222,11 +248,21 @@ class EvaContext:
         Returns:
             找到的文档对象，如果未找到则返回None
         """
-        docs = EvaContext.load_docs(filename, doc)  # 加载所有文档
-        for d in docs:  # 遍历文档
-            if d.name == symbol:  # 如果找到匹配的文档
-                return d  # 返回该文档
-        return None  # 未找到则返回None
+        return self.doc_store.load(symbol, filename, doc)  # 按符号名从文档存储读取
+
+    def remove_docs(self, filename: str, doc_type: Type[Doc], symbols: Optional[Set[str]] = None) -> int:
+        """
+        通用的文档删除方法，删除后再次运行度量时会重新生成这些文档
+
+        Args:
+            filename: 完整的文件路径名
+            doc_type: 文档类型
+            symbols: 要删除的符号名集合，为None时删除文件中的全部文档
+
+        Returns:
+            删除的文档数
+        """
+        return self.doc_store.remove(filename, doc_type, symbols)  # 从文档存储删除
 
     def save_function_doc(self, symbol: str, doc: ApiDoc):
         """
@@ -253,6 +289,22 @@ class EvaContext:
         return self.load_doc(symbol, os.path.join(self.doc_path, f'{func_def.filename}.{ApiDoc.doc_type()}.md'),
                              ApiDoc)  # 加载文档
 
+    def remove_function_docs(self, symbols: Iterable[str]) -> int:
+        """
+        删除函数文档，按函数所在的文件分组删除
+
+        Args:
+            symbols: 函数符号名
+
+        Returns:
+            删除的文档数
+        """
+        files = {}
+        for symbol in symbols:
+            filename = os.path.join(self.doc_path, f'{self.func(symbol).filename}.{ApiDoc.doc_type()}.md')
+            files.setdefault(filename, set()).add(symbol)
+        return sum(self.remove_docs(filename, ApiDoc, s) for filename, s in files.items())
+
     def save_clazz_doc(self, symbol: str, doc: ClazzDoc):
         """
         通过类名写入类文档
@@ -278,6 +330,22 @@ class EvaContext:
         return self.load_doc(symbol, os.path.join(self.doc_path, f'{clazz_def.filename}.{ClazzDoc.doc_type()}.md'),
                              ClazzDoc)  # 加载文档
 
+    def remove_clazz_docs(self, symbols: Iterable[str]) -> int:
+        """
+        删除类文档，按类所在的文件分组删除
+
+        Args:
+            symbols: 类符号名
+
+        Returns:
+            删除的文档数
+        """
+        files = {}
+        for symbol in symbols:
+            filename = os.path.join(self.doc_path, f'{self.clazz(symbol).filename}.{ClazzDoc.doc_type()}.md')
+            files.setdefault(filename, set()).add(symbol)
+        return sum(self.remove_docs(filename, ClazzDoc, s) for filename, s in files.items())
+
     def save_module_doc(self, doc: ModuleDoc):
         """
         写入单个模块文档
@@ -318,6 +386,30 @@ class EvaContext:
         return docs[0]  # 返回第一个仓库文档
 
 
+# 度量阶段的任务图，各节点的依赖完成后即可执行
+@dataclass
+class StagePlan:
+    """
+    度量阶段的任务图
+
+    FunctionMetric、ClazzMetric等按图生成文档的阶段先构建任务图，再由任务分发器执行；
+    跨阶段流水线可以合并多个阶段的任务图，使后续阶段的任务在其依赖的文档生成后立即开始
+    """
+    graph: nx.DiGraph  # 任务依赖图，边u->v表示节点u依赖节点v
+    gen: Callable[[Any], None]  # 以线程方式执行单个节点
+    agen: Callable[[Any], Awaitable[None]]  # 以协程方式执行单个节点
+    cost: Callable[[Any], float] = lambda node: 1  # 节点的耗时估计，用于计算关键路径
+
+    def run(self):
+        """
+        使用任务分发器执行任务图，LLM_ASYNC开启时以协程方式执行
+        """
+        if ProjectSettings().llm_async:  # 协程方式
+            AsyncTaskDispatcher(ProjectSettings().llm_concurrency).map(self.graph, self.agen, cost=self.cost).run()
+        else:  # 线程池方式
+            TaskDispatcher(llm_thread_pool).map(self.graph, self.gen, cost=self.cost).run()
+
+
 # 度量指标的基类，接受EvaContext作为参数，将被其他指标依赖的度量结果写回EvaContext
 class Metric(metaclass=ABCMeta):
     """
@@ -8,6 +8,7 @@ from utils import SimpleLLM, prefix_with, ChatCompletionSettings, TaskDispatcher
 from . import EvaContext  # 导入评估上下文
 from .doc import ModuleDoc  # 导入模块文档类
 from .metric import Metric  # 导入度量基类
+from .module_reduce import ModuleReducer  # 导入分层的模块总结
 
 modules_summarize_prompt = '''
 You are an expert in software architecture analysis. 
@@ -109,7 +110,7 @@ class ModuleMetric(Metric):
         """
         生成模块文档草稿
         
-        首先尝试加载已有草稿，如果没有则根据函数文档生成新的模块草稿
+        首先尝试加载已有草稿，如果没有则根据函数文档生成新的模块草稿，函数描述超出一次提示的token预算时分层总结
         
         Args:
             ctx: 评估上下文对象
@@ -124,12 +125,17 @@ class ModuleMetric(Metric):
         # 提取所有用户可见的函数
         apis: List[str] = list(map(lambda x: x.symbol, filter(lambda x: x.visible, ctx.func_iter())))  # 获取所有可见函数
         # 使用函数描述组织上下文
-        api_docs = reduce(lambda x, y: x + y,
-                          map(lambda a: f'- {a}\n > {ctx.load_function_doc(a).description}\n\n', apis))  # 构建函数列表文本
-        prompt = modules_summarize_prompt.format(api_docs=api_docs)  # 格式化提示模板
-        # 生成模块文档
-        res = SimpleLLM(ChatCompletionSettings()).add_user_msg(prompt).ask()  # 调用LLM生成文档
-        modules = ModuleDoc.from_doc(res)  # 从结果解析模块文档
+        api_items = list(map(lambda a: f'- {a}\n > {ctx.load_function_doc(a).description}\n\n', apis))  # 每个函数的描述文本
+        reducer = ModuleReducer('ModuleMetric')
+        modules = reducer.map(api_items, lambda x: modules_summarize_prompt.format(api_docs=x))  # 分块总结
+        if modules is not None:
+            modules = reducer.reduce(modules)  # 逐层合并各块的模块
+        else:
+            api_docs = reduce(lambda x, y: x + y, api_items)  # 构建函数列表文本
+            prompt = modules_summarize_prompt.format(api_docs=api_docs)  # 格式化提示模板
+            # 生成模块文档
+            res = SimpleLLM(ChatCompletionSettings()).add_user_msg(prompt).ask()  # 调用LLM生成文档
+            modules = ModuleDoc.from_doc(res)  # 从结果解析模块文档
         # 保存模块文档初稿，若模块中只有一个函数，则舍弃
         modules = list(filter(lambda x: len(modules) == 1 or len(x.functions) > 1, modules))  # 过滤掉只有一个函数的模块
         for m in modules:  # 遍历模块
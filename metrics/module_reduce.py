@@ -0,0 +1,211 @@
+from typing import Callable, List, Optional  # 导入类型提示工具
+
+from loguru import logger  # 导入日志记录工具
+
+from utils import SimpleLLM, prefix_with, ChatCompletionSettings, ContextPacker, TaskDispatcher, llm_thread_pool, \
+    Task  # 导入LLM、token计数和任务分发相关工具
+from utils.settings import ProjectSettings  # 导入项目设置
+from .doc import ModuleDoc  # 导入模块文档类
+
+modules_merge_prompt = '''
+You are an expert in software architecture analysis.
+You have reviewed the function descriptions from a code repository and organized them into functional modules based on their purpose and interrelations.
+Now you need to merge the modules to make the documentation more concise and clear.
+
+The following are the documentation of the modules you have organized:
+{module_doc}
+
+Please merge modules with similar functions and output the merged module documentation in the same format.
+The correct format of each module documentation is as follows and you shouldn't write the reference symbols `>` when you output:
+
+> ### Module Name
+> #### Description
+> A concise paragraph summarizing the module's purpose, how it contributes to solving specific problems, and which functions work together within the module.
+> #### Functions
+> - Function1
+> - Function2
+
+You'd better consider the following workflow:
+1. Review Module Descriptions. Read through the descriptions of each module to understand the core functionalities of the software.
+2. Merge Modules. Identify modules with similar functions or that can be combined to form a more comprehensive module. Consider how the functions in each module can work together to solve a specific problem or address a particular use case.
+3. Remove useless modules. If there are modules that are not related to the software's core functionalities, consider removing them from the documentation to make it more concise.
+4. Name the Merged Module in the required language. Based on the functions and use cases of the merged modules, come up with a suitable name for the merged module to replace the placeholder "Module Name" in the template. Remember that this is just a module of the software. Don't make it too broad.
+
+Please Note:
+- #### Functions is a list of function names included in this module. Please use the full function name with the return type and parameters, not the abbreviation.
+- The Level 4 headings in the format like `#### Description` are fixed, don't change or translate them. Don't add new Level 3 or Level 4 headings. Do not write anything outside the format.
+- Don't omit any modules related to the software's core functionalities. If they cannot be merged, keep them.
+- Don't add divider lines like `---` between multiple modules.
+
+'''  # 模块合并提示模板，指导大模型如何合并相似的模块
+
+
+# 分层的模块总结，API过多、一次提示放不下时使用
+class ModuleReducer:
+    """
+    分层的模块总结（map-reduce）
+
+    第0层将函数描述按token预算切分为多块，各块在任务分发器上并行总结为模块列表；之后每一层将上一层的模块列表
+    超出该层的token预算时按预算与扇入上限分组，各组并行合并，直到全部模块放得进一次合并提示，由根节点完成最后一次合并。
+    各层的token预算由MODULE_LEVEL_TOKENS按层依次指定，层数多于预算个数时沿用最后一个
+    """
+
+    def __init__(self, name: str):
+        """
+        初始化分层总结
+
+        Args:
+            name: 调用方的度量名，用于日志
+        """
+        settings = ProjectSettings()
+        self._name = name
+        self._budgets = settings.module_level_tokens
+        self._fanin = max(settings.module_reduce_fanin, 2)
+        self._packer = ContextPacker.get_instance(ChatCompletionSettings())  # 复用上下文打包器的token计数
+
+    def budget(self, level: int) -> int:
+        """
+        获取某一层的token预算
+
+        Args:
+            level: 层号，0为总结函数描述的一层
+
+        Returns:
+            该层一次提示中上下文的token数上限，0表示不限制
+        """
+        if not self._budgets:
+            return 0
+        return self._budgets[min(level, len(self._budgets) - 1)]
+
+    def _chunks(self, items: List[str], budget: int, fanin: int = 0) -> List[List[int]]:
+        """
+        按顺序将条目切分为token数不超过预算的块，单个条目超出预算时独占一块
+
+        Args:
+            items: 条目文本
+            budget: 每块的token数上限
+            fanin: 每块的条目数上限，0表示不限制
+
+        Returns:
+            块列表，每块为条目下标列表
+        """
+        chunks, chunk, used = [], [], 0
+        for i, item in enumerate(items):
+            tokens = self._packer.count(item)
+            if chunk and (used + tokens > budget or fanin and len(chunk) >= fanin):
+                chunks.append(chunk)
+                chunk, used = [], 0
+            chunk.append(i)
+            used += tokens
+        if chunk:
+            chunks.append(chunk)
+        return chunks
+
+    def _ask(self, prompts: List[Optional[str]], attempts: int = 2) -> List[Optional[List[ModuleDoc]]]:
+        """
+        在任务分发器上并行执行一层的提示，请求失败或响应中解析不出模块时重试，仍失败时跳过该提示
+
+        Args:
+            prompts: 提示列表，为None的位置不调用LLM
+            attempts: 每个提示最多执行的次数
+
+        Returns:
+            与prompts一一对应的模块列表，提示为None或失败的位置为None
+        """
+        res: List[Optional[List[ModuleDoc]]] = [None] * len(prompts)
+
+        def gen(i: int, prompt: str):
+            """
+            执行单个提示
+
+            Args:
+                i: 提示下标
+                prompt: 提示
+            """
+            for attempt in range(1, attempts + 1):
+                try:
+                    out = SimpleLLM(ChatCompletionSettings()).add_user_msg(prompt).ask(
+                        lambda x: x.replace('---', '').strip())
+                    modules = ModuleDoc.from_doc(out)
+                except Exception as e:
+                    logger.warning(f'[{self._name}] prompt {i} attempt {attempt}/{attempts} failed: {e}')
+                    continue
+                if modules:
+                    res[i] = modules
+                    return
+                logger.warning(f'[{self._name}] prompt {i} attempt {attempt}/{attempts}: no modules in response')
+            logger.error(f'[{self._name}] skip prompt {i} after {attempts} attempts')
+
+        TaskDispatcher(llm_thread_pool).adds(
+            [Task(f=gen, args=(i, p)) for i, p in enumerate(prompts) if p is not None]).run()
+        return res
+
+    def map(self, api_docs: List[str], prompt: Callable[[str], str]) -> Optional[List[ModuleDoc]]:
+        """
+        第0层：将函数描述切分为多块，并行总结为模块
+
+        Args:
+            api_docs: 每个函数的描述文本
+            prompt: 由若干函数描述构造总结提示的函数
+
+        Returns:
+            各块总结出的模块，失败的块被跳过；函数描述放得进一次提示或全部块都失败时返回None，由调用方按原方式总结
+        """
+        budget = self.budget(0)
+        if not budget:
+            return None
+        chunks = self._chunks(api_docs, budget)
+        if len(chunks) <= 1:
+            return None
+        results = self._ask([prompt(''.join(api_docs[i] for i in chunk)) for chunk in chunks])
+        failed = [chunk for chunk, r in zip(chunks, results) if r is None]
+        if failed:
+            logger.error(f'[{self._name}] {len(failed)} of {len(chunks)} chunks failed, '
+                         f'{sum(map(len, failed))} apis skipped')
+        if len(failed) == len(chunks):
+            return None
+        modules = [m for r in results if r is not None for m in r]
+        logger.info(f'[{self._name}] map {len(api_docs)} apis in {len(chunks)} chunks to {len(modules)} modules')
+        return modules
+
+    def reduce(self, modules: List[ModuleDoc], level: int = 1) -> List[ModuleDoc]:
+        """
+        从指定层开始逐层合并模块，直到由根节点一次合并全部模块
+
+        Args:
+            modules: 待合并的模块
+            level: 起始层号，第0层为总结函数描述（或模块V2中按聚类生成草稿）的一层
+
+        Returns:
+            合并后的模块，某组合并失败时保留该组合并前的模块，根节点合并失败时返回该层合并前的模块
+        """
+        while True:
+            texts = [m.markdown() + '\n' for m in modules]
+            budget = self.budget(level)
+            if not budget or sum(map(self._packer.count, texts)) <= budget:  # 根节点，与不分层时相同
+                chunks = [list(range(len(texts)))]
+            else:  # 放不下时分组，每组的模块数不超过扇入上限
+                chunks = self._chunks(texts, budget, self._fanin)
+            if len(chunks) == 1:
+                res = self._ask([modules_merge_prompt.format(
+                    module_doc=prefix_with('\n'.join(m.markdown() for m in modules), '>'))])[0]
+                if res is None:
+                    logger.error(f'[{self._name}] root merge failed, keep {len(modules)} unmerged modules')
+                    res = modules
+                break
+            # 只有一个模块的组无需合并，与合并失败的组一样，原样进入下一层
+            results = self._ask([None if len(chunk) == 1 else modules_merge_prompt.format(
+                module_doc=prefix_with('\n'.join(modules[i].markdown() for i in chunk), '>')) for chunk in chunks])
+            merged = [m for chunk, r in zip(chunks, results)
+                      for m in (r if r is not None else [modules[i] for i in chunk])]
+            logger.info(f'[{self._name}] reduce level {level}: {len(modules)} modules in {len(chunks)} groups '
+                        f'-> {len(merged)} modules')
+            if len(merged) >= len(modules):  # 合并不再减少模块数，无法收敛到一次提示
+                logger.warning(f'[{self._name}] modules cannot be merged within {budget} tokens, '
+                               f'keep {len(merged)} modules')
+                res = merged
+                break
+            modules = merged
+            level += 1
+        logger.info(f'[{self._name}] map-reduce levels: {level + 1}')
+        return res
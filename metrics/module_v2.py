@@ -9,6 +9,7 @@ from utils import SimpleLLM, prefix_with, ChatCompletionSettings, SimpleRAG, Rag
 from . import ModuleMetric  # 导入ModuleMetric基类
 from .doc import ModuleDoc  # 导入模块文档类
 from .metric import EvaContext  # 导入评估上下文类
+from .module_reduce import ModuleReducer  # 导入分层的模块总结
 
 modules_prompt = '''
 You are an expert in software architecture analysis. 
@@ -38,37 +39,6 @@ Please Note:
 - Don't add divider lines like `---` between multiple modules.
 '''  # 模块生成提示模板，指导大模型如何组织函数到模块中
 
-modules_merge_prompt = '''
-You are an expert in software architecture analysis.
-You have reviewed the function descriptions from a code repository and organized them into functional modules based on their purpose and interrelations.
-Now you need to merge the modules to make the documentation more concise and clear.
-
-The following are the documentation of the modules you have organized:
-{module_doc}
-
-Please merge modules with similar functions and output the merged module documentation in the same format.
-The correct format of each module documentation is as follows and you shouldn't write the reference symbols `>` when you output:
-
-> ### Module Name
-> #### Description
-> A concise paragraph summarizing the module's purpose, how it contributes to solving specific problems, and which functions work together within the module.
-> #### Functions
-> - Function1
-> - Function2
-
-You'd better consider the following workflow:
-1. Review Module Descriptions. Read through the descriptions of each module to understand the core functionalities of the software.
-2. Merge Modules. Identify modules with similar functions or that can be combined to form a more comprehensive module. Consider how the functions in each module can work together to solve a specific problem or address a particular use case.
-3. Remove useless modules. If there are modules that are not related to the software's core functionalities, consider removing them from the documentation to make it more concise.
-4. Name the Merged Module in the required language. Based on the functions and use cases of the merged modules, come up with a suitable name for the merged module to replace the placeholder "Module Name" in the template. Remember that this is just a module of the software. Don't make it too broad.
-
-Please Note:
-- #### Functions is a list of function names included in this module. Please use the full function name with the return type and parameters, not the abbreviation.
-- The Level 4 headings in the format like `#### Description` are fixed, don't change or translate them. Don't add new Level 3 or Level 4 headings. Do not write anything outside the format.
-- Don't omit any modules related to the software's core functionalities. If they cannot be merged, keep them.
-- Don't add divider lines like `---` between multiple modules.
-
-'''  # 模块合并提示模板，指导大模型如何合并相似的模块
 
 
 # 为模块生成文档V2，
@@ -171,7 +141,7 @@ class ModuleV2Metric(ModuleMetric):
     def _merge(cls, ctx: EvaContext, drafts: List[ModuleDoc]) -> List[ModuleDoc]:
         """合并模块文档草稿
         
-        使用大模型分析并合并功能相似的模块，生成更加凝聚的模块组织
+        使用大模型分析并合并功能相似的模块，生成更加凝聚的模块组织，草稿超出一次提示的token预算时分层合并
         
         Args:
             ctx: 评估上下文对象
@@ -185,13 +155,8 @@ class ModuleV2Metric(ModuleMetric):
             # 如果合并文档已存在，则直接加载使用
             logger.info(f'[ModuleV2Metric] load modules, modules count: {len(existed_draft_doc)}')
             return existed_draft_doc
-        # 构建合并提示模板
-        prompt = modules_merge_prompt.format(
-            module_doc=prefix_with('\n'.join(map(lambda x: x.markdown(), drafts)), '>'))
-        # 使用大模型执行合并
-        res = SimpleLLM(ChatCompletionSettings()).add_user_msg(prompt).ask(lambda x: x.replace('---', '').strip())
-        # 将文本转换为ModuleDoc对象列表
-        docs = ModuleDoc.from_doc(res)
+        # 使用大模型执行合并，草稿过多时先分组合并
+        docs = ModuleReducer('ModuleV2Metric').reduce(drafts)
         # 保存模块文档初稿，若模块中只有一个函数，则舍弃（除非只有一个模块）
         docs = list(filter(lambda x: len(docs) == 1 or len(x.functions) > 1, docs))
         for doc in docs:
@@ -0,0 +1,118 @@
+import contextvars  # 导入contextvars模块，用于将调用方的上下文传递到后续阶段的线程
+from concurrent.futures import ThreadPoolExecutor  # 导入线程池执行器，用于在后台执行后续阶段
+from typing import Any, List, Tuple  # 导入类型提示工具
+
+import networkx as nx  # 导入networkx库，用于合并任务图
+from loguru import logger  # 导入日志记录工具
+
+from utils import llm_stage  # 导入LLM调用阶段
+from .clazz import ClazzMetric  # 导入类度量
+from .function import FunctionMetric  # 导入函数度量
+from .metric import Metric, EvaContext, StagePlan  # 导入度量基类、评估上下文与任务图
+
+_FUNCTIONS_DONE = ('FunctionMetric', None)  # 全部函数文档完成的哨兵节点
+
+
+# 跨阶段的流水线，类文档与模块、仓库文档在所依赖的函数文档完成后即开始生成
+class StagePipeline(Metric):
+    """
+    跨阶段流水线
+
+    函数与类两个阶段的任务图合并为一个任务图，节点为(阶段, 原节点)：类依赖其成员函数与原类调用图中的后继，
+    成员函数的文档生成后类即可开始，不必等待全部函数。模块与仓库阶段需要全部对外可见函数的文档，
+    由哨兵节点在全部函数完成后于后台线程中依次执行，与其余的类任务重叠。
+    各任务的LLM调用仍按所属阶段统计
+    """
+
+    def __init__(self, function: FunctionMetric, clazz: ClazzMetric, tail: List[Metric]):
+        """
+        初始化流水线
+
+        Args:
+            function: 函数度量
+            clazz: 类度量
+            tail: 全部函数文档完成后依次执行的度量，如模块、仓库度量
+        """
+        self._function = function
+        self._clazz = clazz
+        self._tail = tail
+
+    def _run_tail(self, ctx: EvaContext):
+        """
+        依次执行后续阶段
+
+        Args:
+            ctx: 评估上下文对象
+        """
+        for metric in self._tail:
+            with llm_stage(type(metric).__name__):
+                metric.eva(ctx)
+
+    def eva(self, ctx: EvaContext):
+        """
+        构建合并的任务图并执行，返回时所有阶段均已完成
+
+        Args:
+            ctx: 评估上下文对象
+        """
+        stages = {}
+        for metric in (self._function, self._clazz):  # 依次构建，类阶段的过期检查在函数阶段之后
+            with llm_stage(type(metric).__name__):
+                stages[type(metric).__name__] = metric.plan(ctx)
+        function, clazz = type(self._function).__name__, type(self._clazz).__name__
+        graph = nx.DiGraph()
+        for stage, plan in stages.items():
+            graph.add_nodes_from((stage, n) for n in plan.graph.nodes)
+            graph.add_edges_from(((stage, u), (stage, v)) for u, v in plan.graph.edges)
+        for symbol in stages[clazz].graph.nodes:  # 类依赖其成员函数
+            for f in ctx.clazz(symbol).functions:
+                if f.symbol in stages[function].graph:
+                    graph.add_edge((clazz, symbol), (function, f.symbol))
+        graph.add_edges_from((_FUNCTIONS_DONE, (function, n)) for n in stages[function].graph.nodes)
+        # 后续阶段的耗时未知，哨兵的耗时估计取全部类任务之和，使函数任务优先于不阻塞其他阶段的类任务
+        tail_cost = sum(map(stages[clazz].cost, stages[clazz].graph.nodes)) + 1
+        side = ThreadPoolExecutor(1)  # 执行后续阶段的后台线程，不占用LLM线程池，避免等待自身提交的任务
+        tail = []
+
+        def start_tail():
+            """
+            全部函数文档完成后，在后台线程中开始后续阶段
+            """
+            logger.info(f'[StagePipeline] functions done, start {", ".join(type(m).__name__ for m in self._tail)}')
+            tail.append(side.submit(contextvars.copy_context().run, self._run_tail, ctx))
+
+        def gen(node: Tuple[str, Any]):
+            """
+            以线程方式执行单个节点
+
+            Args:
+                node: (阶段, 原节点)
+            """
+            if node == _FUNCTIONS_DONE:
+                return start_tail()
+            stage, n = node
+            with llm_stage(stage):
+                stages[stage].gen(n)
+
+        async def agen(node: Tuple[str, Any]):
+            """
+            gen的协程版本
+
+            Args:
+                node: (阶段, 原节点)
+            """
+            if node == _FUNCTIONS_DONE:
+                return start_tail()
+            stage, n = node
+            with llm_stage(stage):
+                await stages[stage].agen(n)
+
+        cost = lambda node: tail_cost if node == _FUNCTIONS_DONE else stages[node[0]].cost(node[1])
+        logger.info(f'[StagePipeline] {len(graph)} tasks, {len(stages[function].graph)} functions, '
+                    f'{len(stages[clazz].graph)} classes')
+        try:
+            StagePlan(graph, gen, agen, cost).run()
+            for future in tail:  # 等待后续阶段完成，并抛出其中的异常
+                future.result()
+        finally:
+            side.shutdown(wait=True)
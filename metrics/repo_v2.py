@@ -8,7 +8,7 @@ from utils.settings import llm_thread_pool, ProjectSettings
 from . import RepoMetric
 from .doc import RepoDoc, ApiDoc
 
-qa_prompt = '''
+qa_context_prompt = '''
 You are an expert on software engineering. 
 You have found a software that meets your requirements. But you still have some questions about the software.
 
@@ -16,7 +16,9 @@ The software you found is summarized as follows:
 
 {repo_doc}
 
-The software have the following functions maybe related to your questions:
+'''
+
+qa_question_prompt = '''The software have the following functions maybe related to your questions:
 
 {functions_doc}
 
@@ -24,11 +26,15 @@ Please answer the following questions based on the documentation of the software
 
 {question}
 
-Please Note:
+'''
+
+qa_note_prompt = '''Please Note:
 - When answering the question, you should first draw your conclusion in one sentence.
 - The question should be answered in only one paragraph.
 '''
 
+qa_prompt = qa_context_prompt + qa_question_prompt + qa_note_prompt
+
 
 # 为仓库生成文档V2，使用RAG验证文档的准确性
 class RepoV2Metric(RepoMetric):
@@ -60,10 +66,17 @@ class RepoV2Metric(RepoMetric):
             I = rag.query(q)
             functions_doc = [functions[i].markdown() for i in I]
             functions_doc = '\n\n---\n\n'.join(functions_doc)
-            q_prompt = qa_prompt.format(repo_doc=prefix_with(doc.markdown(), '> '),
-                                        functions_doc=prefix_with(functions_doc, '> '),
-                                        question=q)
-            answers[i] = SimpleLLM(ChatCompletionSettings()).add_user_msg(q_prompt).ask()
+            setting = ChatCompletionSettings()
+            if setting.prefix_cache:
+                # 所有问题共享的仓库文档与回答要求在前，检索到的函数文档与问题在后，便于服务端复用提示前缀的缓存
+                context = (qa_context_prompt + qa_note_prompt).format(repo_doc=prefix_with(doc.markdown(), '> '))
+                question = qa_question_prompt.format(functions_doc=prefix_with(functions_doc, '> '), question=q)
+                answers[i] = SimpleLLM(setting).add_system_msg(context).add_user_msg(question).ask()
+            else:
+                q_prompt = qa_prompt.format(repo_doc=prefix_with(doc.markdown(), '> '),
+                                            functions_doc=prefix_with(functions_doc, '> '),
+                                            question=q)
+                answers[i] = SimpleLLM(setting).add_user_msg(q_prompt).ask()
             logger.info(f'[RepoV2Metric] answer question {i + 1}')
 
         TaskDispatcher(llm_thread_pool).adds(
@@ -0,0 +1,730 @@
+from __future__ import annotations  # 启用未来版本的注解特性，允许在类型注解中使用尚未定义的类
+
+import json  # 导入json模块，用于读写章节索引文件
+import mmap  # 导入mmap模块，用于按偏移读取markdown文件
+import os  # 导入操作系统模块，用于文件和路径操作
+import queue  # 导入队列模块，用于在线程间传递待写入的文档
+import sqlite3  # 导入sqlite3模块，用于持久化文档存储
+import threading  # 导入线程模块，用于保证多线程下的读写安全
+import time  # 导入时间模块，用于统计写入耗时
+from abc import ABCMeta, abstractmethod  # 导入抽象基类和抽象方法，用于定义接口
+from dataclasses import dataclass, field  # 导入数据类装饰器和field工具
+from typing import Dict, List, Optional, Set, Type, TypeVar, Tuple, Union  # 导入类型提示工具
+
+from loguru import logger  # 导入日志记录工具
+
+from .doc import Doc  # 导入文档基类
+
+# 定义泛型类型变量T，限制为Doc的子类
+T = TypeVar('T', bound=Doc)
+
+
+@dataclass
+class _DocFile:
+    """
+    单个文档文件在内存中的索引
+    """
+    docs: List[Doc] = field(default_factory=list)  # 按写入顺序保存的文档列表
+    index: Dict[str, Doc] = field(default_factory=dict)  # 符号名到文档的索引，同名文档以先写入者为准
+
+    def append(self, doc: Doc):
+        """
+        追加一个文档并更新索引
+
+        Args:
+            doc: 文档对象
+        """
+        self.docs.append(doc)  # 记录文档
+        self.index.setdefault(doc.name, doc)  # 与逐个扫描文件的语义一致，保留第一个同名文档
+
+
+# 文档存储的基类，EvaContext通过它读写各阶段生成的文档
+class DocStore(metaclass=ABCMeta):
+    """
+    文档存储的抽象基类
+
+    文档以(文件名, 符号名)定位，文件名即该文档导出为markdown时的路径，不同阶段（草稿、终稿）使用不同的文件名
+    """
+
+    @abstractmethod
+    def save(self, filename: str, doc: Doc):
+        """
+        写入文档
+
+        Args:
+            filename: 完整的文件路径名
+            doc: 文档对象
+        """
+        pass
+
+    @abstractmethod
+    def load_all(self, filename: str, doc_type: Type[T]) -> List[T]:
+        """
+        读取文件中的全部文档
+
+        Args:
+            filename: 完整的文件路径名
+            doc_type: 文档类型
+
+        Returns:
+            文档对象列表
+        """
+        pass
+
+    @abstractmethod
+    def load(self, symbol: str, filename: str, doc_type: Type[T]) -> Optional[T]:
+        """
+        读取文件中指定符号的文档
+
+        Args:
+            symbol: 符号名称
+            filename: 完整的文件路径名
+            doc_type: 文档类型
+
+        Returns:
+            文档对象，如果未找到则返回None
+        """
+        pass
+
+    @abstractmethod
+    def remove(self, filename: str, doc_type: Type[Doc], symbols: Optional[Set[str]] = None) -> int:
+        """
+        删除文件中的文档，用于增量更新时使失效的文档重新生成，应在各度量阶段开始前调用
+
+        Args:
+            filename: 完整的文件路径名
+            doc_type: 文档类型
+            symbols: 要删除的符号名集合，为None时删除文件中的全部文档
+
+        Returns:
+            删除的文档数
+        """
+        pass
+
+    def flush(self):
+        """
+        等待已写入的文档全部落盘，默认写入即落盘
+        """
+        pass
+
+    def close(self):
+        """
+        等待已写入的文档全部落盘并释放后台资源，之后仍可读取但不应再写入，默认与flush相同
+        """
+        self.flush()
+
+    def export(self):
+        """
+        将存储中的文档导出为markdown文件，默认无需导出
+        """
+        pass
+
+    @classmethod
+    def create(cls, kind: str, doc_path: str) -> DocStore:
+        """
+        按配置创建文档存储
+
+        Args:
+            kind: 存储类型，markdown或sqlite
+            doc_path: 文档存储路径
+
+        Returns:
+            文档存储对象
+
+        Raises:
+            ValueError: 不支持的存储类型
+        """
+        if kind == 'markdown':
+            return MarkdownDocStore()
+        if kind == 'sqlite':
+            # 数据库放在文档目录之外，避免被当作文档导出或写入gitbook目录
+            return SqliteDocStore(doc_path.rstrip(os.sep) + '.db')
+        raise ValueError(f'Invalid doc store: {kind}')
+
+
+@dataclass
+class _Rewrite:
+    """
+    重写整个文件的请求，在写入线程中与追加请求按提交顺序执行
+    """
+    filename: str  # 完整的文件路径名
+    content: str  # 文件的新内容，为空时删除文件
+
+
+# 单线程的文档写入器，从有界队列中批量取出文档，按目标文件合并后一次写入
+class _DocWriter:
+    """
+    异步的markdown文档写入器
+
+    所有线程的写入请求进入同一个有界队列，由唯一的写入线程消费；
+    每批写入按目标文件分组，每个文件只打开、写入一次，避免多线程同时追加同一文件时内容交错。
+    删除文档时的重写请求也进入同一队列，排在此前提交的追加之后执行
+    """
+
+    def __init__(self, maxsize: int = 1024):
+        """
+        初始化写入器并启动写入线程
+
+        Args:
+            maxsize: 队列容量，队列满时写入方阻塞
+        """
+        # 待写入的(文件名, 内容)、重写请求、刷新屏障或停止标记None
+        self._queue: queue.Queue[Optional[Union[Tuple[str, str], _Rewrite, threading.Event]]] = queue.Queue(maxsize)
+        self._dirs = set()  # 已创建的目录
+        self._error: Optional[Exception] = None  # 写入线程中发生的异常，在刷新屏障处抛出
+        self._batches = 0  # 已写入的批次数
+        self._docs = 0  # 已写入的文档数
+        self._cost = 0.0  # 累计写入耗时
+        self._max_depth = 0  # 观察到的最大队列深度
+        self._thread = threading.Thread(target=self._run, name='DocWriter', daemon=True)
+        self._thread.start()  # 启动写入线程
+
+    def put(self, filename: str, content: str):
+        """
+        提交一个写入请求
+
+        Args:
+            filename: 完整的文件路径名
+            content: 要追加的内容
+        """
+        self._queue.put((filename, content))  # 队列满时阻塞，形成背压
+        self._max_depth = max(self._max_depth, self._queue.qsize())  # 记录队列深度
+
+    def rewrite(self, filename: str, content: str):
+        """
+        提交一个重写请求，此前提交的追加先写入，之后提交的追加写在新内容之后
+
+        Args:
+            filename: 完整的文件路径名
+            content: 文件的新内容，为空时删除文件
+        """
+        self._queue.put(_Rewrite(filename, content))
+
+    def flush(self):
+        """
+        刷新屏障，阻塞直到此前提交的写入全部完成
+
+        Raises:
+            Exception: 写入线程中发生的异常
+        """
+        if not self._thread.is_alive():  # 已关闭，没有待写入的内容
+            return
+        ctime = time.time()
+        barrier = threading.Event()
+        self._queue.put(barrier)  # 队列先进先出，屏障之前的写入都会先完成
+        barrier.wait()
+        logger.info(f'[DocWriter] flushed, docs: {self._docs}, batches: {self._batches}, '
+                    f'max queue depth: {self._max_depth}, write cost: {self._cost:.3f}s, '
+                    f'flush wait: {time.time() - ctime:.3f}s')
+        self._max_depth = 0
+        if self._error is not None:  # 如果写入失败，在阶段结束时报告
+            err, self._error = self._error, None
+            raise err
+
+    def close(self):
+        """
+        写完此前提交的全部内容后停止写入线程，之后不能再提交写入
+
+        Raises:
+            Exception: 写入线程中发生的异常
+        """
+        if not self._thread.is_alive():  # 重复关闭时直接返回
+            return
+        self._queue.put(None)  # 停止标记排在此前提交的写入之后
+        self._thread.join()
+        logger.info(f'[DocWriter] closed, docs: {self._docs}, batches: {self._batches}')
+        if self._error is not None:
+            err, self._error = self._error, None
+            raise err
+
+    def _run(self):
+        """
+        写入线程主循环，每次取出队列中所有可用的请求作为一批写入，遇到停止标记时写完当前批次后退出
+        """
+        stopped = False
+        while not stopped:
+            items = [self._queue.get()]  # 阻塞等待第一个请求
+            while True:  # 取出当前队列中的其余请求
+                try:
+                    items.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            batch: Dict[str, List[str]] = {}  # 文件名到内容的映射，保持提交顺序
+            for item in items:
+                if item is None:  # 停止标记
+                    stopped = True
+                elif isinstance(item, threading.Event):  # 遇到屏障时，先写出之前的内容再释放屏障
+                    self._write(batch)
+                    batch = {}
+                    item.set()
+                elif isinstance(item, _Rewrite):  # 重写前先写出之前的内容，保证顺序
+                    self._write(batch)
+                    batch = {}
+                    self._rewrite(item)
+                else:
+                    batch.setdefault(item[0], []).append(item[1])
+            self._write(batch)
+
+    def _rewrite(self, item: _Rewrite):
+        """
+        重写或删除文件，同时删除随文件失效的章节偏移索引
+
+        Args:
+            item: 重写请求
+        """
+        try:
+            if item.content:
+                with open(item.filename, 'w') as t:
+                    t.write(item.content)
+            elif os.path.exists(item.filename):
+                os.remove(item.filename)
+            if os.path.exists(f'{item.filename}.idx'):  # 章节偏移索引随文件失效
+                os.remove(f'{item.filename}.idx')
+        except Exception as e:  # 记录异常，不中断写入线程
+            logger.error(f'[DocWriter] fail to rewrite {item.filename}, err={e}')
+            self._error = e
+
+    def _write(self, batch: Dict[str, List[str]]):
+        """
+        按文件写入一批内容
+
+        Args:
+            batch: 文件名到内容列表的映射
+        """
+        if not batch:
+            return
+        ctime = time.time()
+        for filename, contents in batch.items():
+            try:
+                _dir = os.path.dirname(filename)  # 获取目录路径
+                if _dir and _dir not in self._dirs:  # 每个目录只创建一次
+                    os.makedirs(_dir, exist_ok=True)
+                    self._dirs.add(_dir)
+                with open(filename, 'a') as t:  # 每个文件每批只打开一次
+                    t.write(''.join(contents))
+                self._docs += len(contents)
+            except Exception as e:  # 记录异常，不中断写入线程
+                logger.error(f'[DocWriter] fail to write {filename}, err={e}')
+                self._error = e
+        self._batches += 1
+        self._cost += time.time() - ctime
+        logger.debug(f'[DocWriter] write batch of {sum(map(len, batch.values()))} docs into {len(batch)} files, '
+                     f'cost: {time.time() - ctime:.3f}s, queue depth: {self._queue.qsize()}')
+
+
+# markdown文件的章节偏移索引，保存在文件旁的.idx文件中，用于只读取单个符号的文档
+class _SectionIndex:
+    """
+    markdown文件的章节偏移索引
+
+    记录每个符号的章节在文件中的(字节偏移, 字节长度)，以及建立索引时文件的修改时间与大小；
+    文件发生变化后，下一次读取时自动重建索引。读取与重建不持有任何锁，由调用方确认读取期间文件未被写入后再安装结果
+    """
+
+    def __init__(self, filename: str):
+        """
+        初始化章节索引
+
+        Args:
+            filename: markdown文件的完整路径名
+        """
+        self._filename = filename  # markdown文件路径
+        self._path = f'{filename}.idx'  # 索引文件路径
+        # 建立索引时文件的(修改时间, 大小)与符号名到(偏移, 长度)的映射，整体替换
+        self._state: Tuple[Optional[Tuple[int, int]], Dict[str, Tuple[int, int]]] = (None, {})
+
+    def _refresh(self, stamp: Tuple[int, int]) -> Dict[str, Tuple[int, int]]:
+        """
+        获取与文件一致的索引，优先使用内存中的索引与索引文件，失效时重建
+
+        Args:
+            stamp: 文件当前的(修改时间, 大小)
+
+        Returns:
+            符号名到(偏移, 长度)的映射
+        """
+        current, sections = self._state
+        if current == stamp:  # 内存中的索引仍然有效
+            return sections
+        try:
+            with open(self._path, 'r') as t:
+                data = json.load(t)
+            if (data['mtime'], data['size']) == stamp:  # 索引文件仍然有效
+                return {k: tuple(v) for k, v in data['sections'].items()}
+        except (OSError, ValueError, KeyError):  # 索引文件不存在或已损坏
+            pass
+        sections = self._build(stamp[1])  # 重建索引
+        tmp = f'{self._path}.{threading.get_ident()}.tmp'  # 各线程使用各自的临时文件
+        with open(tmp, 'w') as t:  # 先写临时文件再替换，避免留下不完整的索引
+            json.dump({'mtime': stamp[0], 'size': stamp[1], 'sections': sections}, t)
+        os.replace(tmp, self._path)
+        logger.debug(f'[SectionIndex] rebuild {self._path}, sections count: {len(sections)}')
+        return sections
+
+    def _build(self, size: int) -> Dict[str, Tuple[int, int]]:
+        """
+        扫描markdown文件，按与Doc.from_doc相同的规则切分章节并记录偏移
+
+        Args:
+            size: 文件大小
+
+        Returns:
+            符号名到(偏移, 长度)的映射，同名章节以先出现者为准
+        """
+        sections: Dict[str, Tuple[int, int]] = {}
+        if size == 0:  # 空文件无法映射
+            return sections
+        with open(self._filename, 'rb') as t, mmap.mmap(t.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            start = mm.find(b'###')  # 第一个章节的起点
+            while start >= 0:
+                end = mm.find(b'\n### ', start + 3)  # 当前章节在下一个三级标题前结束
+                stop = end if end >= 0 else size
+                title = mm.find(b'### ', start, stop)  # 定位章节标题
+                newline = mm.find(b'\n', title + 4, stop) if title >= 0 else -1  # 标题行的结尾
+                if newline >= 0:  # 只索引标题完整的章节
+                    name = mm[title + 4:newline].decode('utf-8').strip()
+                    sections.setdefault(name, (start, stop - start))
+                start = end + 1 if end >= 0 else -1  # 下一个章节从三级标题开始
+        return sections
+
+    def read(self, symbol: str, doc_type: Type[T]) -> Tuple[Tuple[Tuple[int, int], Dict[str, Tuple[int, int]]],
+                                                            Optional[T]]:
+        """
+        只解析指定符号所在的章节，不修改内存中的索引
+
+        Args:
+            symbol: 符号名称
+            doc_type: 文档类型
+
+        Returns:
+            读取时的索引状态（交给install安装），以及文档对象，如果未找到则为None
+        """
+        st = os.stat(self._filename)
+        stamp = (st.st_mtime_ns, st.st_size)
+        sections = self._refresh(stamp)
+        section = sections.get(symbol)
+        if section is None:
+            return (stamp, sections), None
+        offset, length = section
+        with open(self._filename, 'rb') as t, mmap.mmap(t.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return (stamp, sections), doc_type.from_chapter(mm[offset:offset + length].decode('utf-8'))
+
+    def install(self, state: Tuple[Tuple[int, int], Dict[str, Tuple[int, int]]]):
+        """
+        安装read返回的索引状态，供之后的读取复用
+
+        Args:
+            state: 文件的(修改时间, 大小)与章节映射
+        """
+        self._state = state
+
+
+# 内存中的文档存储，按文件名与符号名索引文档，写入时经由写入线程追加到markdown文件
+class MarkdownDocStore(DocStore):
+    """
+    线程安全的内存文档存储
+
+    每个markdown文件在第一次被访问时解析一次，此后的读取均在内存中以O(1)的代价完成；
+    写入时立即更新内存索引，再交给写入线程异步追加到markdown文件，保证断点续跑时已有文档仍然可用。
+    只读取单个符号且文件尚未解析时，借助章节偏移索引只解析该符号所在的章节
+    """
+
+    def __init__(self):
+        """
+        初始化文档存储
+        """
+        self._files: Dict[str, _DocFile] = {}  # 文件名到文档索引的映射
+        self._sections: Dict[str, _SectionIndex] = {}  # 尚未解析的文件的章节偏移索引
+        self._lock = threading.RLock()  # 保护索引的锁
+        self._writer = _DocWriter()  # 异步写入器
+
+    def _hydrate(self, filename: str, doc_type: Type[Doc]) -> _DocFile:
+        """
+        获取文件的内存索引，若尚未加载则从markdown文件解析
+
+        Args:
+            filename: 完整的文件路径名
+            doc_type: 文档类型
+
+        Returns:
+            文件的内存索引
+        """
+        with self._lock:
+            f = self._files.get(filename)  # 查找已加载的索引
+            if f is not None:  # 如果已加载
+                return f  # 直接返回
+            f = _DocFile()  # 创建新的索引
+            if os.path.exists(filename):  # 如果文件存在，解析其中的全部文档
+                with open(filename, 'r') as t:
+                    for doc in doc_type.from_doc(t.read()):
+                        f.append(doc)
+                logger.debug(f'[MarkdownDocStore] hydrate {filename}, docs count: {len(f.docs)}')  # 记录加载信息
+            self._files[filename] = f  # 缓存索引
+            self._sections.pop(filename, None)  # 文件已完整解析，不再需要章节偏移索引
+            return f  # 返回索引
+
+    def save(self, filename: str, doc: Doc):
+        """
+        写入文档，更新内存索引并提交给写入线程追加到markdown文件
+
+        Args:
+            filename: 完整的文件路径名
+            doc: 文档对象
+        """
+        with self._lock:
+            f = self._hydrate(filename, type(doc))  # 确保文件中已有的文档先被索引
+            f.append(doc.model_copy())  # 保存副本，避免调用方后续修改影响索引
+            # 在锁内提交，保证写入线程中追加与重写的顺序与内存索引的修改顺序一致
+            self._writer.put(filename, doc.markdown() + '\n')  # 写入文档的Markdown表示
+
+    def flush(self):
+        """
+        刷新屏障，等待此前提交的文档全部写入markdown文件
+        """
+        self._writer.flush()
+
+    def close(self):
+        """
+        写完此前提交的文档后停止写入线程，内存中的文档仍可读取
+        """
+        self._writer.close()
+
+    def remove(self, filename: str, doc_type: Type[Doc], symbols: Optional[Set[str]] = None) -> int:
+        """
+        删除文件中的文档，立即更新内存索引，再由写入线程在此前提交的追加之后按剩余文档重写markdown文件，
+        没有剩余文档时删除文件。可在度量任务中与其他文档的写入并发调用
+
+        Args:
+            filename: 完整的文件路径名
+            doc_type: 文档类型
+            symbols: 要删除的符号名集合，为None时删除文件中的全部文档
+
+        Returns:
+            删除的文档数
+        """
+        with self._lock:
+            f = self._hydrate(filename, doc_type)
+            kept = [] if symbols is None else [d for d in f.docs if d.name not in symbols]
+            removed = len(f.docs) - len(kept)
+            if removed == 0:
+                return 0
+            self._files[filename] = _DocFile()
+            for doc in kept:
+                self._files[filename].append(doc)
+            # 与逐个追加写入的格式一致
+            self._writer.rewrite(filename, ''.join(map(lambda d: d.markdown() + '\n', kept)))
+        logger.debug(f'[MarkdownDocStore] remove {removed} docs from {filename}')
+        return removed
+
+    def load_all(self, filename: str, doc_type: Type[T]) -> List[T]:
+        """
+        读取文件中的全部文档
+
+        Args:
+            filename: 完整的文件路径名
+            doc_type: 文档类型
+
+        Returns:
+            文档对象列表，每个元素都是副本
+        """
+        f = self._hydrate(filename, doc_type)  # 获取文件索引
+        with self._lock:
+            return [d.model_copy() for d in f.docs]  # 返回副本，避免调用方修改影响索引
+
+    def load(self, symbol: str, filename: str, doc_type: Type[T]) -> Optional[T]:
+        """
+        读取文件中指定符号的文档
+
+        Args:
+            symbol: 符号名称
+            filename: 完整的文件路径名
+            doc_type: 文档类型
+
+        Returns:
+            文档对象的副本，如果未找到则返回None
+        """
+        index = None
+        with self._lock:
+            if filename not in self._files and os.path.exists(filename):
+                index = self._sections.setdefault(filename, _SectionIndex(filename))
+        if index is not None:
+            # 文件尚未解析时，本存储不会有待写入的内容，可以在锁外按偏移只读取一个章节；
+            # 写入前总会先解析文件，读取后文件仍未解析，说明读取期间没有线程写入该文件，结果有效
+            try:
+                state, doc = index.read(symbol, doc_type)
+            except (OSError, ValueError):
+                with self._lock:
+                    if filename not in self._files:  # 文件未被写入，是文件本身的错误
+                        raise
+            else:
+                with self._lock:
+                    if filename not in self._files:
+                        index.install(state)
+                        return doc
+        f = self._hydrate(filename, doc_type)  # 获取文件索引，读取期间文件被写入时改为读取内存索引
+        with self._lock:
+            doc = f.index.get(symbol)  # 按符号名查找
+            return doc.model_copy() if doc is not None else None  # 返回副本
+
+
+# 基于SQLite的文档存储，每个文档占一行，markdown文件在导出时统一生成
+class SqliteDocStore(DocStore):
+    """
+    线程安全的SQLite文档存储
+
+    使用WAL模式的单个数据库文件，按(文件名, 符号名)建立索引；写入在事务中累积，满一批后统一提交。
+    首次访问某个文件名时，会把已有的markdown文件导入数据库，保证从旧的docs目录断点续跑时文档仍然可用
+    """
+
+    def __init__(self, db_path: str, batch_size: int = 64):
+        """
+        初始化SQLite文档存储
+
+        Args:
+            db_path: 数据库文件路径
+            batch_size: 每批提交的写入数量
+        """
+        _dir = os.path.dirname(db_path)  # 获取目录路径
+        if _dir:  # 如果目录不为空
+            os.makedirs(_dir, exist_ok=True)  # 创建目录，如果已存在则不报错
+        self._batch_size = batch_size  # 每批提交的写入数量
+        self._pending = 0  # 尚未提交的写入数量
+        self._lock = threading.RLock()  # 所有线程共用一个连接，由锁保证串行访问
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)  # 打开数据库
+        self._conn.execute('PRAGMA journal_mode=WAL')  # 开启WAL模式
+        self._conn.execute('PRAGMA synchronous=NORMAL')  # WAL模式下降低fsync频率
+        self._conn.execute('CREATE TABLE IF NOT EXISTS docs ('
+                           'id INTEGER PRIMARY KEY AUTOINCREMENT, '
+                           'filename TEXT NOT NULL, '
+                           'doc_type TEXT NOT NULL, '
+                           'symbol TEXT NOT NULL, '
+                           'content TEXT NOT NULL)')  # 文档表，content为文档的markdown表示
+        self._conn.execute('CREATE INDEX IF NOT EXISTS idx_docs_symbol ON docs (filename, symbol)')  # 按文件名与符号名索引
+        self._conn.execute('CREATE TABLE IF NOT EXISTS files (filename TEXT PRIMARY KEY)')  # 已导入markdown的文件名
+        self._conn.commit()
+        self._files = set(r[0] for r in self._conn.execute('SELECT filename FROM files'))  # 已导入的文件名缓存
+        logger.info(f'[SqliteDocStore] open {db_path}, files count: {len(self._files)}')
+
+    def _hydrate(self, filename: str, doc_type: Type[Doc]):
+        """
+        首次访问文件名时，将已有的markdown文件导入数据库
+
+        Args:
+            filename: 完整的文件路径名
+            doc_type: 文档类型
+        """
+        with self._lock:
+            if filename in self._files:  # 如果已导入
+                return
+            if os.path.exists(filename):  # 如果markdown文件存在，导入其中的全部文档
+                with open(filename, 'r') as t:
+                    docs = doc_type.from_doc(t.read())
+                self._conn.executemany('INSERT INTO docs (filename, doc_type, symbol, content) VALUES (?, ?, ?, ?)',
+                                       [(filename, doc_type.doc_type(), d.name, d.markdown()) for d in docs])
+                logger.debug(f'[SqliteDocStore] import {filename}, docs count: {len(docs)}')
+            self._conn.execute('INSERT OR IGNORE INTO files (filename) VALUES (?)', (filename,))
+            self.flush()  # 导入结果立即提交
+            self._files.add(filename)
+
+    def save(self, filename: str, doc: Doc):
+        """
+        写入文档，满一批后提交事务
+
+        Args:
+            filename: 完整的文件路径名
+            doc: 文档对象
+        """
+        with self._lock:
+            self._hydrate(filename, type(doc))  # 确保markdown中已有的文档先被导入
+            self._conn.execute('INSERT INTO docs (filename, doc_type, symbol, content) VALUES (?, ?, ?, ?)',
+                               (filename, doc.doc_type(), doc.name, doc.markdown()))
+            self._pending += 1
+            if self._pending >= self._batch_size:  # 满一批后提交
+                self.flush()
+
+    def flush(self):
+        """
+        提交尚未提交的写入
+        """
+        with self._lock:
+            self._conn.commit()
+            self._pending = 0
+
+    def remove(self, filename: str, doc_type: Type[Doc], symbols: Optional[Set[str]] = None) -> int:
+        """
+        删除文件中的文档，文件中没有剩余文档时同时删除已导出的markdown文件，避免导出时保留旧内容
+
+        Args:
+            filename: 完整的文件路径名
+            doc_type: 文档类型
+            symbols: 要删除的符号名集合，为None时删除文件中的全部文档
+
+        Returns:
+            删除的文档数
+        """
+        with self._lock:
+            self._hydrate(filename, doc_type)  # 确保markdown中已有的文档先被导入
+            if symbols is None:
+                removed = self._conn.execute('DELETE FROM docs WHERE filename = ?', (filename,)).rowcount
+            else:
+                removed = sum(self._conn.execute('DELETE FROM docs WHERE filename = ? AND symbol = ?',
+                                                 (filename, s)).rowcount for s in symbols)
+            remaining = self._conn.execute('SELECT COUNT(*) FROM docs WHERE filename = ?', (filename,)).fetchone()[0]
+            self.flush()
+        if removed and remaining == 0 and os.path.exists(filename):
+            os.remove(filename)
+        if removed:
+            logger.debug(f'[SqliteDocStore] remove {removed} docs from {filename}')
+        return removed
+
+    def load_all(self, filename: str, doc_type: Type[T]) -> List[T]:
+        """
+        读取文件中的全部文档
+
+        Args:
+            filename: 完整的文件路径名
+            doc_type: 文档类型
+
+        Returns:
+            文档对象列表
+        """
+        self._hydrate(filename, doc_type)
+        with self._lock:  # 同一连接可以读到尚未提交的写入
+            rows = self._conn.execute('SELECT content FROM docs WHERE filename = ? ORDER BY id', (filename,)).fetchall()
+        return [doc_type.from_chapter(r[0]) for r in rows]
+
+    def load(self, symbol: str, filename: str, doc_type: Type[T]) -> Optional[T]:
+        """
+        读取文件中指定符号的文档，同名文档以先写入者为准
+
+        Args:
+            symbol: 符号名称
+            filename: 完整的文件路径名
+            doc_type: 文档类型
+
+        Returns:
+            文档对象，如果未找到则返回None
+        """
+        self._hydrate(filename, doc_type)
+        with self._lock:
+            row = self._conn.execute('SELECT content FROM docs WHERE filename = ? AND symbol = ? ORDER BY id LIMIT 1',
+                                     (filename, symbol)).fetchone()
+        return doc_type.from_chapter(row[0]) if row else None
+
+    def export(self):
+        """
+        将数据库中的文档按文件名渲染为markdown文件，覆盖已有文件
+        """
+        with self._lock:
+            self.flush()
+            rows = self._conn.execute('SELECT filename, content FROM docs ORDER BY filename, id').fetchall()
+        contents: Dict[str, List[str]] = {}
+        for filename, content in rows:
+            contents.setdefault(filename, []).append(content)
+        for filename, docs in contents.items():
+            _dir = os.path.dirname(filename)
+            if _dir:
+                os.makedirs(_dir, exist_ok=True)
+            with open(filename, 'w') as t:
+                t.write(''.join(map(lambda d: d + '\n', docs)))  # 与逐个追加写入的格式一致
+        logger.info(f'[SqliteDocStore] export {len(rows)} docs into {len(contents)} files')
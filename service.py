@@ -166,6 +166,7 @@ def run_with_response(path: str, req: RATask):
         path: 仓库路径
         req: 任务请求对象
     """
+    ctx = None
     try:
         lang = LangEnum.from_render(req.language)  # 从请求获取语言类型
         ctx = EvaContext(doc_path=os.path.join('docs', path), resource_path=os.path.join('resource', path),
@@ -188,6 +189,9 @@ def run_with_response(path: str, req: RATask):
         requests_with_retry(req.callback,
                             content=RAResult(id=req.id, status=RAStatus.fail.value, message=str(e)).model_dump_json(
                                 exclude_none=True, exclude_unset=True))  # 发送失败回调
+    finally:
+        if ctx is not None:  # 评估失败时同样停止文档写入线程，避免长期运行的服务为每个任务泄漏一个线程
+            ctx.close()
     # 清扫工作路径
     # shutil.rmtree(f'resource/{path}')
     # shutil.rmtree(f'output/{path}')
@@ -1,10 +1,16 @@
+from .adaptive_limiter import AdaptiveLimiter
 from .ast_generator import gen_sh
 from .common import prefix_with, LangEnum, remove_cycle
+from .context_packer import ContextPacker
+from .endpoints import EndpointPool
 from .file_helper import resolve_archive
-from .llm_helper import SimpleLLM, ToolsLLM
-from .multi_task_dispatch import TaskDispatcher, Task
+from .hedge import HedgePolicy
+from .llm_cache import ResponseCache
+from .llm_helper import SimpleLLM, ToolsLLM, TokenUsage
+from .multi_task_dispatch import TaskDispatcher, AsyncTaskDispatcher, Task
 from .rag_helper import SimpleRAG
+from .retry import RetryPolicy, llm_stage
 from .settings import ChatCompletionSettings, RagSettings, llm_thread_pool
 
 __all__ = ['SimpleLLM', 'ToolsLLM', 'ChatCompletionSettings', 'RagSettings', 'prefix_with', 'gen_sh', 'resolve_archive',
-           'SimpleRAG', 'TaskDispatcher', 'Task', 'llm_thread_pool', 'LangEnum', 'remove_cycle']
+           'SimpleRAG', 'ContextPacker', 'ResponseCache', 'AdaptiveLimiter', 'RetryPolicy', 'HedgePolicy', 'EndpointPool', 'TokenUsage', 'llm_stage', 'TaskDispatcher', 'AsyncTaskDispatcher', 'Task', 'llm_thread_pool', 'LangEnum', 'remove_cycle']
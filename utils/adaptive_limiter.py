@@ -0,0 +1,237 @@
+import asyncio  # 导入asyncio模块，用于异步等待
+import threading  # 导入threading模块，用于同步并发计数
+import time  # 导入time模块，用于计时
+from collections import deque  # 导入双端队列，用于保存等待中的协程
+from contextlib import contextmanager, asynccontextmanager  # 导入上下文管理器工具
+from typing import Deque, Optional, Tuple  # 导入类型提示工具
+
+import httpx  # 导入httpx，用于识别超时异常
+from loguru import logger  # 导入日志记录器
+from openai import APITimeoutError  # 导入OpenAI的超时异常
+
+from .settings import ProjectSettings  # 导入项目设置
+
+# 视为端点过载的异常
+OVERLOAD_ERRORS = (httpx.TimeoutException, APITimeoutError)
+
+
+# AIMD自适应并发控制器
+class AdaptiveLimiter:
+    """
+    LLM请求的自适应并发上限，采用加性增、乘性减（AIMD）策略
+
+    每个请求成功后上限增加1/上限（即每轮满并发约增加1），收到429/5xx响应或请求超时时上限减半，
+    同一冷却时间内的多次过载只减一次，使并发数收敛到端点的实际处理能力
+    """
+    _instance: Optional['AdaptiveLimiter'] = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, initial: int, minimum: int, maximum: int, backoff: float = 0.5, cooldown: float = 1,
+                 slow: float = 0):
+        """
+        初始化控制器
+
+        Args:
+            initial: 初始并发上限
+            minimum: 并发上限的下限
+            maximum: 并发上限的上限
+            backoff: 过载时上限的缩减比例
+            cooldown: 两次缩减之间的最短间隔（秒）
+            slow: 单个请求耗时超过该值（秒）时视为过载，0表示不按耗时判断
+        """
+        self._limit = float(min(max(initial, minimum), maximum))
+        self._minimum = minimum
+        self._maximum = maximum
+        self._backoff = backoff
+        self._cooldown = cooldown
+        self._slow = slow
+        self._inflight = 0  # 正在进行的请求数
+        self._last_cut = 0.0  # 上次缩减的时间
+        self._cond = threading.Condition()
+        self._waiters: Deque[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = deque()  # 等待名额的协程
+        self.peak = int(self._limit)  # 上限的历史最大值
+        self.cuts = 0  # 缩减次数
+
+    @classmethod
+    def get_instance(cls) -> Optional['AdaptiveLimiter']:
+        """
+        获取进程内共享的控制器，未启用自适应并发时返回None
+
+        Returns:
+            控制器实例
+        """
+        settings = ProjectSettings()
+        if not settings.llm_adaptive:
+            return None
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls(settings.llm_concurrency_init, settings.llm_concurrency_min,
+                                    settings.llm_concurrency, slow=settings.llm_slow_latency)
+            return cls._instance
+
+    @property
+    def limit(self) -> int:
+        """
+        当前的并发上限
+
+        Returns:
+            并发上限
+        """
+        return int(self._limit)
+
+    @property
+    def inflight(self) -> int:
+        """
+        正在进行的请求数
+
+        Returns:
+            请求数
+        """
+        return self._inflight
+
+    def _try_acquire(self) -> bool:
+        """
+        尝试占用一个并发名额，调用方需持有锁
+
+        Returns:
+            是否占用成功
+        """
+        if self._inflight < int(self._limit):
+            self._inflight += 1
+            return True
+        return False
+
+    def acquire(self):
+        """
+        阻塞直到有空闲的并发名额
+        """
+        with self._cond:
+            while not self._try_acquire():
+                self._cond.wait()
+
+    def _wake(self):
+        """
+        按空闲名额数唤醒等待中的协程，调用方需持有锁。被唤醒的协程重新尝试占用名额，失败时重新排队
+        """
+        free = int(self._limit) - self._inflight
+        while free > 0 and self._waiters:
+            loop, future = self._waiters.popleft()
+            if future.done():  # 已被取消
+                continue
+            loop.call_soon_threadsafe(self._resolve, future)
+            free -= 1
+
+    @classmethod
+    def _resolve(cls, future: asyncio.Future):
+        """
+        在协程所在的事件循环中唤醒协程
+
+        Args:
+            future: 协程等待的Future
+        """
+        if not future.done():
+            future.set_result(None)
+
+    async def aacquire(self):
+        """
+        acquire的异步版本，在Future上等待release的唤醒，不阻塞事件循环
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._cond:
+                if self._try_acquire():
+                    return
+                future = loop.create_future()
+                self._waiters.append((loop, future))
+            try:
+                await future
+            except asyncio.CancelledError:
+                with self._cond:  # 被唤醒后才取消时，将名额转交给其他协程
+                    self._wake()
+                raise
+
+    def release(self, ok: bool, latency: float = 0):
+        """
+        释放并发名额，请求健康时加性增加上限
+
+        Args:
+            ok: 请求是否成功
+            latency: 请求耗时（秒）
+        """
+        if ok and self._slow and latency > self._slow:
+            self.overload('slow response')
+            ok = False
+        with self._cond:
+            self._inflight -= 1
+            if ok and self._limit < self._maximum:
+                before = int(self._limit)
+                self._limit = min(self._maximum, self._limit + 1 / self._limit)
+                if int(self._limit) > before:
+                    self.peak = max(self.peak, int(self._limit))
+                    logger.debug(f'[AdaptiveLimiter] concurrency limit: {int(self._limit)}')
+            self._cond.notify_all()
+            self._wake()
+
+    def overload(self, reason: str):
+        """
+        端点过载时乘性减小上限，冷却时间内只减一次
+
+        Args:
+            reason: 过载原因，用于日志
+        """
+        with self._cond:
+            now = time.monotonic()
+            if now - self._last_cut < self._cooldown:
+                return
+            self._last_cut = now
+            self._limit = max(self._minimum, self._limit * self._backoff)
+            self.cuts += 1
+        logger.warning(f'[AdaptiveLimiter] {reason}, concurrency limit: {int(self._limit)}')
+
+    def observe(self, status_code: int):
+        """
+        观察HTTP响应状态码，429与5xx视为过载，包括SDK内部重试的请求
+
+        Args:
+            status_code: HTTP状态码
+        """
+        if status_code == 429 or status_code >= 500:
+            self.overload(f'HTTP {status_code}')
+
+    @contextmanager
+    def slot(self):
+        """
+        占用一个并发名额执行请求，结束后按结果调整上限
+        """
+        self.acquire()
+        start, ok = time.monotonic(), False
+        try:
+            yield
+            ok = True
+        except OVERLOAD_ERRORS:
+            self.overload('timeout')
+            raise
+        finally:
+            self.release(ok, time.monotonic() - start)
+
+    @asynccontextmanager
+    async def aslot(self):
+        """
+        slot的异步版本
+        """
+        await self.aacquire()
+        start, ok = time.monotonic(), False
+        try:
+            yield
+            ok = True
+        except OVERLOAD_ERRORS:
+            self.overload('timeout')
+            raise
+        finally:
+            self.release(ok, time.monotonic() - start)
+
+    def report(self):
+        """
+        输出并发上限的统计日志
+        """
+        logger.info(f'[AdaptiveLimiter] concurrency limit: {self.limit}, peak: {self.peak}, cuts: {self.cuts}')
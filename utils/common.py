@@ -86,7 +86,7 @@ class LangEnum(_Lang, Enum):
 def remove_cycle(callgraph: nx.DiGraph):
     """
     去除有向图中的环，使其变成有向无环图(DAG)
-    针对每个环，删除PageRank值最小的节点的入边
+    针对每个环，删除PageRank值最小的节点的入边，各节点的PageRank值记录在节点的rank属性中
     
     Args:
         callgraph: 需要处理的有向图
@@ -95,6 +95,7 @@ def remove_cycle(callgraph: nx.DiGraph):
         去除环后的有向无环图
     """
     rank = nx.pagerank(callgraph)  # 计算图中各节点的PageRank值
+    nx.set_node_attributes(callgraph, rank, 'rank')  # 记录PageRank值，用于衡量节点的重要性
     while not nx.is_directed_acyclic_graph(callgraph):  # 当图不是有向无环图时循环
         cycle = list(nx.find_cycle(callgraph))  # 寻找一个环
         edge_to_remove = min(cycle, key=lambda x: rank[x[1]])  # 找到环中PageRank值最小的节点的入边
@@ -0,0 +1,128 @@
+import threading  # 导入threading模块，用于保护统计计数
+from collections import defaultdict  # 导入默认字典，用于按阶段计数
+from typing import Any, Callable, Dict, List, Tuple, TypeVar  # 导入类型提示工具
+
+from loguru import logger  # 导入日志记录器
+
+from .retry import current_stage  # 导入当前的LLM调用阶段
+from .settings import ChatCompletionSettings  # 导入聊天完成设置
+
+T = TypeVar('T')
+
+
+# 按token预算打包提示中的上下文（如调用者、被调用者的文档）
+class ContextPacker:
+    """
+    上下文打包器
+
+    上下文的总token数超过预算时，按相关度从高到低保留：先为尽可能多的条目保留摘要，
+    再按相关度依次将摘要替换为完整内容，预算内放不下摘要的条目被丢弃。
+    token数使用MODEL_TOKENIZER指定的分词器计算，未指定时按每3个字符1个token估计
+    """
+    _instances: Dict[Tuple[int, str], 'ContextPacker'] = {}
+    _instances_lock = threading.Lock()
+    _saved: Dict[str, int] = defaultdict(int)  # 各阶段节省的token数
+    _summarized: Dict[str, int] = defaultdict(int)  # 各阶段降级为摘要的条目数
+    _dropped: Dict[str, int] = defaultdict(int)  # 各阶段丢弃的条目数
+    _stats_lock = threading.Lock()
+
+    def __init__(self, budget: int, tokenizer: Any = None):
+        """
+        初始化打包器
+
+        Args:
+            budget: 上下文的token预算，0表示不限制
+            tokenizer: Hugging Face分词器，为None时按字符数估计
+        """
+        self.budget = budget
+        self._tokenizer = tokenizer
+
+    @classmethod
+    def get_instance(cls, setting: ChatCompletionSettings) -> 'ContextPacker':
+        """
+        获取进程内共享的打包器，分词器只加载一次
+
+        Args:
+            setting: 聊天完成设置对象
+
+        Returns:
+            打包器
+        """
+        key = (setting.context_budget, setting.tokenizer)
+        with cls._instances_lock:
+            if key not in cls._instances:
+                tokenizer = None
+                if setting.tokenizer:
+                    from transformers import AutoTokenizer  # 仅在指定分词器时加载
+                    tokenizer = AutoTokenizer.from_pretrained(setting.tokenizer)
+                cls._instances[key] = cls(setting.context_budget, tokenizer)
+            return cls._instances[key]
+
+    def count(self, text: str) -> int:
+        """
+        计算文本的token数
+
+        Args:
+            text: 文本
+
+        Returns:
+            token数
+        """
+        if self._tokenizer is None:
+            return len(text) // 3
+        return len(self._tokenizer.encode(text, add_special_tokens=False))
+
+    def pack(self, items: List[T], render: Callable[[T], str], summarize: Callable[[T], T],
+             rank: Callable[[T], float]) -> List[T]:
+        """
+        在预算内选择上下文条目
+
+        Args:
+            items: 上下文条目
+            render: 条目在提示中的文本
+            summarize: 生成条目的摘要，如只保留描述的文档
+            rank: 条目的相关度，越大越优先保留
+
+        Returns:
+            保留的条目（完整内容或摘要），保持原有顺序；未超出预算时原样返回
+        """
+        if not self.budget:  # 不限制时无需计算token数
+            return items
+        full = [self.count(render(item)) for item in items]
+        if sum(full) <= self.budget:
+            return items
+        summaries = [summarize(item) for item in items]
+        brief = [min(f, self.count(render(s))) for f, s in zip(full, summaries)]
+        order = sorted(range(len(items)), key=lambda i: rank(items[i]), reverse=True)
+        chosen: Dict[int, T] = {}
+        used = 0
+        for i in order:  # 按相关度为尽可能多的条目保留摘要
+            if used + brief[i] <= self.budget:
+                chosen[i] = summaries[i]
+                used += brief[i]
+        for i in order:  # 按相关度将摘要替换为完整内容
+            if i in chosen and used - brief[i] + full[i] <= self.budget:
+                chosen[i] = items[i]
+                used += full[i] - brief[i]
+        summarized = sum(1 for i, item in chosen.items() if item is not items[i])
+        dropped = len(items) - len(chosen)
+        stage = current_stage()
+        with self._stats_lock:
+            self._saved[stage] += sum(full) - used
+            self._summarized[stage] += summarized
+            self._dropped[stage] += dropped
+        logger.debug(f'[ContextPacker] {stage}: {sum(full)} -> {used} tokens, '
+                     f'{summarized} summarized, {dropped} dropped')
+        return [chosen[i] for i in range(len(items)) if i in chosen]
+
+    @classmethod
+    def report(cls):
+        """
+        输出各阶段节省的token数
+        """
+        with cls._stats_lock:
+            if not cls._saved:
+                return
+            for stage, saved in cls._saved.items():
+                logger.info(f'[ContextPacker] {stage}: saved {saved} tokens, '
+                            f'{cls._summarized[stage]} docs summarized, {cls._dropped[stage]} docs dropped')
@@ -0,0 +1,211 @@
+import random  # 导入random模块，用于打散起始端点
+import threading  # 导入threading模块，用于保护端点状态
+import time  # 导入time模块，用于计时
+from collections import deque  # 导入双端队列，用于保存最近的请求耗时
+from contextlib import contextmanager  # 导入上下文管理器工具
+from dataclasses import dataclass, field, replace  # 导入数据类相关工具
+from typing import Dict, List, Tuple  # 导入类型提示工具
+
+from loguru import logger  # 导入日志记录器
+
+from .hedge import HedgeCancelled  # 导入对冲请求的取消异常
+from .retry import RETRYABLE_ERRORS  # 导入可重试的异常，视为端点故障
+from .settings import ChatCompletionSettings  # 导入聊天完成设置
+
+
+@dataclass
+class Endpoint:
+    """
+    一个OpenAI兼容的LLM服务端点及其运行统计
+    """
+    name: str  # 端点名称，用于日志
+    setting: ChatCompletionSettings  # 端点的聊天完成设置，base_url、api_key与model按端点覆盖
+    weight: float = 1  # 路由权重
+    outstanding: int = 0  # 正在进行的请求数
+    requests: int = 0  # 成功的请求数
+    failures: int = 0  # 失败的请求数
+    consecutive_failures: int = 0  # 连续失败次数
+    ejected_until: float = 0  # 被摘除到的时间
+    current: float = 0  # 平滑加权轮询的当前权重
+    busy: float = 0  # 有请求进行中的累计时间，用于计算吞吐
+    busy_since: float = 0  # 本段忙碌开始的时间
+    latencies: deque = field(default_factory=lambda: deque(maxlen=1000))  # 最近的请求耗时
+
+    def available(self, now: float) -> bool:
+        """
+        端点是否可用，摘除期满后重新参与路由，下一次请求即为健康检查
+
+        Args:
+            now: 当前时间
+
+        Returns:
+            是否可用
+        """
+        return now >= self.ejected_until
+
+
+# 多端点路由，支持最少未完成请求与平滑加权轮询，连续失败的端点会被暂时摘除
+class EndpointPool:
+    """
+    LLM服务端点池
+
+    每次请求按路由策略选择一个端点：least_outstanding选择未完成请求数与权重之比最小的端点，
+    weighted_round_robin按权重平滑轮询。端点连续失败达到阈值后摘除一段时间，期满后的第一次请求成功则恢复，
+    失败则再次摘除
+    """
+    _instances: Dict[Tuple, 'EndpointPool'] = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, endpoints: List[Endpoint], routing: str, eject_failures: int, eject_seconds: float):
+        """
+        初始化端点池
+
+        Args:
+            endpoints: 端点列表
+            routing: 路由策略，least_outstanding或weighted_round_robin
+            eject_failures: 连续失败多少次后摘除端点
+            eject_seconds: 摘除时长（秒）
+        """
+        if routing not in ('least_outstanding', 'weighted_round_robin'):
+            raise ValueError(f'unsupported routing: {routing}')
+        self.endpoints = endpoints
+        self._routing = routing
+        self._eject_failures = eject_failures
+        self._eject_seconds = eject_seconds
+        self._lock = threading.Lock()
+        self._offset = random.randrange(len(endpoints))  # 权重相同时轮流选择的起点
+
+    @classmethod
+    def get_instance(cls, setting: ChatCompletionSettings) -> 'EndpointPool':
+        """
+        获取进程内共享的端点池，未配置多端点时只包含OPENAI_BASE_URL一个端点
+
+        Args:
+            setting: 聊天完成设置对象
+
+        Returns:
+            端点池
+        """
+        key = (setting.openai_base_url, setting.openai_api_key, setting.model, setting.request_timeout,
+               repr(setting.endpoints), setting.routing)
+        with cls._instances_lock:
+            if key not in cls._instances:
+                cls._instances[key] = cls(cls._endpoints(setting), setting.routing, setting.eject_failures,
+                                          setting.eject_seconds)
+            return cls._instances[key]
+
+    @classmethod
+    def _endpoints(cls, setting: ChatCompletionSettings) -> List[Endpoint]:
+        """
+        按设置创建端点列表，端点未指定的api_key与model沿用默认设置
+
+        Args:
+            setting: 聊天完成设置对象
+
+        Returns:
+            端点列表
+        """
+        if not setting.endpoints:
+            return [Endpoint(setting.openai_base_url, setting)]
+        endpoints = []
+        for e in setting.endpoints:
+            endpoint_setting = replace(setting, openai_base_url=e['base_url'],
+                                       openai_api_key=e.get('api_key', setting.openai_api_key),
+                                       model=e.get('model', setting.model), endpoints=[])
+            endpoints.append(Endpoint(e.get('name', e['base_url']), endpoint_setting, float(e.get('weight', 1))))
+        logger.info(f'[EndpointPool] {len(endpoints)} endpoints, routing: {setting.routing}')
+        return endpoints
+
+    def pick(self) -> Endpoint:
+        """
+        按路由策略选择一个端点，全部被摘除时选择最早期满的端点
+
+        Returns:
+            端点
+        """
+        with self._lock:
+            now = time.monotonic()
+            candidates = [e for e in self.endpoints if e.available(now)]
+            if not candidates:
+                return min(self.endpoints, key=lambda e: e.ejected_until)
+            if len(candidates) == 1:
+                return candidates[0]
+            if self._routing == 'weighted_round_robin':
+                # 平滑加权轮询：每次所有端点累加自身权重，选择当前权重最大的端点并减去总权重
+                total = sum(e.weight for e in candidates)
+                for e in candidates:
+                    e.current += e.weight
+                chosen = max(candidates, key=lambda e: e.current)
+                chosen.current -= total
+                return chosen
+            self._offset = (self._offset + 1) % len(candidates)
+            rotated = candidates[self._offset:] + candidates[:self._offset]
+            return min(rotated, key=lambda e: (e.outstanding + 1) / e.weight)
+
+    @contextmanager
+    def track(self, endpoint: Endpoint):
+        """
+        记录端点上一次请求的耗时与结果，超时、429、5xx等故障累计达到阈值时摘除端点
+
+        Args:
+            endpoint: 端点
+        """
+        with self._lock:
+            start = time.monotonic()
+            if endpoint.outstanding == 0:
+                endpoint.busy_since = start
+            endpoint.outstanding += 1
+        ok, failed = False, False  # 被取消或非端点原因的错误既不算成功也不算故障
+        try:
+            yield
+            ok = True
+        except HedgeCancelled:
+            raise
+        except RETRYABLE_ERRORS:
+            failed = True
+            raise
+        finally:
+            with self._lock:
+                now = time.monotonic()
+                endpoint.outstanding -= 1
+                if endpoint.outstanding == 0:
+                    endpoint.busy += now - endpoint.busy_since
+                if failed:
+                    endpoint.failures += 1
+                    endpoint.consecutive_failures += 1
+                    if endpoint.consecutive_failures >= self._eject_failures and len(self.endpoints) > 1 \
+                            and endpoint.available(now):  # 已被摘除的端点上并发请求的失败不再重复摘除
+                        endpoint.ejected_until = now + self._eject_seconds
+                        logger.warning(f'[EndpointPool] eject {endpoint.name} for {self._eject_seconds}s after '
+                                       f'{endpoint.consecutive_failures} consecutive failures')
+                elif ok:
+                    if endpoint.consecutive_failures >= self._eject_failures:
+                        logger.info(f'[EndpointPool] {endpoint.name} recovered')
+                    endpoint.consecutive_failures = 0
+                    endpoint.requests += 1
+                    endpoint.latencies.append(now - start)
+
+    def report(self):
+        """
+        输出各端点的吞吐与耗时统计
+        """
+        with self._lock:
+            now = time.monotonic()
+            for e in self.endpoints:
+                busy = e.busy + (now - e.busy_since if e.outstanding else 0)
+                latencies = sorted(e.latencies)
+                p50 = latencies[len(latencies) // 2] if latencies else 0
+                p95 = latencies[int(len(latencies) * 0.95)] if latencies else 0
+                logger.info(f'[EndpointPool] {e.name}: requests {e.requests}, failures {e.failures}, '
+                            f'throughput {e.requests / busy if busy else 0:.2f} req/s, '
+                            f'latency p50 {p50:.2f}s p95 {p95:.2f}s')
+
+    @classmethod
+    def report_all(cls):
+        """
+        输出进程内所有端点池的统计
+        """
+        with cls._instances_lock:
+            pools = list(cls._instances.values())
+        for pool in pools:
+            pool.report()
@@ -0,0 +1,291 @@
+import contextvars  # 导入contextvars模块，用于将调用方的上下文传递到尝试线程
+import threading  # 导入threading模块，用于并发执行请求与同步状态
+import time  # 导入time模块，用于计时
+from collections import deque  # 导入双端队列，用于保存最近的首token耗时
+from typing import Any, Callable, Dict, List, Optional, Tuple  # 导入类型提示工具
+
+from loguru import logger  # 导入日志记录器
+
+from .settings import ChatCompletionSettings  # 导入聊天完成设置
+
+
+class HedgeCancelled(Exception):
+    """
+    对冲请求中较慢的一方在另一方完成后被取消
+    """
+    pass
+
+
+# 对冲请求策略，记录首token耗时并决定何时发起对冲请求
+class HedgePolicy:
+    """
+    对冲请求策略
+
+    记录最近请求的首token耗时（TTFT），请求超过其指定分位数仍未收到首token时，
+    发起一个相同的请求并采用先完成的结果，对冲请求数不超过总请求数的指定比例
+    """
+    _instances: Dict[Tuple[float, float], 'HedgePolicy'] = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, percentile: float, max_ratio: float, min_samples: int = 20, window: int = 1000):
+        """
+        初始化对冲策略
+
+        Args:
+            percentile: 触发对冲的首token耗时分位数（0-100）
+            max_ratio: 对冲请求数占总请求数的比例上限
+            min_samples: 样本数不足时不发起对冲
+            window: 保留的最近样本数
+        """
+        self._percentile = percentile
+        self._max_ratio = max_ratio
+        self._min_samples = min_samples
+        self._samples = deque(maxlen=window)  # 最近的首token耗时
+        self._lock = threading.Lock()
+        self.requests = 0  # 总请求数
+        self.hedges = 0  # 发起的对冲请求数
+        self.wins = 0  # 对冲请求先完成的次数
+
+    @classmethod
+    def get_instance(cls, setting: ChatCompletionSettings) -> Optional['HedgePolicy']:
+        """
+        获取进程内共享的对冲策略，未启用对冲时返回None
+
+        Args:
+            setting: 聊天完成设置对象
+
+        Returns:
+            对冲策略
+        """
+        if not setting.hedge:
+            return None
+        key = (setting.hedge_percentile, setting.hedge_max_ratio)
+        with cls._instances_lock:
+            if key not in cls._instances:
+                cls._instances[key] = cls(*key)
+            return cls._instances[key]
+
+    def record(self, ttft: float):
+        """
+        记录一次首token耗时
+
+        Args:
+            ttft: 从发出请求到收到首个响应块的秒数
+        """
+        with self._lock:
+            self._samples.append(ttft)
+
+    def delay(self) -> Optional[float]:
+        """
+        发起对冲前等待首token的时间，即首token耗时的分位数
+
+        Returns:
+            等待秒数，样本不足时返回None
+        """
+        with self._lock:
+            if len(self._samples) < self._min_samples:
+                return None
+            samples = sorted(self._samples)
+        return samples[min(len(samples) - 1, int(len(samples) * self._percentile / 100))]
+
+    def start(self):
+        """
+        记录一次新的请求
+        """
+        with self._lock:
+            self.requests += 1
+
+    def try_hedge(self) -> bool:
+        """
+        在比例上限内申请发起一次对冲请求
+
+        Returns:
+            是否允许发起
+        """
+        with self._lock:
+            if self.hedges + 1 > self.requests * self._max_ratio:
+                return False
+            self.hedges += 1
+            return True
+
+    def won(self):
+        """
+        记录一次对冲请求先完成
+        """
+        with self._lock:
+            self.wins += 1
+
+    def report(self):
+        """
+        输出对冲统计日志
+        """
+        delay = self.delay()
+        logger.info(f'[HedgePolicy] requests: {self.requests}, hedges: {self.hedges}, hedge wins: {self.wins}, '
+                    f'hedge delay: {f"{delay:.2f}s" if delay is not None else "n/a"}')
+
+    @classmethod
+    def report_all(cls):
+        """
+        输出进程内所有对冲策略的统计日志
+        """
+        with cls._instances_lock:
+            policies = list(cls._instances.values())
+        for policy in policies:
+            policy.report()
+
+
+# 同一请求的多次尝试之间的竞速状态
+class HedgeRace:
+    """
+    一次对冲竞速，每个尝试在独立的线程中执行，采用最先成功的结果
+
+    竞速结束时立即关闭其他尝试的流式响应，释放连接、并发名额与端点计数，较慢的尝试随即以HedgeCancelled退出；
+    所有尝试都失败时抛出最后一个异常
+    """
+    def __init__(self, policy: HedgePolicy):
+        """
+        初始化竞速状态
+
+        Args:
+            policy: 对冲策略，用于记录首token耗时
+        """
+        self._policy = policy
+        self._cond = threading.Condition()
+        self._attempts = 0  # 已发起的尝试数
+        self._errors: List[Exception] = []  # 失败的尝试
+        self._first_token = False  # 是否已有尝试收到首token
+        self._done = False  # 是否已有结果或全部失败
+        self._result = None  # 最先成功的结果
+        self._winner = -1  # 最先成功的尝试序号
+        self._responses: Dict[int, Any] = {}  # 各尝试的流式响应，竞速结束时关闭
+
+    def start(self, request: Callable[[Callable[[], bool], Callable[[Any], None]], str]):
+        """
+        在新线程中发起一次尝试
+
+        Args:
+            request: 请求函数，参数为每收到一个响应块调用一次的回调（返回False时应取消请求），
+                以及收到流式响应对象时调用一次的回调
+        """
+        with self._cond:
+            index = self._attempts
+            self._attempts += 1
+        threading.Thread(target=contextvars.copy_context().run, args=(self._run, index, request), daemon=True).start()
+
+    def _run(self, index: int, request: Callable[[Callable[[], bool], Callable[[Any], None]], str]):
+        """
+        执行一次尝试并记录结果
+
+        Args:
+            index: 尝试序号，0为原始请求
+            request: 请求函数
+        """
+        try:
+            res = request(self.on_chunk(time.monotonic()), self.on_response(index))
+        except Exception as e:
+            with self._cond:
+                self._errors.append(e)
+                if len(self._errors) == self._attempts:
+                    self._done = True
+                self._cond.notify_all()
+            return
+        losers = []
+        with self._cond:
+            if not self._done:
+                self._done, self._result, self._winner = True, res, index
+                if index > 0:
+                    self._policy.won()
+                losers = [r for i, r in self._responses.items() if i != index]
+            self._cond.notify_all()
+        for response in losers:  # 关闭仍在等待的其他尝试
+            self._close(response)
+
+    @classmethod
+    def _close(cls, response: Any):
+        """
+        关闭较慢的尝试的流式响应，使其读取线程立即退出
+
+        Args:
+            response: 流式响应对象
+        """
+        try:
+            response.close()
+        except Exception as e:
+            logger.debug(f'[HedgeRace] close response failed: {e}')
+
+    def on_response(self, index: int) -> Callable[[Any], None]:
+        """
+        创建收到流式响应对象时的回调，竞速已结束时立即关闭该响应
+
+        Args:
+            index: 尝试序号
+
+        Returns:
+            回调函数
+        """
+
+        def callback(response: Any):
+            with self._cond:
+                lost = self._done and index != self._winner
+                if not lost:
+                    self._responses[index] = response
+            if lost:
+                self._close(response)
+
+        return callback
+
+    def on_chunk(self, start: float) -> Callable[[], bool]:
+        """
+        创建响应块回调，首个响应块到达时记录首token耗时
+
+        Args:
+            start: 尝试开始的时间
+
+        Returns:
+            回调函数，竞速已结束时返回False，此后不再记录首token耗时
+        """
+        seen = False
+
+        def callback() -> bool:
+            nonlocal seen
+            if self._done:
+                return False
+            if not seen:
+                seen = True
+                self._policy.record(time.monotonic() - start)
+                with self._cond:
+                    self._first_token = True
+                    self._cond.notify_all()
+            return True
+
+        return callback
+
+    def wait_first_token(self, timeout: float) -> bool:
+        """
+        等待首token，竞速结束时也会返回
+
+        Args:
+            timeout: 最长等待秒数
+
+        Returns:
+            是否需要发起对冲，即超时时仍未收到首token且竞速未结束
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: self._first_token or self._done, timeout)
+            return not self._first_token and not self._done
+
+    def result(self) -> str:
+        """
+        等待竞速结束
+
+        Returns:
+            最先成功的结果
+
+        Raises:
+            所有尝试都失败时抛出最后一个异常
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: self._done)
+            if self._winner < 0:
+                raise self._errors[-1]
+            return self._result
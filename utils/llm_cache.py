@@ -0,0 +1,183 @@
+import hashlib  # 导入hashlib模块，用于计算缓存键
+import json  # 导入json模块，用于序列化请求内容
+import os  # 导入os模块，用于创建缓存目录
+import sqlite3  # 导入sqlite3模块，作为磁盘缓存的存储
+import threading  # 导入threading模块，用于保护数据库连接
+import time  # 导入time模块，用于记录访问时间
+from typing import Callable, Dict, List, Optional  # 导入类型提示工具
+
+from loguru import logger  # 导入日志记录器
+
+
+def processor_identity(post_processor: Optional[Callable[[str], str]]) -> str:
+    """
+    后处理函数的标识，lambda的名称相同，因此额外使用字节码、常量与引用的名称区分
+
+    Args:
+        post_processor: 后处理函数
+
+    Returns:
+        后处理函数的标识字符串
+    """
+    if post_processor is None:
+        return ''
+    code = getattr(post_processor, '__code__', None)
+    name = f'{getattr(post_processor, "__module__", "")}.{getattr(post_processor, "__qualname__", repr(post_processor))}'
+    if code is None:
+        return name
+    return f'{name}:{hashlib.sha256(code.co_code + repr((code.co_consts, code.co_names)).encode()).hexdigest()}'
+
+
+def cache_key(model: str, temperature: float, history: List[Dict[str, str]],
+              post_processor: Optional[Callable[[str], str]] = None) -> str:
+    """
+    计算LLM请求的缓存键，由模型、温度、完整对话历史和后处理函数共同决定
+
+    Args:
+        model: 模型名称
+        temperature: 温度参数
+        history: 对话历史
+        post_processor: 后处理函数
+
+    Returns:
+        sha256十六进制摘要
+    """
+    payload = json.dumps({'model': model, 'temperature': temperature, 'messages': history,
+                          'post_processor': processor_identity(post_processor)},
+                         ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+# 基于SQLite的LLM响应缓存，按最近访问时间淘汰
+class ResponseCache:
+    """
+    内容寻址的LLM响应磁盘缓存
+
+    以请求内容的哈希为键保存模型响应，总大小超过上限时按最近访问时间淘汰最旧的条目，
+    数据库使用WAL模式，多个进程（如多个服务任务）可以共享同一个缓存文件
+    """
+    _instances: Dict[str, 'ResponseCache'] = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, path: str, max_bytes: int):
+        """
+        初始化缓存，打开或创建数据库
+
+        Args:
+            path: 缓存数据库路径
+            max_bytes: 缓存内容总大小上限（字节）
+        """
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)  # 确保缓存目录存在
+        self._max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute('CREATE TABLE IF NOT EXISTS cache '
+                           '(key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, atime REAL NOT NULL)')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS cache_atime ON cache (atime)')
+        self._conn.commit()
+        self._size = self._conn.execute('SELECT COALESCE(SUM(size), 0) FROM cache').fetchone()[0]
+        self.hits = 0  # 命中次数
+        self.misses = 0  # 未命中次数
+        self.evictions = 0  # 淘汰条目数
+
+    @classmethod
+    def get_instance(cls, path: str, max_bytes: int) -> 'ResponseCache':
+        """
+        获取进程内共享的缓存实例，同一路径只打开一次
+
+        Args:
+            path: 缓存数据库路径
+            max_bytes: 缓存内容总大小上限（字节）
+
+        Returns:
+            缓存实例
+        """
+        with cls._instances_lock:
+            if path not in cls._instances:
+                cls._instances[path] = cls(path, max_bytes)
+            return cls._instances[path]
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        读取缓存，命中时刷新访问时间
+
+        Args:
+            key: 缓存键
+
+        Returns:
+            缓存的响应，未命中时返回None
+        """
+        with self._lock:
+            row = self._conn.execute('SELECT value FROM cache WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute('UPDATE cache SET atime = ? WHERE key = ?', (time.time(), key))
+            self._conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, key: str, value: str):
+        """
+        写入缓存，超过大小上限时淘汰最久未访问的条目
+
+        Args:
+            key: 缓存键
+            value: 响应内容
+        """
+        size = len(value.encode('utf-8'))
+        with self._lock:
+            old = self._conn.execute('SELECT size FROM cache WHERE key = ?', (key,)).fetchone()
+            self._conn.execute('INSERT OR REPLACE INTO cache (key, value, size, atime) VALUES (?, ?, ?, ?)',
+                               (key, value, size, time.time()))
+            self._size += size - (old[0] if old else 0)
+            if self._size > self._max_bytes:
+                self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        """
+        按访问时间从旧到新淘汰条目，直到总大小降到上限的90%以下，调用方需持有锁
+        """
+        # 其他进程可能也写入了缓存，淘汰前重新统计总大小
+        self._size = self._conn.execute('SELECT COALESCE(SUM(size), 0) FROM cache').fetchone()[0]
+        target = self._max_bytes * 0.9
+        victims = []
+        for key, size in self._conn.execute('SELECT key, size FROM cache ORDER BY atime'):
+            if self._size <= target:
+                break
+            victims.append((key,))
+            self._size -= size
+        self._conn.executemany('DELETE FROM cache WHERE key = ?', victims)
+        self.evictions += len(victims)
+
+    def stats(self) -> Dict[str, int]:
+        """
+        缓存统计信息
+
+        Returns:
+            命中、未命中、淘汰次数和当前总大小
+        """
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions, 'bytes': self._size}
+
+    def report(self):
+        """
+        输出缓存统计日志
+        """
+        total = self.hits + self.misses
+        logger.info(f'[ResponseCache] hits: {self.hits}, misses: {self.misses}, '
+                    f'hit rate: {self.hits / total if total else 0:.2%}, evictions: {self.evictions}, '
+                    f'size: {self._size / 1024 / 1024:.1f}MB')
+
+    @classmethod
+    def report_all(cls):
+        """
+        输出进程内所有缓存实例的统计日志
+        """
+        with cls._instances_lock:
+            caches = list(cls._instances.values())
+        for cache in caches:
+            cache.report()
@@ -1,14 +1,240 @@
+import asyncio  # 导入asyncio模块，用于异步调用
 import json  # 导入json模块，用于处理JSON数据
-import time  # 导入time模块，用于处理时间相关操作
-from typing import Callable  # 导入Callable类型，用于函数类型提示
+import time  # 导入time模块，用于计时
+import threading  # 导入threading模块，用于保护共享客户端的创建
+import weakref  # 导入weakref模块，按事件循环缓存异步客户端
+from contextlib import nullcontext  # 导入空上下文管理器
+from typing import Callable, Dict, Optional, Tuple  # 导入类型提示工具
 
 from loguru import logger  # 导入日志记录工具
-from openai import OpenAI, Stream  # 导入OpenAI客户端和Stream类型
-from openai.types.chat import ChatCompletionChunk  # 导入聊天完成块类型
-from httpx import ReadTimeout  # 导入超时异常
+from openai import OpenAI, AsyncOpenAI, Stream, AsyncStream  # 导入OpenAI同步、异步客户端和Stream类型
+from openai.types.chat import ChatCompletion, ChatCompletionChunk  # 导入聊天完成与聊天完成块类型
+import httpx  # 导入httpx，用于创建共享的连接池
 
+from .adaptive_limiter import AdaptiveLimiter  # 导入自适应并发控制器
+from .llm_cache import ResponseCache, cache_key  # 导入LLM响应缓存
+from .rate_limiter import RateLimiter, estimate_tokens  # 导入RPM/TPM限流器
+from .endpoints import Endpoint, EndpointPool  # 导入多端点路由
+from .hedge import HedgePolicy, HedgeRace, HedgeCancelled  # 导入对冲请求策略
+from .retry import RetryPolicy, TruncatedStreamError  # 导入重试策略
 from .settings import ProjectSettings, ChatCompletionSettings  # 导入项目设置和聊天完成设置
 
+# 进程内共享的OpenAI客户端，按(base_url, api_key, timeout)区分，所有SimpleLLM复用同一个连接池
+_clients: Dict[Tuple[str, str, int], OpenAI] = {}
+# 异步客户端的连接池绑定在事件循环上，因此按事件循环分别缓存，事件循环被回收后自动释放
+_async_clients: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[Tuple[str, str, int], AsyncOpenAI]] = \
+    weakref.WeakKeyDictionary()
+_clients_lock = threading.Lock()
+
+
+def _client_key(setting: ChatCompletionSettings) -> Tuple[str, str, int]:
+    """
+    共享客户端的键
+
+    Args:
+        setting: 聊天完成设置对象
+
+    Returns:
+        (base_url, api_key, timeout)
+    """
+    return setting.openai_base_url, setting.openai_api_key, setting.request_timeout
+
+
+def _limits(setting: ChatCompletionSettings) -> httpx.Limits:
+    """
+    共享连接池的容量与长连接配置
+
+    Args:
+        setting: 聊天完成设置对象
+
+    Returns:
+        httpx连接池限制
+    """
+    return httpx.Limits(max_connections=setting.pool_max_connections,
+                        max_keepalive_connections=setting.pool_max_keepalive,
+                        keepalive_expiry=setting.pool_keepalive_expiry)
+
+
+def _observe_response(response: httpx.Response):
+    """
+    共享连接池的响应钩子，将状态码报告给自适应并发控制器，SDK内部重试的429/5xx同样会被观察到
+
+    Args:
+        response: HTTP响应
+    """
+    limiter = AdaptiveLimiter.get_instance()
+    if limiter is not None:
+        limiter.observe(response.status_code)
+
+
+async def _aobserve_response(response: httpx.Response):
+    """
+    _observe_response的异步版本
+
+    Args:
+        response: HTTP响应
+    """
+    _observe_response(response)
+
+
+def shared_client(setting: ChatCompletionSettings) -> OpenAI:
+    """
+    获取进程内共享的OpenAI客户端，不存在时创建
+
+    Args:
+        setting: 聊天完成设置对象
+
+    Returns:
+        共享的OpenAI客户端
+    """
+    key = _client_key(setting)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = OpenAI(
+                api_key=setting.openai_api_key,  # 设置API密钥
+                base_url=setting.openai_base_url,  # 设置API基础URL
+                timeout=setting.request_timeout,  # 设置请求超时时间
+                max_retries=0,  # 重试由RetryPolicy负责
+                http_client=httpx.Client(limits=_limits(setting), timeout=setting.request_timeout,
+                                         event_hooks={'response': [_observe_response]}),  # 共享连接池
+            )  # 创建OpenAI客户端
+            _clients[key] = client
+            logger.info(f'[SimpleLLM] create shared client for {setting.openai_base_url}')
+        return client
+
+
+def shared_async_client(setting: ChatCompletionSettings) -> AsyncOpenAI:
+    """
+    获取当前事件循环内共享的异步OpenAI客户端，不存在时创建，必须在事件循环中调用
+
+    Args:
+        setting: 聊天完成设置对象
+
+    Returns:
+        共享的异步OpenAI客户端
+    """
+    key = _client_key(setting)
+    loop = asyncio.get_running_loop()
+    with _clients_lock:
+        clients = _async_clients.setdefault(loop, {})
+        client = clients.get(key)
+        if client is None:
+            client = AsyncOpenAI(
+                api_key=setting.openai_api_key,  # 设置API密钥
+                base_url=setting.openai_base_url,  # 设置API基础URL
+                timeout=setting.request_timeout,  # 设置请求超时时间
+                max_retries=0,  # 重试由RetryPolicy负责
+                http_client=httpx.AsyncClient(limits=_limits(setting), timeout=setting.request_timeout,
+                                              event_hooks={'response': [_aobserve_response]}),  # 共享连接池
+            )  # 创建异步OpenAI客户端
+            clients[key] = client
+        return client
+
+
+# 进程内的token用量统计
+class TokenUsage:
+    """
+    累计所有LLM请求的token用量，包括服务端提示缓存命中的token数
+    """
+    _lock = threading.Lock()
+    requests = 0  # 请求数
+    prompt_tokens = 0  # 提示token数
+    cached_tokens = 0  # 提示中命中服务端缓存的token数
+    completion_tokens = 0  # 回复token数
+
+    @classmethod
+    def cached(cls, usage) -> int:
+        """
+        读取用量中命中服务端提示缓存的token数，服务端未返回时为0
+
+        Args:
+            usage: 响应的token使用统计
+
+        Returns:
+            缓存命中的token数
+        """
+        details = getattr(usage, 'prompt_tokens_details', None)
+        return (getattr(details, 'cached_tokens', None) or 0) if details is not None else 0
+
+    @classmethod
+    def record(cls, usage):
+        """
+        累计一次请求的用量
+
+        Args:
+            usage: 响应的token使用统计
+        """
+        with cls._lock:
+            cls.requests += 1
+            cls.prompt_tokens += usage.prompt_tokens
+            cls.cached_tokens += cls.cached(usage)
+            cls.completion_tokens += usage.completion_tokens
+
+    @classmethod
+    def report(cls):
+        """
+        输出token用量统计日志
+        """
+        logger.info(f'[TokenUsage] requests: {cls.requests}, prompt tokens: {cls.prompt_tokens}, '
+                    f'cached tokens: {cls.cached_tokens} ({cls.cached_tokens / cls.prompt_tokens if cls.prompt_tokens else 0:.2%}), '
+                    f'completion tokens: {cls.completion_tokens}')
+
+
+# 流式响应的累积状态，同步与异步的流式响应共用
+class _StreamState:
+    """
+    流式响应的累积状态
+
+    逐块处理模型的流式响应，区分思考过程和回答内容，并根据调试模式设置进行输出
+    """
+    def __init__(self):
+        """
+        初始化累积状态
+        """
+        self.is_thinking = False  # 是否在思考模式的标志
+        self.answer_content = ''  # 初始化响应内容
+        self.usage = None  # 响应的token使用统计
+        self.finished = False  # 是否收到了结束标记（finish_reason或usage）
+
+    def feed(self, chunk: ChatCompletionChunk):
+        """
+        处理一个响应块
+
+        Args:
+            chunk: 流式响应块
+        """
+        if chunk.usage or (chunk.choices and chunk.choices[0].finish_reason):  # 收到结束标记
+            self.finished = True
+        if chunk.choices:  # 如果有选择
+            delta = chunk.choices[0].delta  # 获取增量内容
+            if hasattr(delta, 'reasoning_content') and delta.reasoning_content is not None:  # 如果有推理内容
+                if not ProjectSettings().is_debug():  # 如果不是调试模式
+                    return  # 跳过
+                # 打印思考过程
+                if not self.is_thinking:  # 如果不在思考模式
+                    print('=' * 10 + 'thinking' + '=' * 10)  # 打印思考标记
+                    self.is_thinking = True  # 设置思考模式
+                print(delta.reasoning_content, end='', flush=True)  # 打印推理内容
+            else:  # 如果是普通内容
+                self.answer_content += delta.content  # 累加响应内容
+                if ProjectSettings().is_debug():  # 如果是调试模式
+                    # 打印回复过程
+                    if self.is_thinking:  # 如果在思考模式
+                        print('\n' + '=' * 10 + 'answering' + '=' * 10)  # 打印回复标记
+                        self.is_thinking = False  # 退出思考模式
+                    print(delta.content, end='', flush=True)  # 打印内容
+
+        if chunk.usage:  # 如果有使用统计
+            self.usage = chunk.usage  # 记录使用统计
+            TokenUsage.record(chunk.usage)  # 累计token用量
+            if ProjectSettings().is_debug():  # 如果是调试模式
+                print()  # 打印换行
+            logger.debug(
+                f'[SimpleLLM] chat {chunk.id}: token usage(prompt {chunk.usage.prompt_tokens}, '
+                f'cached {TokenUsage.cached(chunk.usage)}, response {chunk.usage.completion_tokens})')  # 记录令牌使用情况
+
+
 # 通用的LLM代理
 class SimpleLLM:
     """
@@ -24,14 +250,22 @@ class SimpleLLM:
             setting: 聊天完成设置对象
         """
         self._setting = setting  # 保存设置
-        self._llm = OpenAI(
-            api_key=self._setting.openai_api_key,  # 设置API密钥
-            base_url=self._setting.openai_base_url,  # 设置API基础URL
-            timeout=self._setting.request_timeout,  # 设置请求超时时间
-            max_retries=5,  # 设置最大重试次数
-        )  # 创建OpenAI客户端
+        self._endpoints = EndpointPool.get_instance(setting)  # 进程内共享的端点池
+        self._pinned: Optional[Endpoint] = None  # 固定使用的端点，上传文件后对话只能发往同一端点
+        self._next: Optional[Endpoint] = None  # 查询缓存时选定的端点，下一次请求发往该端点
+        self._answered: Optional[str] = None  # 最近一次成功响应的模型
         self._history = []  # 初始化对话历史
 
+    def _route(self) -> Endpoint:
+        """
+        为一次请求选择端点
+        
+        Returns:
+            端点
+        """
+        endpoint, self._next = self._next, None
+        return self._pinned or endpoint or self._endpoints.pick()
+
     def add_system_msg(self, content: str):
         """
         添加系统消息到对话历史
@@ -75,17 +309,274 @@ class SimpleLLM:
         """
         添加语言指令消息，要求模型用指定语言输出
         
-        指定语言来自设置，但允许在分析和描述中使用英文单词，以提高可读性
+        指定语言来自设置，但允许在分析和描述中使用英文单词，以提高可读性。
+        前缀缓存模式下语言指令对所有请求都相同，作为第一条系统消息放在最前，多轮对话中只插入一次，保持前缀不变
+        """
+        content = (f'You must output in {self._setting.language} though the prompt is written in English.'
+                   "You can write with some English words in the analysis and description "
+                   "to enhance the document's readability because you do not need to translate the function name or variable name into the target language.\n")
+        if self._setting.prefix_cache:  # 前缀缓存模式
+            msg = {'role': 'system', 'content': content}
+            if not self._history or self._history[0] != msg:  # 之前的轮次已插入时不再重复
+                self._history.insert(0, msg)  # 语言指令放在最前
+        else:
+            self.add_user_msg(content)  # 添加语言指令
+
+    def _response_cache(self) -> Optional[ResponseCache]:
+        """
+        获取LLM响应缓存，未启用时返回None
+        
+        Returns:
+            响应缓存实例
+        """
+        if not self._setting.cache:
+            return None
+        return ResponseCache.get_instance(self._setting.cache_path, self._setting.cache_size * 1024 * 1024)
+
+    def _cache_lookup(self, post_processor: Callable[[str], str] = None) -> Optional[str]:
+        """
+        先为请求选择端点，再按该端点的模型与当前对话历史查询响应缓存，命中时将响应加入历史
+        
+        Args:
+            post_processor: 可选的响应后处理函数，参与缓存键的计算
+            
+        Returns:
+            缓存的响应，未启用缓存或未命中时为None
+        """
+        cache = self._response_cache()
+        self._answered = None
+        if cache is None:
+            return None
+        self._next = self._route()  # 首次尝试发往该端点，重试与对冲仍可能改选其他端点
+        key = cache_key(self._next.setting.model, self._setting.temperature, self._history, post_processor)
+        res = cache.get(key)
+        if res is not None:
+            logger.debug(f'[SimpleLLM] response cache hit: {key}')
+            self._next = None
+            self._add_response(res)  # 将缓存的响应添加到历史
+        return res
+
+    def _cache_store(self, res: str, post_processor: Callable[[str], str] = None):
+        """
+        将响应写入缓存，缓存键使用实际给出响应的端点的模型
+        
+        Args:
+            res: 经过后处理的响应
+            post_processor: 可选的响应后处理函数，参与缓存键的计算
+        """
+        cache = self._response_cache()
+        if cache is not None and self._answered is not None:
+            cache.put(cache_key(self._answered, self._setting.temperature, self._history, post_processor), res)
+
+    def _rate_limiter(self) -> Optional[RateLimiter]:
+        """
+        获取进程内共享的限流器，未配置RPM/TPM时返回None
+        
+        Returns:
+            限流器实例
+        """
+        return RateLimiter.get_instance(self._setting.rpm, self._setting.tpm)
+
+    def _acquire(self) -> int:
+        """
+        发送请求前按估计的提示token数等待限流额度
+        
+        Returns:
+            估计的token数，用于响应后修正
+        """
+        limiter = self._rate_limiter()
+        if limiter is None:
+            return 0
+        estimated = estimate_tokens(self._history)  # 估计提示token数
+        limiter.acquire(estimated)
+        return estimated
+
+    async def _aacquire(self) -> int:
+        """
+        _acquire的异步版本
+        
+        Returns:
+            估计的token数，用于响应后修正
+        """
+        limiter = self._rate_limiter()
+        if limiter is None:
+            return 0
+        estimated = estimate_tokens(self._history)  # 估计提示token数
+        await limiter.aacquire(estimated)
+        return estimated
+
+    @classmethod
+    def _slot(cls):
+        """
+        占用自适应并发控制器的一个名额，未启用时不做限制
+        
+        Returns:
+            上下文管理器
+        """
+        limiter = AdaptiveLimiter.get_instance()
+        return limiter.slot() if limiter is not None else nullcontext()
+
+    @classmethod
+    def _aslot(cls):
+        """
+        _slot的异步版本
+        
+        Returns:
+            异步上下文管理器
+        """
+        limiter = AdaptiveLimiter.get_instance()
+        return limiter.aslot() if limiter is not None else nullcontext()
+
+    def _settle(self, estimated: int, usage):
+        """
+        按响应返回的实际用量修正限流额度
+        
+        Args:
+            estimated: 请求前估计的token数
+            usage: 响应的token使用统计，可能为None
+        """
+        limiter = self._rate_limiter()
+        if limiter is not None and usage is not None:
+            limiter.settle(estimated, usage.total_tokens)
+
+    def _retry_policy(self) -> RetryPolicy:
+        """
+        按设置创建请求的重试策略
+        
+        Returns:
+            重试策略
+        """
+        return RetryPolicy.from_settings(self._setting)
+
+    def _request(self, on_chunk: Callable[[], bool] = None, on_response: Callable[[Stream], None] = None) -> str:
+        """
+        发送一次流式请求，不修改对话历史，可安全地重试
+        
+        Args:
+            on_chunk: 每收到一个响应块调用一次的回调，返回False时取消请求
+            on_response: 收到流式响应对象时调用一次的回调，对冲竞速用于在结束时关闭较慢的请求
+            
+        Returns:
+            累积的完整响应文本
+        """
+        estimated = self._acquire()  # 等待限流额度
+        endpoint = self._route()  # 选择端点
+        with self._slot(), self._endpoints.track(endpoint):  # 占用并发名额，记录端点统计
+            response = shared_client(endpoint.setting).chat.completions.create(
+                model=endpoint.setting.model,  # 使用端点的模型
+                messages=self._history,  # 传入对话历史
+                temperature=self._setting.temperature,  # 设置温度参数
+                stream=True,  # 启用流式响应
+                stream_options={'include_usage': True}  # 包含使用统计
+            )  # 创建聊天完成请求
+            if on_response is not None:
+                on_response(response)
+            res = self._get_stream_response(response, estimated, on_chunk)  # 处理流式响应
+            self._answered = endpoint.setting.model  # 记录给出响应的模型
+            return res
+
+    async def _arequest(self, on_chunk: Callable[[], bool] = None) -> str:
+        """
+        _request的异步版本
+        
+        Args:
+            on_chunk: 每收到一个响应块调用一次的回调，返回False时取消请求
+            
+        Returns:
+            累积的完整响应文本
+        """
+        estimated = await self._aacquire()  # 等待限流额度
+        endpoint = self._route()  # 选择端点
+        async with self._aslot():  # 占用并发名额
+            with self._endpoints.track(endpoint):  # 记录端点统计
+                response = await shared_async_client(endpoint.setting).chat.completions.create(
+                    model=endpoint.setting.model,  # 使用端点的模型
+                    messages=self._history,  # 传入对话历史
+                    temperature=self._setting.temperature,  # 设置温度参数
+                    stream=True,  # 启用流式响应
+                    stream_options={'include_usage': True}  # 包含使用统计
+                )  # 创建聊天完成请求
+                res = await self._aget_stream_response(response, estimated, on_chunk)  # 处理流式响应
+                self._answered = endpoint.setting.model  # 记录给出响应的模型
+                return res
+
+    def _hedged_request(self) -> str:
+        """
+        发送一次请求，启用对冲时若超过首token耗时的分位数仍未收到响应，发起相同的请求并采用先完成的结果
+        
+        Returns:
+            累积的完整响应文本
+        """
+        policy = HedgePolicy.get_instance(self._setting)
+        if policy is None:
+            return self._request()
+        policy.start()  # 记录请求
+        race = HedgeRace(policy)
+        delay = policy.delay()  # 首token耗时的分位数
+        if delay is None:  # 首token耗时的样本不足，不会发起对冲，在当前线程中请求并记录首token耗时
+            return self._request(race.on_chunk(time.monotonic()))
+        race.start(self._request)  # 发起原始请求
+        if race.wait_first_token(delay) and policy.try_hedge():
+            logger.debug(f'[SimpleLLM] no first token after {delay:.2f}s, send hedged request')
+            race.start(self._request)  # 发起对冲请求
+        return race.result()
+
+    async def _ahedged_request(self) -> str:
+        """
+        _hedged_request的异步版本，较慢的请求在另一方完成后立即取消
+        
+        Returns:
+            累积的完整响应文本
         """
-        self.add_user_msg(f'You must output in {self._setting.language} though the prompt is written in English.'
-                          "You can write with some English words in the analysis and description "
-                          "to enhance the document's readability because you do not need to translate the function name or variable name into the target language.\n")  # 添加语言指令
+        policy = HedgePolicy.get_instance(self._setting)
+        if policy is None:
+            return await self._arequest()
+        policy.start()  # 记录请求
+        first_token = asyncio.Event()  # 是否已有请求收到首token
+
+        def on_chunk(start: float) -> Callable[[], bool]:
+            seen = False
+
+            def callback() -> bool:
+                nonlocal seen
+                if not seen:
+                    seen = True
+                    policy.record(time.monotonic() - start)  # 记录首token耗时
+                    first_token.set()
+                return True
+
+            return callback
+
+        tasks = [asyncio.create_task(self._arequest(on_chunk(time.monotonic())))]  # 发起原始请求
+        try:
+            delay = policy.delay()  # 首token耗时的分位数
+            if delay is not None:
+                waiter = asyncio.create_task(first_token.wait())
+                await asyncio.wait([tasks[0], waiter], timeout=delay, return_when=asyncio.FIRST_COMPLETED)
+                waiter.cancel()
+                if not first_token.is_set() and not tasks[0].done() and policy.try_hedge():
+                    logger.debug(f'[SimpleLLM] no first token after {delay:.2f}s, send hedged request')
+                    tasks.append(asyncio.create_task(self._arequest(on_chunk(time.monotonic()))))  # 发起对冲请求
+            pending, error = set(tasks), None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not tasks[0]:
+                            policy.won()
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:  # 取消较慢的请求
+                task.cancel()
 
     def ask(self, post_processor: Callable[[str], str] = None) -> str:
         """
         向模型发送请求并获取响应
         
-        支持流式响应和后处理函数
+        支持流式响应和后处理函数，启用缓存时相同的请求直接返回缓存的响应，
+        超时、429、5xx与中断的流式响应按重试策略重试
         
         Args:
             post_processor: 可选的响应后处理函数
@@ -98,71 +589,120 @@ class SimpleLLM:
         """
         try:
             self._add_language_msg()  # 添加语言指令
-            response = self._llm.chat.completions.create(
-                model=self._setting.model,  # 使用设置的模型
-                messages=self._history,  # 传入对话历史
-                temperature=self._setting.temperature,  # 设置温度参数
-                stream=True,  # 启用流式响应
-                stream_options={'include_usage': True}  # 包含使用统计
-            )  # 创建聊天完成请求
-            res = self._get_stream_response(response)  # 处理流式响应
+            res = self._cache_lookup(post_processor)  # 查询响应缓存
+            if res is not None:  # 缓存命中
+                return res
+            res = self._retry_policy().call(self._hedged_request)  # 按重试策略发送请求
             if post_processor:  # 如果有后处理函数
                 res = post_processor(res)  # 应用后处理
+            self._cache_store(res, post_processor)  # 写入响应缓存
             self._add_response(res)  # 将响应添加到历史
             return res  # 返回响应
-        except ReadTimeout as e:  # 捕获超时异常
-            logger.warning(f"[SimpleLLM] Timeout in chat call.")  # 记录警告
-            time.sleep(1)  # 等待1秒
-            return self.ask(post_processor)  # 重试请求
         except Exception as e:  # 捕获其他异常
             logger.error(f"[SimpleLLM] Error in chat call: {e}")  # 记录错误
             raise e  # 重新抛出异常
 
-    def _get_stream_response(self, response: Stream[ChatCompletionChunk]) -> str:
+    async def aask(self, post_processor: Callable[[str], str] = None) -> str:
+        """
+        ask的异步版本，使用异步OpenAI客户端发送请求，等待响应时不占用线程
+        
+        Args:
+            post_processor: 可选的响应后处理函数
+            
+        Returns:
+            模型的响应内容
+            
+        Raises:
+            各种异常：请求过程中可能发生的异常
+        """
+        try:
+            self._add_language_msg()  # 添加语言指令
+            res = self._cache_lookup(post_processor)  # 查询响应缓存
+            if res is not None:  # 缓存命中
+                return res
+            res = await self._retry_policy().acall(self._ahedged_request)  # 按重试策略发送请求
+            if post_processor:  # 如果有后处理函数
+                res = post_processor(res)  # 应用后处理
+            self._cache_store(res, post_processor)  # 写入响应缓存
+            self._add_response(res)  # 将响应添加到历史
+            return res  # 返回响应
+        except Exception as e:  # 捕获其他异常
+            logger.error(f"[SimpleLLM] Error in async chat call: {e}")  # 记录错误
+            raise e  # 重新抛出异常
+
+    def _get_stream_response(self, response: Stream[ChatCompletionChunk], estimated: int = 0,
+                             on_chunk: Callable[[], bool] = None) -> str:
         """处理流式响应，累积结果并处理调试输出
         
         逐块处理模型的流式响应，区分思考过程和回答内容，并根据调试模式设置进行输出
         
         Args:
             response: OpenAI的流式响应对象
+            estimated: 请求前估计的token数，用于修正限流额度
+            on_chunk: 每收到一个响应块调用一次的回调，返回False时取消请求
             
         Returns:
             累积的完整响应文本
+            
+        Raises:
+            TruncatedStreamError: 流式响应在结束标记前中断
+            HedgeCancelled: 对冲请求的另一方已先完成
         """
-        is_thinking = False  # 是否在思考模式的标志
-        answer_content = ''  # 初始化响应内容
-        for chunk in response:  # 遍历响应块
-            if chunk.choices:  # 如果有选择
-                delta = chunk.choices[0].delta  # 获取增量内容
-                if hasattr(delta, 'reasoning_content') and delta.reasoning_content is not None:  # 如果有推理内容
-                    if not ProjectSettings().is_debug():  # 如果不是调试模式
-                        continue  # 跳过
-                    # 打印思考过程
-                    if not is_thinking:  # 如果不在思考模式
-                        print('=' * 10 + 'thinking' + '=' * 10)  # 打印思考标记
-                        is_thinking = True  # 设置思考模式
-                    print(delta.reasoning_content, end='', flush=True)  # 打印推理内容
-                else:  # 如果是普通内容
-                    answer_content += delta.content  # 累加响应内容
-                    if not ProjectSettings().is_debug():  # 如果不是调试模式
-                        continue  # 跳过
-                    # 打印回复过程
-                    if is_thinking:  # 如果在思考模式
-                        print('\n' + '=' * 10 + 'answering' + '=' * 10)  # 打印回复标记
-                        is_thinking = False  # 退出思考模式
-                    print(delta.content, end='', flush=True)  # 打印内容
-
+        stream = _StreamState()  # 流式响应的累积状态
+        try:
+            for chunk in response:  # 遍历响应块
+                if on_chunk is not None and not on_chunk():  # 对冲请求的另一方已先完成
+                    response.close()
+                    raise HedgeCancelled()
+                stream.feed(chunk)  # 处理响应块
+        except HedgeCancelled:
+            raise
+        except Exception:
+            if on_chunk is not None and not on_chunk():  # 另一方完成后关闭了响应，不视为端点故障
+                raise HedgeCancelled()
+            raise
+        self._settle(estimated, stream.usage)  # 按实际用量修正限流额度
+        if not stream.finished:  # 流式响应在结束标记前中断
+            if on_chunk is not None and not on_chunk():
+                raise HedgeCancelled()
+            raise TruncatedStreamError(f'stream ended after {len(stream.answer_content)} chars')
+        self._dump_history()  # 调试模式下记录对话历史
+        return stream.answer_content  # 返回完整响应
 
-            if chunk.usage:  # 如果有使用统计
-                if ProjectSettings().is_debug():  # 如果是调试模式
-                    print()  # 打印换行
-                logger.debug(
-                    f'[SimpleLLM] chat {chunk.id}: token usage(prompt {chunk.usage.prompt_tokens}, response {chunk.usage.completion_tokens}')  # 记录令牌使用情况
+    async def _aget_stream_response(self, response: AsyncStream[ChatCompletionChunk], estimated: int = 0,
+                                    on_chunk: Callable[[], bool] = None) -> str:
+        """_get_stream_response的异步版本
+        
+        Args:
+            response: OpenAI的异步流式响应对象
+            estimated: 请求前估计的token数，用于修正限流额度
+            on_chunk: 每收到一个响应块调用一次的回调，返回False时取消请求
+            
+        Returns:
+            累积的完整响应文本
+            
+        Raises:
+            TruncatedStreamError: 流式响应在结束标记前中断
+            HedgeCancelled: 对冲请求的另一方已先完成
+        """
+        stream = _StreamState()  # 流式响应的累积状态
+        async for chunk in response:  # 遍历响应块
+            if on_chunk is not None and not on_chunk():  # 对冲请求的另一方已先完成
+                await response.close()
+                raise HedgeCancelled()
+            stream.feed(chunk)  # 处理响应块
+        self._settle(estimated, stream.usage)  # 按实际用量修正限流额度
+        if not stream.finished:  # 流式响应在结束标记前中断
+            raise TruncatedStreamError(f'stream ended after {len(stream.answer_content)} chars')
+        self._dump_history()  # 调试模式下记录对话历史
+        return stream.answer_content  # 返回完整响应
 
+    def _dump_history(self):
+        """调试模式下，将对话历史追加写入prompt.md
+        """
         if ProjectSettings().is_debug():  # 如果是调试模式
             with open('prompt.md', 'a') as d:  # 打开提示文件
                 d.write('\n'.join(list(map(lambda s: s.get('content'), self._history))) + '\n\n---\n\n')  # 写入对话历史
-        return answer_content  # 返回完整响应
 
     def add_file(self, path: str):
         """添加文件到对话
@@ -180,7 +720,8 @@ class SimpleLLM:
         """
         try:
             # TODO file-extract 可能是qwen-long专用
-            response = self._llm.files.create(file=open(path, 'rb'), purpose='file-extract')  # 上传文件
+            self._pinned = self._pinned or self._route()  # 文件只在上传的端点可见，之后的对话固定发往该端点
+            response = shared_client(self._pinned.setting).files.create(file=open(path, 'rb'), purpose='file-extract')  # 上传文件
             self.add_system_msg(f'fileid://{response.id}')  # 添加文件ID消息
             return self  # 返回self用于链式调用
         except Exception as e:  # 捕获异常
@@ -210,6 +751,45 @@ class ToolsLLM(SimpleLLM):
         self._toolsMap = tools_map  # 保存工具映射
         super().__init__(setting)  # 调用父类初始化
 
+    def _request(self) -> ChatCompletion:
+        """
+        发送一次携带工具描述的请求，不修改对话历史，可安全地重试
+        
+        Returns:
+            聊天完成响应
+        """
+        estimated = self._acquire()  # 等待限流额度
+        endpoint = self._route()  # 选择端点
+        with self._slot(), self._endpoints.track(endpoint):  # 占用并发名额，记录端点统计
+            response = shared_client(endpoint.setting).chat.completions.create(
+                model=endpoint.setting.model,  # 使用端点的模型
+                messages=self._history,  # 传入对话历史
+                temperature=self._setting.temperature,  # 设置温度参数
+                tools=self._tools  # 传入工具描述
+            )  # 创建聊天完成请求
+        self._settle(estimated, response.usage)  # 按实际用量修正限流额度
+        return response
+
+    async def _arequest(self) -> ChatCompletion:
+        """
+        _request的异步版本
+        
+        Returns:
+            聊天完成响应
+        """
+        estimated = await self._aacquire()  # 等待限流额度
+        endpoint = self._route()  # 选择端点
+        async with self._aslot():  # 占用并发名额
+            with self._endpoints.track(endpoint):  # 记录端点统计
+                response = await shared_async_client(endpoint.setting).chat.completions.create(
+                    model=endpoint.setting.model,  # 使用端点的模型
+                    messages=self._history,  # 传入对话历史
+                    temperature=self._setting.temperature,  # 设置温度参数
+                    tools=self._tools  # 传入工具描述
+                )  # 创建聊天完成请求
+        self._settle(estimated, response.usage)  # 按实际用量修正限流额度
+        return response
+
     def ask(self, post_processor: Callable[[str], str] = None) -> str:
         """
         向模型发送请求，支持工具调用
@@ -226,14 +806,11 @@ class ToolsLLM(SimpleLLM):
             各种异常：请求过程中可能发生的异常
         """
         try:
-            response = self._llm.chat.completions.create(
-                model=self._setting.model,  # 使用设置的模型
-                messages=self._history,  # 传入对话历史
-                temperature=self._setting.temperature,  # 设置温度参数
-                tools=self._tools  # 传入工具描述
-            )  # 创建聊天完成请求
+            response = self._retry_policy().call(self._request)  # 按重试策略发送请求
+            TokenUsage.record(response.usage)  # 累计token用量
             logger.info(
-                f'[ToolsLLM] chat {response.id}: token usage(prompt {response.usage.prompt_tokens}, response {response.usage.completion_tokens})')  # 记录令牌使用情况
+                f'[ToolsLLM] chat {response.id}: token usage(prompt {response.usage.prompt_tokens}, '
+                f'cached {TokenUsage.cached(response.usage)}, response {response.usage.completion_tokens})')  # 记录令牌使用情况
             if response.choices[0].message.tool_calls:  # 如果有工具调用
                 logger.info(f'[ToolsLLM] chat {response.id}: tool call{response.choices[0].message.tool_calls}')  # 记录工具调用
                 for tool_call in response.choices[0].message.tool_calls:  # 遍历每个工具调用
@@ -254,6 +831,45 @@ class ToolsLLM(SimpleLLM):
             logger.error(f"[ToolsLLM] Error in chat call: {e}")  # 记录错误
             raise e  # 重新抛出异常
 
+    async def aask(self, post_processor: Callable[[str], str] = None) -> str:
+        """
+        ask的异步版本，支持工具调用
+        
+        Args:
+            post_processor: 可选的响应后处理函数
+            
+        Returns:
+            模型的最终响应内容
+            
+        Raises:
+            各种异常：请求过程中可能发生的异常
+        """
+        try:
+            response = await self._retry_policy().acall(self._arequest)  # 按重试策略发送请求
+            TokenUsage.record(response.usage)  # 累计token用量
+            logger.info(
+                f'[ToolsLLM] chat {response.id}: token usage(prompt {response.usage.prompt_tokens}, '
+                f'cached {TokenUsage.cached(response.usage)}, response {response.usage.completion_tokens})')  # 记录令牌使用情况
+            if response.choices[0].message.tool_calls:  # 如果有工具调用
+                logger.info(f'[ToolsLLM] chat {response.id}: tool call{response.choices[0].message.tool_calls}')  # 记录工具调用
+                for tool_call in response.choices[0].message.tool_calls:  # 遍历每个工具调用
+                    self._history.append(response.choices[0].message)  # 将助手消息添加到历史
+                    f = self._toolsMap.get(tool_call.function.name)  # 获取工具函数
+                    arguments = json.loads(tool_call.function.arguments)  # 解析参数
+                    r = f(**arguments)  # 调用工具函数
+                    self._history.append({'role': 'tool', 'content': r})  # 将工具响应添加到历史
+                    logger.info(
+                        f"[ToolsLLM] chat {response.id}: tool call(name {f}, arguments {arguments}), result {r}")  # 记录工具调用结果
+                return await self.aask()  # 递归调用，继续对话
+            res = response.choices[0].message.content  # 获取响应内容
+            if post_processor:  # 如果有后处理函数
+                res = post_processor(res)  # 应用后处理
+            self._add_response(res)  # 将响应添加到历史
+            return res  # 返回响应
+        except Exception as e:  # 捕获异常
+            logger.error(f"[ToolsLLM] Error in async chat call: {e}")  # 记录错误
+            raise e  # 重新抛出异常
+
     def debug(self) -> str:
         """
         调试方法，尚未实现
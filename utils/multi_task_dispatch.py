@@ -1,16 +1,22 @@
 from __future__ import annotations  # 启用未来版本的注解特性，允许在类型注解中使用尚未定义的类
 
+import asyncio  # 导入asyncio模块，用于调度协程任务
+import contextvars  # 导入contextvars模块，用于将调用方的上下文传递到工作线程
+import heapq  # 导入堆模块，用于按优先级选取就绪任务
 import sys  # 导入sys模块，用于系统相关操作
 import uuid  # 导入uuid模块，用于生成唯一标识符
 from collections import deque, defaultdict  # 导入集合类，用于队列和默认字典
-from concurrent.futures import as_completed  # 导入并发执行工具
+from concurrent.futures import as_completed, wait, FIRST_COMPLETED, Future  # 导入并发执行工具
 from concurrent.futures.thread import ThreadPoolExecutor  # 导入线程池执行器
-from typing import List, TypeVar, Any  # 导入类型提示工具
+from typing import List, TypeVar, Any, Dict  # 导入类型提示工具
 
 import networkx as nx  # 导入networkx库，用于处理图结构
 from loguru import logger  # 导入loguru库的logger，用于日志记录
 from typing_extensions import Callable, Optional  # 导入扩展类型提示工具
 
+from .adaptive_limiter import AdaptiveLimiter  # 导入自适应并发控制器，用于限制提交中的任务数
+from .settings import llm_pool_size  # 导入LLM线程池的线程数
+
 P = TypeVar("P")  # 定义泛型类型P，用于任务参数
 
 
@@ -20,17 +26,19 @@ class Task:
     表示一个可执行的任务，包含执行函数、参数和依赖关系
     每个任务有唯一的ID，用于标识和比较
     """
-    def __init__(self, f: Callable[[P]], args: P, dependencies: Optional[List[Task]] = None):
+    def __init__(self, f: Callable[[P]], args: P, dependencies: Optional[List[Task]] = None, cost: float = 1):
         """初始化任务
         
         Args:
             f: 要执行的函数
             args: 函数参数
             dependencies: 依赖的其他任务列表，默认为None
+            cost: 任务耗时的估计值，用于计算关键路径，默认为1
         """
         self.f = f  # 要执行的函数
         self.dependencies = dependencies  # 依赖的任务列表
         self.args = args  # 函数参数
+        self.cost = cost  # 耗时估计
         self.id = uuid.uuid4().hex  # 生成唯一ID
 
     def __hash__(self):
@@ -69,15 +77,22 @@ class TaskDispatcher:
     
     负责管理和执行一组具有依赖关系的任务，能够按照依赖顺序有效地并行执行
     使用有向图表示任务之间的依赖关系，确保依赖任务优先执行
+    默认在任务的全部依赖完成后立即提交该任务，也可以切换为按层级分组、逐组同步执行
+    就绪的任务按其下游最长链的耗时估计排序，关键路径上的任务优先执行
     """
-    def __init__(self, pool: ThreadPoolExecutor):
+    def __init__(self, pool: ThreadPoolExecutor, level_sync: bool = False, workers: Optional[int] = None):
         """初始化任务分发器
         
         Args:
             pool: 线程池执行器，用于并行执行任务
+            level_sync: 是否按逆拓扑层级逐组执行，默认为False，即依赖完成即提交
+            workers: 提交中的任务数上限，应与线程池的线程数一致，默认为None，即LLM线程池，
+                开启自适应并发时不超过AdaptiveLimiter的当前上限
         """
         self._pool = pool  # 线程池
+        self._workers = workers  # 提交中的任务数上限
         self._tasks = nx.DiGraph()  # 任务依赖图，有向图表示
+        self._level_sync = level_sync  # 是否逐层同步执行
 
     def adds(self, tasks: List[Task]):
         """批量添加多个任务
@@ -110,7 +125,7 @@ class TaskDispatcher:
             self._tasks.add_edge(f, dep)  # 添加依赖边：f依赖于dep
         return self  # 返回self用于链式调用
 
-    def map(self, dg: nx.DiGraph, f: Callable):
+    def map(self, dg: nx.DiGraph, f: Callable, cost: Optional[Callable[[Any], float]] = None):
         """从图结构映射生成任务
         
         将图中的每个节点映射为一个任务，保留原图中的依赖关系
@@ -118,6 +133,7 @@ class TaskDispatcher:
         Args:
             dg: 有向图，表示节点间的依赖关系
             f: 对每个节点执行的函数
+            cost: 估计每个节点耗时的函数，默认为None，即所有节点耗时相同
             
         Returns:
             self，用于链式调用
@@ -125,7 +141,7 @@ class TaskDispatcher:
         tasks = {}  # 节点到任务的映射
         # 为每个节点创建任务
         for node in dg.nodes:
-            tasks[node] = Task(f=f, args=(node,))
+            tasks[node] = Task(f=f, args=(node,), cost=cost(node) if cost else 1)
         # 建立任务间的依赖关系
         for node in dg.nodes:
             tasks[node].dependencies = []
@@ -137,7 +153,7 @@ class TaskDispatcher:
     def run(self):
         """执行所有任务
         
-        按照依赖关系的拓扑排序，分组并行执行任务
+        按照依赖关系并行执行任务
         
         Raises:
             ValueError: 如果任务图中存在循环依赖
@@ -145,15 +161,189 @@ class TaskDispatcher:
         # 检查是否有环
         if not nx.is_directed_acyclic_graph(self._tasks):
             raise ValueError("Graph is not acyclic")  # 存在循环依赖，抛出异常
+        priorities = self._priorities()  # 计算每个任务的优先级
+        logger.info(f'[TaskDispatcher] critical path length: {max(priorities.values(), default=0):.1f}, '
+                    f'total cost: {sum(task.cost for task in self._tasks.nodes):.1f}')  # 记录关键路径长度
+        if self._level_sync:
+            self._run_levels(priorities)
+        else:
+            self._run_ready(priorities)
+
+    def _priorities(self) -> Dict[Task, float]:
+        """计算每个任务的优先级，即从该任务出发、沿依赖于它的任务向下游延伸的最长链的耗时估计
+        
+        Returns:
+            任务到优先级的映射，所有任务中的最大值即关键路径长度
+        """
+        priorities = {}
+        # 拓扑序中依赖于某任务的任务总是排在它前面
+        for task in nx.topological_sort(self._tasks):
+            priorities[task] = task.cost + max((priorities[t] for t in self._tasks.predecessors(task)), default=0)
+        return priorities
+
+    def _capacity(self) -> int:
+        """获取当前可同时提交的任务数
+        
+        LLM线程池的任务在开启自适应并发时以AdaptiveLimiter的当前上限为准，超出上限提交的任务只会阻塞在并发名额上，
+        使之后就绪的高优先级任务排在它们之后
+        
+        Returns:
+            任务数上限
+        """
+        if self._workers is not None:
+            return self._workers
+        limiter = AdaptiveLimiter.get_instance()
+        return min(llm_pool_size, limiter.limit) if limiter is not None else llm_pool_size
+
+    def _submit(self, task: Task) -> Future:
+        """
+        在调用方的上下文中将任务提交到线程池，使上下文变量（如LLM调用阶段）在工作线程中可见
+
+        Args:
+            task: 任务
+
+        Returns:
+            任务的Future
+        """
+        return self._pool.submit(contextvars.copy_context().run, task.f, *task.args)
+
+    def _run_levels(self, priorities: Dict[Task, float]):
+        """按照依赖关系的拓扑排序，分组并行执行任务，每组全部完成后再执行下一组
+        
+        Args:
+            priorities: 任务到优先级的映射，组内按优先级从高到低提交
+        """
         groups = reverse_topo(self._tasks)  # 获取分组后的任务（按逆拓扑排序）
         logger.debug(f'[TaskDispatcher] split {len(self._tasks)} tasks into {len(groups)} groups')  # 记录任务分组情况
         # 逐组执行任务
         for i, g in enumerate(groups):
-            futures = {self._pool.submit(task.f, *task.args): task for task in g}  # 提交任务到线程池
+            g = sorted(g, key=lambda task: -priorities[task])  # 关键路径上的任务先提交
+            futures = {self._submit(task): task for task in g}  # 提交任务到线程池
             for future in as_completed(futures):  # 等待任务完成
                 future.result()  # 获取结果，可能抛出异常
             logger.debug(f'[TaskDispatcher] finished group {i + 1}, size: {len(g)}')  # 记录组执行完成
 
+    def _run_ready(self, priorities: Dict[Task, float]):
+        """维护每个任务尚未完成的依赖数，任务的最后一个依赖完成时立即进入就绪队列
+        
+        整体耗时趋近于依赖图的关键路径，而不会因为同层的某个慢任务阻塞下一层。
+        线程池按先进先出执行，因此提交中的任务数不超过线程数（开启自适应并发时不超过当前的并发上限），
+        有空闲时从就绪队列中取优先级最高的任务提交
+        
+        Args:
+            priorities: 任务到优先级的映射
+        """
+        remaining = {task: self._tasks.out_degree(task) for task in self._tasks.nodes}  # 每个任务尚未完成的依赖数
+        ready = []  # 就绪队列，按优先级从高到低出堆
+        seq = 0  # 优先级相同时按进入就绪队列的顺序出堆
+
+        def push(t: Task):
+            nonlocal seq
+            heapq.heappush(ready, (-priorities[t], seq, t))
+            seq += 1
+
+        for task, degree in remaining.items():
+            if degree == 0:  # 没有依赖的任务可以直接执行
+                push(task)
+        logger.debug(f'[TaskDispatcher] run {len(self._tasks)} tasks, ready: {len(ready)}')  # 记录任务情况
+        futures = {}  # 提交中的任务
+        finished = 0  # 已完成的任务数
+        while ready or futures:
+            while ready and len(futures) < self._capacity():  # 有空闲名额时提交优先级最高的任务
+                _, _, task = heapq.heappop(ready)
+                futures[self._submit(task)] = task
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)  # 等待任意任务完成
+            for future in done:
+                task = futures.pop(future)
+                future.result()  # 获取结果，可能抛出异常
+                finished += 1
+                for dependent in self._tasks.predecessors(task):  # 遍历依赖于当前任务的任务
+                    remaining[dependent] -= 1
+                    if remaining[dependent] == 0:  # 最后一个依赖完成，进入就绪队列
+                        push(dependent)
+        logger.debug(f'[TaskDispatcher] finished {finished} tasks')  # 记录执行完成
+
+
+# 协程任务调度器，依赖关系与优先级规则与TaskDispatcher相同，任务函数为协程函数
+class AsyncTaskDispatcher(TaskDispatcher):
+    """协程任务分发器
+    
+    在单个事件循环中调度协程任务，任务的全部依赖完成后按优先级启动，
+    同时执行的任务数不超过并发上限，等待LLM响应时不占用线程
+    """
+    def __init__(self, concurrency: int):
+        """初始化协程任务分发器
+        
+        Args:
+            concurrency: 同时执行的任务数上限
+        """
+        super().__init__(pool=None)
+        self._concurrency = concurrency  # 并发上限
+
+    def _capacity(self) -> int:
+        """获取当前可同时执行的任务数，开启自适应并发时不超过AdaptiveLimiter的当前上限
+        
+        Returns:
+            任务数上限
+        """
+        limiter = AdaptiveLimiter.get_instance()
+        return min(self._concurrency, limiter.limit) if limiter is not None else self._concurrency
+
+    def run(self):
+        """在新的事件循环中执行所有任务，直到全部完成
+        
+        Raises:
+            ValueError: 如果任务图中存在循环依赖
+        """
+        if not nx.is_directed_acyclic_graph(self._tasks):
+            raise ValueError("Graph is not acyclic")  # 存在循环依赖，抛出异常
+        priorities = self._priorities()  # 计算每个任务的优先级
+        logger.info(f'[AsyncTaskDispatcher] critical path length: {max(priorities.values(), default=0):.1f}, '
+                    f'total cost: {sum(task.cost for task in self._tasks.nodes):.1f}')  # 记录关键路径长度
+        asyncio.run(self._arun(priorities))
+
+    async def _arun(self, priorities: Dict[Task, float]):
+        """维护每个任务尚未完成的依赖数，依赖全部完成的任务进入就绪队列，执行中的任务数不超过当前的并发上限
+        
+        Args:
+            priorities: 任务到优先级的映射
+        """
+        remaining = {task: self._tasks.out_degree(task) for task in self._tasks.nodes}  # 每个任务尚未完成的依赖数
+        ready = []  # 就绪队列，按优先级从高到低出堆
+        seq = 0  # 优先级相同时按进入就绪队列的顺序出堆
+
+        def push(t: Task):
+            nonlocal seq
+            heapq.heappush(ready, (-priorities[t], seq, t))
+            seq += 1
+
+        for task, degree in remaining.items():
+            if degree == 0:  # 没有依赖的任务可以直接执行
+                push(task)
+        logger.debug(f'[AsyncTaskDispatcher] run {len(self._tasks)} tasks, ready: {len(ready)}, '
+                     f'concurrency: {self._concurrency}')  # 记录任务情况
+        running = {}  # 执行中的协程任务
+        finished = 0  # 已完成的任务数
+        try:
+            while ready or running:
+                # 有空闲名额时从就绪队列中取优先级最高的任务启动
+                while ready and len(running) < self._capacity():
+                    _, _, task = heapq.heappop(ready)
+                    running[asyncio.create_task(task.f(*task.args))] = task
+                done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)  # 等待任意任务完成
+                for future in done:
+                    task = running.pop(future)
+                    future.result()  # 获取结果，可能抛出异常
+                    finished += 1
+                    for dependent in self._tasks.predecessors(task):  # 遍历依赖于当前任务的任务
+                        remaining[dependent] -= 1
+                        if remaining[dependent] == 0:  # 最后一个依赖完成，进入就绪队列
+                            push(dependent)
+        finally:
+            for future in running:  # 出现异常时取消尚未完成的任务
+                future.cancel()
+        logger.debug(f'[AsyncTaskDispatcher] finished {finished} tasks')  # 记录执行完成
+
 
 # 获取有向图的逆拓扑排序
 def reverse_topo(G: nx.DiGraph) -> List[List[Any]]:
@@ -216,13 +406,13 @@ if __name__ == '__main__':
 
 
     pool = ThreadPoolExecutor(max_workers=4)  # 创建4线程的线程池
-    dispatcher = TaskDispatcher(pool)  # 创建任务分发器
+    dispatcher = TaskDispatcher(pool, workers=4)  # 创建任务分发器
 
     # 创建具有依赖关系的任务
-    task1 = Task(f=task, args=1)
-    task2 = Task(f=task, args=2, dependencies=[task1])  # 依赖于task1
-    task3 = Task(f=task, args=3, dependencies=[task1])  # 依赖于task1
-    task4 = Task(f=task, args=4, dependencies=[task2, task3])  # 依赖于task2和task3
+    task1 = Task(f=task, args=(1,))
+    task2 = Task(f=task, args=(2,), dependencies=[task1])  # 依赖于task1
+    task3 = Task(f=task, args=(3,), dependencies=[task1])  # 依赖于task1
+    task4 = Task(f=task, args=(4,), dependencies=[task2, task3])  # 依赖于task2和task3
 
     # 添加任务
     dispatcher.add(task1)
@@ -234,7 +424,7 @@ if __name__ == '__main__':
     dispatcher.run()
 
     # 使用map方法的示例
-    dispatcher2 = TaskDispatcher(pool)  # 创建另一个任务分发器
+    dispatcher2 = TaskDispatcher(pool, workers=4)  # 创建另一个任务分发器
 
     # 创建依赖图
     graph = nx.DiGraph()
@@ -244,3 +434,62 @@ if __name__ == '__main__':
     dispatcher2.map(graph, task)
     # 执行任务
     dispatcher2.run()
+
+    # 在随机生成的深层依赖图上比较两种执行方式，任务耗时随机
+    import random  # 导入random模块，用于生成随机依赖图和耗时
+
+    def bench_task(n, cost):
+        """基准测试任务，休眠指定时间模拟一次LLM调用
+        
+        Args:
+            n: 任务编号
+            cost: 休眠时间（秒）
+        """
+        time.sleep(cost)
+
+    def bench(level_sync: bool, graph: nx.DiGraph, costs: dict, prioritized: bool = True) -> float:
+        """在给定依赖图上执行一次基准测试
+        
+        Args:
+            level_sync: 是否按层级同步执行
+            graph: 依赖图，边由任务指向其依赖
+            costs: 每个节点的耗时
+            prioritized: 是否向分发器提供耗时估计，不提供时所有任务优先级相同
+            
+        Returns:
+            总耗时（秒）
+        """
+        d = TaskDispatcher(bench_pool, level_sync=level_sync, workers=16)
+        tasks = {node: Task(f=bench_task, args=(node, costs[node]), cost=costs[node] if prioritized else 0)
+                 for node in graph.nodes}
+        for node in graph.nodes:
+            tasks[node].dependencies = [tasks[dep] for dep in graph.successors(node)]
+        d.adds(list(tasks.values()))
+        start = time.time()
+        d.run()
+        return time.time() - start
+
+    random.seed(0)
+    bench_pool = ThreadPoolExecutor(max_workers=16)
+    graphs = []
+    for size, fanout in [(200, 2), (400, 3)]:
+        graph = nx.DiGraph()
+        graph.add_nodes_from(range(size))
+        for node in range(1, size):  # 每个节点依赖若干编号更小且相近的节点，形成深层依赖链
+            for dep in random.sample(range(max(0, node - 10), node), min(fanout, node)):
+                graph.add_edge(node, dep)
+        graphs.append((f'{size} tasks deep', graph))
+    graph = nx.DiGraph()
+    graph.add_nodes_from(range(640))
+    nx.add_path(graph, range(40))  # 一条40个任务的长链，其余600个任务互不依赖
+    graphs.append(('640 tasks wide', graph))
+    for name, graph in graphs:
+        costs = {node: random.lognormvariate(-4, 1) for node in graph.nodes}  # 长尾分布的任务耗时
+        # 关键路径：节点耗时加上其依赖中最长的关键路径
+        finish = {}
+        for node in reversed(list(nx.topological_sort(graph))):
+            finish[node] = costs[node] + max((finish[dep] for dep in graph.successors(node)), default=0)
+        print(f'{name}, critical path {max(finish.values()):.2f}s, '
+              f'level sync {bench(True, graph, costs):.2f}s, '
+              f'ready queue {bench(False, graph, costs, prioritized=False):.2f}s, '
+              f'ready queue with priority {bench(False, graph, costs):.2f}s')
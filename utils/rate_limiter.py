@@ -0,0 +1,171 @@
+import asyncio  # 导入asyncio模块，用于异步等待
+import threading  # 导入threading模块，用于保护令牌桶状态
+import time  # 导入time模块，用于计时与等待
+from typing import Any, Dict, List, Optional, Tuple  # 导入类型提示工具
+
+from loguru import logger  # 导入日志记录器
+
+
+def estimate_tokens(messages: List[Any]) -> int:
+    """
+    在发送请求前粗略估计对话历史的token数，按每3个字符1个token计算，并为每条消息加上固定开销
+
+    Args:
+        messages: 对话历史，元素为消息字典或SDK返回的消息对象
+
+    Returns:
+        估计的token数
+    """
+    total = 0
+    for m in messages:
+        content = m.get('content') if isinstance(m, dict) else getattr(m, 'content', None)
+        total += len(content or '') // 3 + 4
+    return total
+
+
+# 令牌桶，容量为每分钟的额度，按秒匀速补充
+class _Bucket:
+    """
+    令牌桶
+
+    令牌数可以为负，表示实际用量超出了预估，欠下的额度由后续补充抵扣
+    """
+    def __init__(self, per_minute: int):
+        """
+        初始化令牌桶，初始为满
+
+        Args:
+            per_minute: 每分钟额度
+        """
+        self.capacity = per_minute
+        self.rate = per_minute / 60  # 每秒补充的令牌数
+        self.level = float(per_minute)
+        self.updated = time.monotonic()
+
+    def refill(self, now: float):
+        """
+        按经过的时间补充令牌
+
+        Args:
+            now: 当前时间
+        """
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, n: int) -> float:
+        """
+        取出n个令牌需要等待的时间，超过容量的请求只需等到桶满
+
+        Args:
+            n: 令牌数
+
+        Returns:
+            等待秒数，0表示可以立即取出
+        """
+        need = min(n, self.capacity)
+        return 0 if self.level >= need else (need - self.level) / self.rate
+
+
+# 进程级的RPM/TPM限流器
+class RateLimiter:
+    """
+    按每分钟请求数（RPM）与每分钟token数（TPM）限流
+
+    请求前按估计的token数扣减额度，响应返回实际用量后再修正差额，
+    同一进程内所有的SimpleLLM与ToolsLLM共享同一个限流器
+    """
+    _instances: Dict[Tuple[int, int], 'RateLimiter'] = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, rpm: int, tpm: int):
+        """
+        初始化限流器
+
+        Args:
+            rpm: 每分钟请求数上限，0表示不限制
+            tpm: 每分钟token数上限，0表示不限制
+        """
+        self._requests = _Bucket(rpm) if rpm > 0 else None
+        self._tokens = _Bucket(tpm) if tpm > 0 else None
+        self._lock = threading.Lock()
+        self.waited = 0.0  # 累计等待时间
+
+    @classmethod
+    def get_instance(cls, rpm: int, tpm: int) -> Optional['RateLimiter']:
+        """
+        获取进程内共享的限流器，均不限制时返回None
+
+        Args:
+            rpm: 每分钟请求数上限
+            tpm: 每分钟token数上限
+
+        Returns:
+            限流器实例
+        """
+        if rpm <= 0 and tpm <= 0:
+            return None
+        with cls._instances_lock:
+            if (rpm, tpm) not in cls._instances:
+                cls._instances[(rpm, tpm)] = cls(rpm, tpm)
+                logger.info(f'[RateLimiter] limit {rpm} requests/min, {tpm} tokens/min')
+            return cls._instances[(rpm, tpm)]
+
+    def _try_acquire(self, tokens: int) -> float:
+        """
+        尝试同时取出1个请求额度和tokens个token额度
+
+        Args:
+            tokens: 估计的token数
+
+        Returns:
+            需要等待的秒数，0表示已取出
+        """
+        with self._lock:
+            now = time.monotonic()
+            wait = 0
+            for bucket, n in ((self._requests, 1), (self._tokens, tokens)):
+                if bucket is not None:
+                    bucket.refill(now)
+                    wait = max(wait, bucket.wait_time(n))
+            if wait > 0:
+                return wait
+            if self._requests is not None:
+                self._requests.level -= 1
+            if self._tokens is not None:
+                self._tokens.level -= tokens
+            return 0
+
+    def acquire(self, tokens: int):
+        """
+        阻塞直到额度足够，然后扣减额度
+
+        Args:
+            tokens: 估计的token数
+        """
+        while (wait := self._try_acquire(tokens)) > 0:
+            self.waited += wait
+            time.sleep(wait)
+
+    async def aacquire(self, tokens: int):
+        """
+        acquire的异步版本，等待时不阻塞事件循环
+
+        Args:
+            tokens: 估计的token数
+        """
+        while (wait := self._try_acquire(tokens)) > 0:
+            self.waited += wait
+            await asyncio.sleep(wait)
+
+    def settle(self, estimated: int, actual: int):
+        """
+        根据响应返回的实际用量修正token额度
+
+        Args:
+            estimated: 请求前估计并已扣减的token数
+            actual: 实际消耗的token数（提示与回复之和）
+        """
+        if self._tokens is None:
+            return
+        with self._lock:
+            self._tokens.level = min(self._tokens.capacity, self._tokens.level + estimated - actual)
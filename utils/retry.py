@@ -0,0 +1,219 @@
+import asyncio  # 导入asyncio模块，用于异步等待
+import random  # 导入random模块，用于退避抖动
+import threading  # 导入threading模块，用于保护重试计数
+import time  # 导入time模块，用于同步等待
+from collections import defaultdict  # 导入默认字典，用于按阶段计数
+from contextlib import contextmanager  # 导入上下文管理器工具
+from contextvars import ContextVar  # 导入上下文变量，用于记录当前阶段
+from typing import Awaitable, Callable, Dict, Optional, Tuple, Type, TypeVar  # 导入类型提示工具
+
+import httpx  # 导入httpx，用于识别网络异常
+from loguru import logger  # 导入日志记录器
+from openai import APIConnectionError, APITimeoutError, InternalServerError, RateLimitError  # 导入OpenAI的可重试异常
+
+from .settings import ChatCompletionSettings  # 导入聊天完成设置
+
+T = TypeVar('T')
+
+
+class TruncatedStreamError(Exception):
+    """
+    流式响应在结束标记（finish_reason或usage）之前中断
+    """
+    pass
+
+
+# 可重试的异常：超时、连接错误、429、5xx与中断的流式响应
+RETRYABLE_ERRORS: Tuple[Type[BaseException], ...] = (
+    httpx.TransportError, APITimeoutError, APIConnectionError, RateLimitError, InternalServerError,
+    TruncatedStreamError
+)
+
+# 当前的LLM调用阶段，用于按阶段统计重试次数，任务分发器会将其传递到工作线程
+_stage: ContextVar[str] = ContextVar('llm_stage', default='default')
+
+
+@contextmanager
+def llm_stage(name: str):
+    """
+    在上下文内将LLM调用归入指定阶段
+
+    Args:
+        name: 阶段名称，如FunctionMetric
+    """
+    token = _stage.set(name)
+    try:
+        yield
+    finally:
+        _stage.reset(token)
+
+
+def current_stage() -> str:
+    """
+    当前的LLM调用阶段
+
+    Returns:
+        阶段名称，未指定时为default
+    """
+    return _stage.get()
+
+
+# 有界的指数退避重试策略
+class RetryPolicy:
+    """
+    LLM请求的重试策略
+
+    对可重试的异常按指数退避加随机抖动等待后重试，最多尝试max_attempts次，
+    服务端返回Retry-After时至少等待该时长，重试次数按当前阶段累计
+    """
+    _retries: Dict[str, int] = defaultdict(int)  # 各阶段的重试次数
+    _retries_lock = threading.Lock()
+
+    def __init__(self, max_attempts: int = 5, base_delay: float = 1, max_delay: float = 30, jitter: float = 0.5,
+                 retryable: Tuple[Type[BaseException], ...] = RETRYABLE_ERRORS):
+        """
+        初始化重试策略
+
+        Args:
+            max_attempts: 最大尝试次数（含首次）
+            base_delay: 首次重试前的等待时间（秒）
+            max_delay: 单次等待时间的上限（秒）
+            jitter: 抖动比例，等待时间在[1-jitter, 1+jitter]倍之间随机
+            retryable: 可重试的异常类型
+        """
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.retryable = retryable
+
+    @classmethod
+    def from_settings(cls, setting: ChatCompletionSettings) -> 'RetryPolicy':
+        """
+        按聊天完成设置创建重试策略
+
+        Args:
+            setting: 聊天完成设置对象
+
+        Returns:
+            重试策略
+        """
+        return cls(setting.retry_max_attempts, setting.retry_base_delay, setting.retry_max_delay, setting.retry_jitter)
+
+    def backoff(self, attempt: int, e: BaseException) -> float:
+        """
+        第attempt次尝试失败后的等待时间
+
+        Args:
+            attempt: 已尝试的次数，从1开始
+            e: 失败的异常
+
+        Returns:
+            等待秒数
+        """
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        delay *= random.uniform(1 - self.jitter, 1 + self.jitter)
+        retry_after = _retry_after(e)
+        return max(delay, retry_after) if retry_after is not None else delay
+
+    def _on_retry(self, attempt: int, e: BaseException) -> Optional[float]:
+        """
+        判断是否重试，需要重试时记录次数并返回等待时间
+
+        Args:
+            attempt: 已尝试的次数
+            e: 失败的异常
+
+        Returns:
+            等待秒数，不重试时返回None
+        """
+        if not isinstance(e, self.retryable) or attempt >= self.max_attempts:
+            return None
+        stage = current_stage()
+        with self._retries_lock:
+            self._retries[stage] += 1
+        delay = self.backoff(attempt, e)
+        logger.warning(f'[RetryPolicy] {stage} attempt {attempt}/{self.max_attempts} failed: '
+                       f'{type(e).__name__}, retry in {delay:.1f}s')
+        return delay
+
+    def call(self, f: Callable[[], T]) -> T:
+        """
+        按重试策略调用函数
+
+        Args:
+            f: 无参函数，每次尝试调用一次
+
+        Returns:
+            函数的返回值
+        """
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                return f()
+            except Exception as e:
+                delay = self._on_retry(attempt, e)
+                if delay is None:
+                    raise
+            time.sleep(delay)
+
+    async def acall(self, f: Callable[[], Awaitable[T]]) -> T:
+        """
+        call的异步版本
+
+        Args:
+            f: 无参协程函数，每次尝试调用一次
+
+        Returns:
+            协程的返回值
+        """
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                return await f()
+            except Exception as e:
+                delay = self._on_retry(attempt, e)
+                if delay is None:
+                    raise
+            await asyncio.sleep(delay)
+
+    @classmethod
+    def retries(cls) -> Dict[str, int]:
+        """
+        各阶段的重试次数
+
+        Returns:
+            阶段名称到重试次数的映射
+        """
+        with cls._retries_lock:
+            return dict(cls._retries)
+
+    @classmethod
+    def report(cls):
+        """
+        输出各阶段重试次数的日志
+        """
+        retries = cls.retries()
+        if retries:
+            logger.info(f'[RetryPolicy] retries by stage: {retries}')
+
+
+def _retry_after(e: BaseException) -> Optional[float]:
+    """
+    读取异常对应响应中的Retry-After（秒）
+
+    Args:
+        e: 异常
+
+    Returns:
+        等待秒数，没有时返回None
+    """
+    response = getattr(e, 'response', None)
+    if response is None:
+        return None
+    try:
+        return float(response.headers.get('retry-after'))
+    except (TypeError, ValueError):
+        return None
@@ -1,7 +1,8 @@
+import json  # 导入json模块，用于解析多端点配置
 from concurrent.futures.thread import ThreadPoolExecutor  # 导入线程池执行器
 from dataclasses import field, dataclass  # 导入数据类相关工具
 from enum import StrEnum  # 导入字符串枚举类型
-from typing import Any  # 导入Any类型
+from typing import Any, Dict, List  # 导入类型提示工具
 
 from decouple import config  # 导入配置工具，用于从环境变量或.env文件加载配置
 from loguru import logger  # 导入日志记录器
@@ -30,6 +31,41 @@ class ProjectSettings:
     """
     # 从环境变量或.env文件加载日志级别，默认为INFO
     log_level: LogLevel = field(default_factory=lambda: config('LOG_LEVEL', cast=LogLevel, default=LogLevel.INFO))
+    # 文档存储后端，markdown为直接读写markdown文件，sqlite为写入SQLite数据库并在结束时导出markdown，默认为markdown
+    doc_store: str = field(default_factory=lambda: config('DOC_STORE', default='markdown'))
+    # 是否记录文档运行清单，开启后代码、提示模板、模型或嵌入的相邻文档变化的文档在重新运行时会重新生成，默认开启
+    doc_manifest: bool = field(default_factory=lambda: config('DOC_MANIFEST', cast=bool, default=True))
+    # 是否以协程方式调用LLM，开启后函数、类文档在单个事件循环中并发生成，不再占用llm_thread_pool的线程
+    llm_async: bool = field(default_factory=lambda: config('LLM_ASYNC', cast=bool, default=False))
+    # 同时进行的LLM请求数上限，默认为128，开启自适应并发时为并发上限可增长到的最大值
+    llm_concurrency: int = field(default_factory=lambda: config('LLM_CONCURRENCY', cast=int, default=128))
+    # 是否自适应调整LLM请求的并发数，请求健康时逐步增加，遇到429/5xx/超时时减半，默认关闭
+    llm_adaptive: bool = field(default_factory=lambda: config('LLM_ADAPTIVE', cast=bool, default=False))
+    # 自适应并发的初始值，默认为16
+    llm_concurrency_init: int = field(default_factory=lambda: config('LLM_CONCURRENCY_INIT', cast=int, default=16))
+    # 自适应并发的最小值，默认为1
+    llm_concurrency_min: int = field(default_factory=lambda: config('LLM_CONCURRENCY_MIN', cast=int, default=1))
+    # 单个请求耗时超过该值（秒）时视为端点过载，默认0表示只按错误判断
+    llm_slow_latency: float = field(default_factory=lambda: config('LLM_SLOW_LATENCY', cast=float, default=0))
+    # 是否跨阶段流水执行，开启后类文档在其成员函数的文档生成后即开始，模块与仓库文档在全部函数文档生成后即开始，默认开启
+    stage_pipeline: bool = field(default_factory=lambda: config('STAGE_PIPELINE', cast=bool, default=True))
+    # 是否为空实现、getter、setter、转发调用等平凡函数按模板生成文档，不调用LLM，默认关闭
+    function_template: bool = field(default_factory=lambda: config('FUNCTION_TEMPLATE', cast=bool, default=False))
+    # 是否对代码相同（忽略注释、空白与函数名）的函数只生成一次文档，其他函数复制该文档并替换函数名，默认关闭
+    function_dedup: bool = field(default_factory=lambda: config('FUNCTION_DEDUP', cast=bool, default=False))
+    # 一次LLM请求最多为几个小型叶子函数生成文档，默认为1即不合并
+    function_batch_size: int = field(default_factory=lambda: config('FUNCTION_BATCH_SIZE', cast=int, default=1))
+    # 合并生成时一次请求中函数代码的token数上限，默认为2048
+    function_batch_tokens: int = field(default_factory=lambda: config('FUNCTION_BATCH_TOKENS', cast=int, default=2048))
+    # 代码token数不超过该值的叶子函数才会合并生成，默认为256
+    function_batch_small: int = field(default_factory=lambda: config('FUNCTION_BATCH_SMALL', cast=int, default=256))
+    # 模块总结各层一次提示中上下文的token预算，逗号分隔，第0层为函数描述，之后为逐层合并的模块文档，层数多于预算个数时沿用最后一个，0表示不分层，默认16384
+    module_level_tokens: List[int] = field(default_factory=lambda: config(
+        'MODULE_LEVEL_TOKENS', cast=lambda x: [int(t) for t in x.split(',') if t.strip()], default='16384'))
+    # 分层合并模块时一次合并的模块数上限，默认为8
+    module_reduce_fanin: int = field(default_factory=lambda: config('MODULE_REDUCE_FANIN', cast=int, default=8))
+    # 增量更新时沿调用图向调用者、被调用者传播失效的层数，默认为1即只使失效函数的直接调用者与被调用者重新生成
+    incremental_depth: int = field(default_factory=lambda: config('INCREMENTAL_DEPTH', cast=int, default=1))
 
     def is_debug(self):
         """检查是否为调试模式
@@ -40,9 +76,12 @@ class ProjectSettings:
         return self.log_level == LogLevel.DEBUG
 
 
-# 创建线程池：调试模式下使用1个线程，否则使用16个线程
+# 线程池的线程数：调试模式下使用1个线程，否则使用16个线程；开启自适应并发时为并发上限的最大值，
+# 线程按需创建，TaskDispatcher提交中的任务数不超过AdaptiveLimiter的当前上限，因此实际线程数随当前上限增长
 # 调试模式下单线程便于追踪问题，生产环境多线程提高性能
-llm_thread_pool = ThreadPoolExecutor(1) if ProjectSettings().is_debug() else ThreadPoolExecutor(16)
+llm_pool_size = 1 if ProjectSettings().is_debug() else \
+    ProjectSettings().llm_concurrency if ProjectSettings().llm_adaptive else 16
+llm_thread_pool = ThreadPoolExecutor(llm_pool_size)  # 创建线程池
 
 
 @dataclass
@@ -64,8 +103,52 @@ class ChatCompletionSettings:
     temperature: float = field(default_factory=lambda: config('MODEL_TEMPERATURE', cast=float, default=0))
     # 模型输出的语言，默认为中文
     language: str = field(default_factory=lambda: config('MODEL_LANGUAGE', default='Chinese'))
+    # 多个OpenAI兼容的服务端点，JSON数组，元素包含base_url、api_key、model、weight、name，未指定的api_key与model沿用上面的设置，默认为空即只使用OPENAI_BASE_URL
+    endpoints: List[Dict[str, Any]] = field(default_factory=lambda: config('OPENAI_ENDPOINTS', cast=json.loads, default='[]'))
+    # 多端点的路由策略，least_outstanding为最少未完成请求，weighted_round_robin为加权轮询，默认least_outstanding
+    routing: str = field(default_factory=lambda: config('MODEL_ROUTING', default='least_outstanding'))
+    # 端点连续失败多少次后被摘除，默认3次
+    eject_failures: int = field(default_factory=lambda: config('MODEL_EJECT_FAILURES', cast=int, default=3))
+    # 端点被摘除的时长（秒），期满后的第一次请求即为健康检查，默认30秒
+    eject_seconds: float = field(default_factory=lambda: config('MODEL_EJECT_SECONDS', cast=float, default=30))
     # 历史记录最大长度，默认为-1（无限制）
     history_max: int = field(default_factory=lambda: config('HISTORY_MAX', cast=int, default=-1))
+    # 共享连接池的最大连接数，默认为256
+    pool_max_connections: int = field(default_factory=lambda: config('MODEL_POOL_MAX_CONNECTIONS', cast=int, default=256))
+    # 共享连接池中保持的空闲长连接数，默认为128
+    pool_max_keepalive: int = field(default_factory=lambda: config('MODEL_POOL_MAX_KEEPALIVE', cast=int, default=128))
+    # 空闲长连接的保持时间，默认60秒
+    pool_keepalive_expiry: float = field(default_factory=lambda: config('MODEL_POOL_KEEPALIVE_EXPIRY', cast=float, default=60))
+    # 每分钟请求数上限（RPM），进程内所有LLM调用共享，0表示不限制
+    rpm: int = field(default_factory=lambda: config('MODEL_RPM', cast=int, default=0))
+    # 每分钟token数上限（TPM），请求前按估计值扣减，响应后按实际用量修正，0表示不限制
+    tpm: int = field(default_factory=lambda: config('MODEL_TPM', cast=int, default=0))
+    # 请求的最大尝试次数（含首次），超时、429、5xx与中断的流式响应会重试，默认5次
+    retry_max_attempts: int = field(default_factory=lambda: config('MODEL_RETRY_MAX_ATTEMPTS', cast=int, default=5))
+    # 首次重试前的等待时间（秒），之后每次翻倍，默认1秒
+    retry_base_delay: float = field(default_factory=lambda: config('MODEL_RETRY_BASE_DELAY', cast=float, default=1))
+    # 单次重试等待时间的上限（秒），默认30秒
+    retry_max_delay: float = field(default_factory=lambda: config('MODEL_RETRY_MAX_DELAY', cast=float, default=30))
+    # 重试等待时间的随机抖动比例，默认0.5，即在0.5到1.5倍之间
+    retry_jitter: float = field(default_factory=lambda: config('MODEL_RETRY_JITTER', cast=float, default=0.5))
+    # 是否启用对冲请求，请求超过首token耗时的分位数仍无响应时发起相同的请求，采用先完成的结果，默认关闭
+    hedge: bool = field(default_factory=lambda: config('MODEL_HEDGE', cast=bool, default=False))
+    # 触发对冲请求的首token耗时分位数，默认95
+    hedge_percentile: float = field(default_factory=lambda: config('MODEL_HEDGE_PERCENTILE', cast=float, default=95))
+    # 对冲请求数占总请求数的比例上限，默认0.05
+    hedge_max_ratio: float = field(default_factory=lambda: config('MODEL_HEDGE_MAX_RATIO', cast=float, default=0.05))
+    # 是否按前缀缓存友好的方式组织提示：语言指令、模板与文档指导等静态内容在前，代码等可变内容在后，便于服务端复用提示缓存，默认关闭
+    prefix_cache: bool = field(default_factory=lambda: config('MODEL_PREFIX_CACHE', cast=bool, default=False))
+    # 提示中调用者、被调用者文档的token预算，超出时按相关度将文档降级为只保留描述或丢弃，0表示不限制，默认0
+    context_budget: int = field(default_factory=lambda: config('MODEL_CONTEXT_BUDGET', cast=int, default=0))
+    # 计算上下文token数的Hugging Face分词器，建议与模型一致，默认为空即按每3个字符1个token估计
+    tokenizer: str = field(default_factory=lambda: config('MODEL_TOKENIZER', default=''))
+    # 是否启用LLM响应的磁盘缓存，相同的请求直接返回缓存的响应，默认关闭
+    cache: bool = field(default_factory=lambda: config('LLM_CACHE', cast=bool, default=False))
+    # LLM响应缓存的数据库路径，多个进程可共享同一个缓存
+    cache_path: str = field(default_factory=lambda: config('LLM_CACHE_PATH', default='.cache/llm_response.db'))
+    # LLM响应缓存的大小上限（MB），超过后按最近访问时间淘汰，默认512MB
+    cache_size: int = field(default_factory=lambda: config('LLM_CACHE_SIZE', cast=int, default=512))
 
 
 @dataclass